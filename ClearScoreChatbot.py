@@ -1,15 +1,117 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import dash
-from dash import html, Input, Output, State, dcc
+from dash import html, Input, Output, State, dcc, Patch
 import dash_bootstrap_components as dbc
-from model_serving_utils import query_endpoint
+import metrics
+from admission_control import (AdmissionController, AdmissionRejected,
+                               PRIORITY_FIRST_MESSAGE, PRIORITY_FOLLOW_UP)
+from chat_message import ChatMessage, clear_intern_table, intern_table_size
+from context_window import ContextWindow
+from degraded_mode import DegradedMode
+from memory_budget import TIER_COLD_CACHE, TIER_IDLE_SESSIONS, evictable_lru_cache, governor
+from model_serving_utils import EndpointRouter
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+from speculative import SpeculativeExecutor
+from static_assets import StaticAssets
+from token_policy import TokenDecision, TokenPolicy
+from usage_accounting import BUDGET_HARD, BUDGET_OK, BUDGET_SOFT, UsageTracker
+
+# Suggested prompts shown above the chat, in button order (prompt-1 ... prompt-N)
+SUGGESTED_PROMPTS = [
+    'How do I check my credit score?',
+    'How can I improve my credit score?',
+    'Why has my score changed?',
+    'How do I update my personal details?',
+    'What credit products are available?',
+    'How do I close my account?',
+]
+
+# Messages kept mounted in the chat view; older turns are loaded a page at a time
+CHAT_WINDOW_SIZE = int(os.getenv('CHAT_WINDOW_SIZE', '40'))
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '20'))
+
+# Rough size of one rendered message (its Dash component tree), for memory accounting
+RENDERED_MESSAGE_BYTES = 8192
+
+
+@evictable_lru_cache(maxsize=4096)
+def _message_fragment(message):
+    """Render one ChatMessage; cached so each message is only built once per worker"""
+    # Paragraphs are split on blank lines, with line breaks between the lines of each
+    content_elements = []
+    for lines in message.paragraphs:
+        para_content = [lines[0]]
+        for line in lines[1:]:
+            para_content += [html.Br(), line]
+        content_elements.append(html.P(para_content, style={'margin-bottom': '10px'}))
+    
+    role = message.role
+    return html.Div([
+        html.Div([
+            html.Div('👤' if role == 'user' else '🤖', 
+                    className='message-icon'),
+            html.Div(content_elements, className='message-text')
+        ], className=f"chat-message {role}-message")
+    ], className=f"message-container {role}-container")
+
+def _rendered_messages_size() -> int:
+    return len(_message_fragment) * RENDERED_MESSAGE_BYTES
+
+
+def _evict_rendered_messages(target_bytes: int = 0, idle_seconds: float = 0) -> int:
+    """Drop the least recently rendered messages until about target_bytes are freed."""
+    return _message_fragment.evict_bytes(target_bytes, _rendered_messages_size)
+
 
 class ClearScoreChatbot:
     """ClearScore Customer Service AI Agent Chatbot Component"""
     
-    def __init__(self, app, endpoint_name, height='700px'):
+    def __init__(self, app, endpoint_name, height='700px', static_assets=None):
         self.app = app
         self.endpoint_name = endpoint_name
         self.height = height
+        if static_assets is None:
+            static_assets = StaticAssets()
+            static_assets.register(app)
+        self.static_assets = static_assets
+        # endpoint_name may be a weighted list, e.g. "ka-primary:3,ka-secondary:1"
+        self.router = EndpointRouter.from_spec(endpoint_name)
+        # Answers are shared with the other workers on this host when SHARED_CACHE_PATH is set
+        self.response_cache = ResponseCache(shared=SharedCache.from_env())
+        self.admission = AdmissionController()
+        self.token_policy = TokenPolicy()
+        self.usage = UsageTracker()
+        self.context_window = ContextWindow()
+        self.degraded = DegradedMode()
+        self._slo_executor = ThreadPoolExecutor(max_workers=self.degraded.max_background,
+                                                thread_name_prefix='slo-bound')
+        self.speculation_enabled = os.getenv('SPECULATIVE_PREFETCH', 'true').lower() in ('1', 'true', 'yes')
+        self.speculator = SpeculativeExecutor(self._call_model_endpoint) if self.speculation_enabled else None
+        metrics.register_source('router', self.router.metrics)
+        metrics.register_source('response_cache', self.response_cache.stats)
+        metrics.register_source('admission', self.admission.metrics)
+        metrics.register_source('token_policy', self.token_policy.metrics)
+        metrics.register_source('usage', self.usage.metrics)
+        metrics.register_source('degraded_mode', self.degraded.metrics)
+        if self.speculator is not None:
+            metrics.register_source('speculation', self.speculator.metrics)
+        # Long-lived per-worker state is accounted against MEMORY_BUDGET_MB (see memory_budget.py)
+        governor.register('usage_sessions', self.usage.memory_size, self.usage.evict_idle, TIER_IDLE_SESSIONS)
+        governor.register('admission_sessions', self.admission.memory_size, self.admission.evict_idle,
+                          TIER_IDLE_SESSIONS)
+        governor.register('response_cache', self.response_cache.memory_size, self.response_cache.evict,
+                          TIER_COLD_CACHE)
+        governor.register('chat_messages', intern_table_size, clear_intern_table, TIER_COLD_CACHE)
+        governor.register('rendered_messages', _rendered_messages_size, _evict_rendered_messages,
+                          TIER_COLD_CACHE)
+        governor.register('degraded_answers', self.degraded.answers.memory_size)
+        if self.speculator is not None:
+            governor.register('speculations', self.speculator.memory_size, self.speculator.evict_idle,
+                              TIER_IDLE_SESSIONS)
         self.layout = self._create_layout()
         self._create_callbacks()
         self._add_custom_css()
@@ -21,27 +123,23 @@ class ClearScoreChatbot:
             html.Div([
                 html.H6('💡 Common Customer Questions:', className='mb-2'),
                 html.Div([
-                    dbc.Button('How do I check my credit score?', 
-                              id='prompt-1', size='sm', color='light', className='me-2 mb-2'),
-                    dbc.Button('How can I improve my credit score?', 
-                              id='prompt-2', size='sm', color='light', className='me-2 mb-2'),
-                    dbc.Button('Why has my score changed?', 
-                              id='prompt-3', size='sm', color='light', className='me-2 mb-2'),
-                    dbc.Button('How do I update my personal details?', 
-                              id='prompt-4', size='sm', color='light', className='me-2 mb-2'),
-                    dbc.Button('What credit products are available?', 
-                              id='prompt-5', size='sm', color='light', className='me-2 mb-2'),
-                    dbc.Button('How do I close my account?', 
-                              id='prompt-6', size='sm', color='light', className='mb-2'),
+                    dbc.Button(prompt, id=f'prompt-{i}', size='sm', color='light',
+                              className='me-2 mb-2' if i < len(SUGGESTED_PROMPTS) else 'mb-2')
+                    for i, prompt in enumerate(SUGGESTED_PROMPTS, start=1)
                 ], className='d-flex flex-wrap')
             ], className='mb-3', id='suggested-prompts'),
             
             # Chat card
             dbc.Card([
                 dbc.CardBody([
+                    html.Div([
+                        dbc.Button('Load earlier messages', id='load-earlier-button',
+                                   size='sm', color='link', n_clicks=0),
+                    ], id='load-earlier-container', className='load-earlier', style={'display': 'none'}),
                     html.Div([], id='chat-history', className='chat-history', style={'height': self.height}),
                 ], className='chat-body p-0')
             ], className='chat-card mb-3'),
+            html.Div(id='chat-notice'),
             
             # Input section
             dbc.InputGroup([
@@ -66,47 +164,154 @@ class ClearScoreChatbot:
             # Hidden stores for state management
             dcc.Store(id='assistant-trigger', data=None),
             dcc.Store(id='chat-history-store', data=[]),
+            # Index in chat-history-store of the first message mounted in chat-history
+            dcc.Store(id='chat-window', data={'start': 0}),
+            dcc.Store(id='session-id', storage_type='session'),
+            dcc.Store(id='speculation-status', data=None),
             html.Div(id='dummy-output', style={'display': 'none'}),
         ], className='chat-container')
 
     def _create_callbacks(self):
         """Create Dash callbacks for interactivity"""
         
-        # Handle suggested prompt clicks
-        @self.app.callback(
+        # Assign each browser tab a session id (kept across reloads of the tab)
+        self.app.clientside_callback(
+            """
+            function(modified, sessionId) {
+                if (sessionId) {
+                    return window.dash_clientside.no_update;
+                }
+                if (window.crypto && window.crypto.randomUUID) {
+                    return window.crypto.randomUUID();
+                }
+                return Date.now().toString(36) + Math.random().toString(36).slice(2);
+            }
+            """,
+            Output('session-id', 'data'),
+            Input('session-id', 'modified_timestamp'),
+            State('session-id', 'data'),
+        )
+        
+        # Handle suggested prompt clicks (clientside - no server round-trip)
+        self.app.clientside_callback(
+            """
+            function() {
+                var prompts = %s;
+                var triggered = window.dash_clientside.callback_context.triggered;
+                if (!triggered || !triggered.length) {
+                    return window.dash_clientside.no_update;
+                }
+                var buttonId = triggered[0].prop_id.split('.')[0];
+                return prompts[buttonId] || '';
+            }
+            """ % json.dumps({f'prompt-{i}': prompt for i, prompt in enumerate(SUGGESTED_PROMPTS, start=1)}),
             Output('user-input', 'value', allow_duplicate=True),
-            [
-                Input('prompt-1', 'n_clicks'),
-                Input('prompt-2', 'n_clicks'),
-                Input('prompt-3', 'n_clicks'),
-                Input('prompt-4', 'n_clicks'),
-                Input('prompt-5', 'n_clicks'),
-                Input('prompt-6', 'n_clicks'),
-            ],
+            [Input(f'prompt-{i}', 'n_clicks') for i in range(1, len(SUGGESTED_PROMPTS) + 1)],
             prevent_initial_call=True
         )
-        def set_prompt(p1, p2, p3, p4, p5, p6):
-            ctx = dash.callback_context
-            if not ctx.triggered:
-                return dash.no_update
-            
-            button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-            prompts = {
-                'prompt-1': 'How do I check my credit score?',
-                'prompt-2': 'How can I improve my credit score?',
-                'prompt-3': 'Why has my score changed?',
-                'prompt-4': 'How do I update my personal details?',
-                'prompt-5': 'What credit products are available?',
-                'prompt-6': 'How do I close my account?',
-            }
-            return prompts.get(button_id, '')
         
-        # Handle user message submission
-        @self.app.callback(
+        # Start answering a suggested prompt speculatively, in parallel with the
+        # clientside copy into the input box, so the answer is ready on Send
+        if self.speculation_enabled:
+            @self.app.callback(
+                Output('speculation-status', 'data'),
+                [Input(f'prompt-{i}', 'n_clicks') for i in range(1, len(SUGGESTED_PROMPTS) + 1)],
+                [
+                    State('chat-history-store', 'data'),
+                    State('session-id', 'data'),
+                ],
+                prevent_initial_call=True
+            )
+            def speculate_prompt(*args):
+                chat_history, session_id = args[-2], args[-1]
+                ctx = dash.callback_context
+                if not ctx.triggered or not session_id:
+                    return dash.no_update
+                
+                button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+                prompt = SUGGESTED_PROMPTS[int(button_id.split('-')[1]) - 1]
+                if self.usage.budget_state(session_id) != BUDGET_OK:
+                    # Near or over budget: only spend tokens on messages the user actually sends
+                    return {'prompt': prompt, 'started': False}
+                messages = (chat_history or []) + [{'role': 'user', 'content': prompt}]
+                started = self.speculator.start(session_id, messages)
+                return {'prompt': prompt, 'started': started}
+        
+        # Handle user message submission (clientside - echoes the user's message
+        # and typing indicator instantly, then triggers the agent call)
+        # Mirrors _message_fragment and _create_typing_indicator
+        self.app.clientside_callback(
+            """
+            function(sendClicks, userSubmit, userInput, chatHistory, chatDisplay) {
+                var noUpdate = window.dash_clientside.no_update;
+                if (!userInput || !userInput.trim()) {
+                    return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate];
+                }
+
+                function el(type, props) {
+                    return {type: type, namespace: 'dash_html_components', props: props || {}};
+                }
+
+                function formatMessage(role, content) {
+                    var paragraphs = content.split('\\n\\n').filter(function(para) {
+                        return para.trim();
+                    }).map(function(para) {
+                        var lines = para.split('\\n');
+                        var paraContent = [];
+                        lines.forEach(function(line, i) {
+                            if (line.trim()) {
+                                paraContent.push(line);
+                                if (i < lines.length - 1) {
+                                    paraContent.push(el('Br'));
+                                }
+                            }
+                        });
+                        return el('P', {children: paraContent, style: {'margin-bottom': '10px'}});
+                    });
+                    return el('Div', {
+                        className: 'message-container ' + role + '-container',
+                        children: [el('Div', {
+                            className: 'chat-message ' + role + '-message',
+                            children: [
+                                el('Div', {className: 'message-icon', children: role === 'user' ? '👤' : '🤖'}),
+                                el('Div', {className: 'message-text', children: paragraphs})
+                            ]
+                        })]
+                    });
+                }
+
+                var typingIndicator = el('Div', {
+                    className: 'message-container assistant-container',
+                    children: [el('Div', {
+                        className: 'chat-message assistant-message typing-message',
+                        children: [
+                            el('Div', {className: 'message-icon', children: '🤖'}),
+                            el('Div', {
+                                className: 'typing-indicator',
+                                children: [
+                                    el('Div', {className: 'typing-dot'}),
+                                    el('Div', {className: 'typing-dot'}),
+                                    el('Div', {className: 'typing-dot'})
+                                ]
+                            })
+                        ]
+                    })]
+                });
+
+                var content = userInput.trim();
+                var history = (chatHistory || []).concat([{role: 'user', content: content}]);
+                var display = (chatDisplay || []).concat([formatMessage('user', content), typingIndicator]);
+                // turn and slot let the server check the view is the one it is patching
+                return [history, display, '', {
+                    trigger: true, sent_at: Date.now(), turn: history.length, slot: display.length - 1
+                }, null];
+            }
+            """,
             Output('chat-history-store', 'data', allow_duplicate=True),
             Output('chat-history', 'children', allow_duplicate=True),
             Output('user-input', 'value', allow_duplicate=True),
             Output('assistant-trigger', 'data'),
+            Output('chat-notice', 'children', allow_duplicate=True),
             [
                 Input('send-button', 'n_clicks'),
                 Input('user-input', 'n_submit'),
@@ -114,130 +319,303 @@ class ClearScoreChatbot:
             [
                 State('user-input', 'value'),
                 State('chat-history-store', 'data'),
+                State('chat-history', 'children'),
             ],
             prevent_initial_call=True
         )
-        def update_chat(send_clicks, user_submit, user_input, chat_history):
-            if not user_input or not user_input.strip():
-                return dash.no_update, dash.no_update, dash.no_update, dash.no_update
-
-            # Initialize chat_history as empty list if None
-            if chat_history is None:
-                chat_history = []
-            
-            chat_history.append({'role': 'user', 'content': user_input.strip()})
-            
-            # Display messages including typing indicator
-            chat_display = self._format_chat_display(chat_history)
-            chat_display.append(self._create_typing_indicator())
-
-            return chat_history, chat_display, '', {'trigger': True}
 
         # Process assistant response
         @self.app.callback(
             Output('chat-history-store', 'data', allow_duplicate=True),
             Output('chat-history', 'children', allow_duplicate=True),
+            Output('user-input', 'value', allow_duplicate=True),
+            Output('chat-window', 'data', allow_duplicate=True),
+            Output('load-earlier-container', 'style', allow_duplicate=True),
+            Output('chat-notice', 'children', allow_duplicate=True),
             Input('assistant-trigger', 'data'),
             State('chat-history-store', 'data'),
+            State('session-id', 'data'),
+            State('chat-window', 'data'),
             prevent_initial_call=True
         )
-        def process_assistant_response(trigger, chat_history):
+        def process_assistant_response(trigger, chat_history, session_id, chat_window):
+            no_change = (dash.no_update,) * 6
             if not trigger or not trigger.get('trigger'):
-                return dash.no_update, dash.no_update
+                return no_change
 
-            # Initialize chat_history as empty list if None
-            if chat_history is None:
-                chat_history = []
-                
-            if (not chat_history or not isinstance(chat_history[-1], dict)
-                    or 'role' not in chat_history[-1]
-                    or chat_history[-1]['role'] != 'user'):
-                return dash.no_update, dash.no_update
+            # Work on interned ChatMessages so derived fields are reused between turns
+            chat_history = ChatMessage.from_store(chat_history)
+            if not chat_history or chat_history[-1].role != 'user':
+                return no_change
+
+            budget = self.usage.budget_state(session_id)
+            if budget == BUDGET_HARD:
+                print(f"🛑 Session {str(session_id)[:8]} is over its usage budget")
+                self.usage.note_declined()
+                pending_message = chat_history.pop()
+                chat_display, chat_window, load_earlier_style = self._render_window(chat_history)
+                return (ChatMessage.to_store(chat_history), chat_display, pending_message.content,
+                        chat_window, load_earlier_style, self._create_budget_notice())
+
+            # Follow-ups in an active conversation are served before first messages
+            priority = PRIORITY_FOLLOW_UP if len(chat_history) > 1 else PRIORITY_FIRST_MESSAGE
+            # Keyed on the message itself: the input box is cleared on send, so a
+            # duplicate is the same question sent again while the first is in flight
+            dedup_key = (session_id, chat_history[-1].digest)
+            try:
+                ticket = self.admission.acquire(session_id, priority, dedup_key)
+            except AdmissionRejected as e:
+                if e.reason == 'duplicate':
+                    # Drop the repeat; the original's typing indicator stays in place
+                    print(f"🔁 Ignoring duplicate submission for session {str(session_id)[:8]}")
+                    chat_history.pop()
+                    chat_display, chat_window, load_earlier_style = self._render_window(chat_history)
+                    chat_display.append(self._create_typing_indicator())
+                    return (ChatMessage.to_store(chat_history), chat_display, dash.no_update,
+                            chat_window, load_earlier_style, dash.no_update)
+                # Hand the message back to the user so they can retry
+                print(f"🚦 Request rejected: {e}")
+                pending_message = chat_history.pop()
+                chat_display, chat_window, load_earlier_style = self._render_window(chat_history)
+                return (ChatMessage.to_store(chat_history), chat_display, pending_message.content,
+                        chat_window, load_earlier_style, self._create_busy_notice(e))
 
             try:
-                print(f"🤖 Calling ClearScore customer service agent: {self.endpoint_name}")
-                assistant_response = self._call_model_endpoint(chat_history)
+                assistant_response = None
+                if self.speculator is not None and session_id:
+                    # Discards the speculation if the user edited the prompt
+                    assistant_response = self._take_speculation(session_id, chat_history)
+                if assistant_response is None:
+                    # Sessions near their budget send a tighter context
+                    request_messages = self.context_window.fit(chat_history, compact=budget == BUDGET_SOFT)
+                    if request_messages is not chat_history:
+                        self.usage.note_compacted()
+                    print(f"🤖 Calling ClearScore customer service agent: {self.endpoint_name}")
+                    assistant_response = self._answer_within_slo(request_messages, session_id, chat_history)
                 
                 # Ensure we got a valid response
                 if not assistant_response:
                     assistant_response = "I apologize, but I received an empty response. Please try again."
                     
-                chat_history.append({
-                    'role': 'assistant',
-                    'content': str(assistant_response)
-                })
+                chat_history.append(ChatMessage.intern('assistant', assistant_response))
                 print(f"✅ Agent response received")
             except Exception as e:
                 error_message = f'⚠️ Error: Unable to get response from agent. {str(e)}'
                 print(f"❌ Error: {error_message}")
-                chat_history.append({
-                    'role': 'assistant',
-                    'content': error_message
-                })
+                chat_history.append(ChatMessage.intern('assistant', error_message))
+            finally:
+                self.admission.release(ticket)
+
+            start = (chat_window or {}).get('start', 0)
+            if (len(chat_history) - start > CHAT_WINDOW_SIZE + CHAT_PAGE_SIZE
+                    or not self._patchable_turn(trigger, chat_history, start)):
+                # Unmount older turns in one go, keeping the latest window; also
+                # re-render when overlapping sends left the view out of step
+                chat_display, chat_window, load_earlier_style = self._render_window(chat_history)
+                return (ChatMessage.to_store(chat_history), chat_display, dash.no_update,
+                        chat_window, load_earlier_style, dash.no_update)
 
-            chat_display = self._format_chat_display(chat_history)
-            return chat_history, chat_display
+            # Swap the typing indicator for the answer; the rest of the view is untouched
+            chat_display = Patch()
+            chat_display[len(chat_history) - 1 - start] = _message_fragment(chat_history[-1])
+            return (ChatMessage.to_store(chat_history), chat_display, dash.no_update,
+                    dash.no_update, dash.no_update, dash.no_update)
+
+        # Lazy-load a page of older messages (clicked by the scroll listener below)
+        @self.app.callback(
+            Output('chat-history', 'children', allow_duplicate=True),
+            Output('chat-window', 'data', allow_duplicate=True),
+            Output('load-earlier-container', 'style', allow_duplicate=True),
+            Input('load-earlier-button', 'n_clicks'),
+            State('chat-history-store', 'data'),
+            State('chat-window', 'data'),
+            prevent_initial_call=True
+        )
+        def load_earlier_messages(n_clicks, chat_history, chat_window):
+            start = (chat_window or {}).get('start', 0)
+            if not n_clicks or not chat_history or start <= 0:
+                return dash.no_update, dash.no_update, dash.no_update
+            
+            new_start = max(0, start - CHAT_PAGE_SIZE)
+            chat_display = Patch()
+            for msg in reversed(self._format_chat_display(chat_history[new_start:start])):
+                chat_display.prepend(msg)
+            return chat_display, {'start': new_start}, self._load_earlier_style(new_start)
 
         # Clear chat history
         @self.app.callback(
             Output('chat-history-store', 'data', allow_duplicate=True),
             Output('chat-history', 'children', allow_duplicate=True),
+            Output('chat-window', 'data', allow_duplicate=True),
+            Output('load-earlier-container', 'style', allow_duplicate=True),
+            Output('chat-notice', 'children', allow_duplicate=True),
             Input('clear-button', 'n_clicks'),
+            State('session-id', 'data'),
             prevent_initial_call=True
         )
-        def clear_chat(n_clicks):
+        def clear_chat(n_clicks, session_id):
             if n_clicks and n_clicks > 0:
                 print('🗑️ Clearing chat history')
-                return [], []
-            return dash.no_update, dash.no_update
+                if self.speculator is not None and session_id:
+                    self.speculator.discard(session_id)
+                return [], [], {'start': 0}, self._load_earlier_style(0), None
+            return (dash.no_update,) * 5
+
+    def _call_model_endpoint(self, messages, max_tokens=None, long_form=False, session_id=None,
+                             conversation=None):
+        """
+        Call the Databricks model serving endpoint, answering repeated conversations from the cache.
 
-    def _call_model_endpoint(self, messages, max_tokens=2048):
-        """Call the Databricks model serving endpoint"""
+        Without an explicit max_tokens the token policy picks the generation budget
+        (and optionally the endpoint) from the question class; answers that fill a
+        reduced budget are retried once with the full budget. Token usage is
+        accounted to session_id, the answering endpoint and the suggested prompt.
+        conversation is the full history when messages is a trimmed copy of it; it
+        decides whether the answer may be saved as a degraded-mode fallback.
+        """
+        cached = self.response_cache.get_for(messages)
+        if cached is not None:
+            print('💾 Answer served from response cache')
+            return cached
         try:
-            response = query_endpoint(self.endpoint_name, messages, max_tokens)
+            if max_tokens is not None:
+                response = self._query_and_account(messages, max_tokens, session_id)
+            else:
+                decision = self.token_policy.decide(messages, long_form=long_form)
+                print(f"🎚️ {decision.question_class} question, max_tokens={decision.max_tokens}")
+                response = self._query_and_account(messages, decision.max_tokens, session_id, decision.endpoint)
+                truncated = self.token_policy.observe(decision, response.get("content") or "",
+                                                      completion_tokens=self._reported_completion_tokens(response),
+                                                      finish_reason=response.get("finish_reason"))
+                if truncated and decision.max_tokens < self.token_policy.max_tokens:
+                    print(f"✂️ Answer hit max_tokens={decision.max_tokens}, retrying with the full budget")
+                    retry = TokenDecision(decision.question_class, self.token_policy.max_tokens, decision.endpoint)
+                    response = self._query_and_account(messages, retry.max_tokens, session_id, retry.endpoint)
+                    self.token_policy.observe(retry, response.get("content") or "", retry=True,
+                                              completion_tokens=self._reported_completion_tokens(response),
+                                              finish_reason=response.get("finish_reason"))
+            if response.get("content"):
+                self.response_cache.put_for(messages, response["content"])
+                self.degraded.remember(conversation or messages, response["content"])
             return response["content"]
         except Exception as e:
             print(f'Error calling model endpoint: {str(e)}')
             raise
 
+    def _answer_within_slo(self, messages, session_id, conversation=None):
+        """
+        Answer a conversation, falling back to a saved answer when the agent is slow or failing.
+
+        In degraded mode the agent gets DEGRADED_SLO_SECONDS; after that a saved
+        answer to the same or a similar question is returned and the agent call
+        carries on in the background to refresh the caches. Outside degraded
+        mode errors are raised as they are. Saved answers are only considered when
+        conversation (the full history, default messages) is a stand-alone question.
+        """
+        conversation = conversation or messages
+        if not self.degraded.active:
+            return self._call_model_endpoint(messages, session_id=session_id, conversation=conversation)
+        if not self.degraded.try_reserve():
+            try:
+                return self._call_model_endpoint(messages, session_id=session_id, conversation=conversation)
+            except Exception:
+                fallback = self.degraded.fallback(conversation)
+                if fallback is None:
+                    raise
+                self.degraded.stats['errors_covered'] += 1
+                print('🩹 Agent call failed, serving a saved answer')
+                return fallback
+
+        future = self._slo_executor.submit(self._call_model_endpoint, messages, session_id=session_id,
+                                           conversation=conversation)
+        future.add_done_callback(self.degraded.release)
+        try:
+            return future.result(timeout=self.degraded.slo_seconds)
+        except FuturesTimeoutError:
+            self.degraded.stats['timeouts'] += 1
+            fallback = self.degraded.fallback(conversation)
+            if fallback is None:
+                # Nothing better to offer - keep waiting for the agent
+                return future.result()
+            self.degraded.stats['revalidations'] += 1
+            print(f"🟠 No answer within {self.degraded.slo_seconds:.0f}s, serving a saved answer while the agent finishes")
+            return fallback
+        except Exception:
+            fallback = self.degraded.fallback(conversation)
+            if fallback is None:
+                raise
+            self.degraded.stats['errors_covered'] += 1
+            return fallback
+
+    def _take_speculation(self, session_id, chat_history):
+        """
+        Claim a speculative answer; in degraded mode it gets the same SLO as a direct call.
+
+        A speculation still running after DEGRADED_SLO_SECONDS is answered with a
+        saved answer if there is one, and otherwise waited for - never called twice.
+        """
+        if not self.degraded.active:
+            return self.speculator.take(session_id, chat_history)
+
+        def saved_answer():
+            self.degraded.stats['timeouts'] += 1
+            fallback = self.degraded.fallback(chat_history)
+            if fallback is not None:
+                self.degraded.stats['revalidations'] += 1
+                print(f"🟠 Speculative answer not ready within {self.degraded.slo_seconds:.0f}s, "
+                      f"serving a saved answer while it finishes")
+            return fallback
+
+        return self.speculator.take(session_id, chat_history, timeout=self.degraded.slo_seconds,
+                                    on_timeout=saved_answer)
+
+    def _query_and_account(self, messages, max_tokens, session_id, prefer=None):
+        """Route one agent call and record its token usage, latency and health"""
+        start = time.time()
+        try:
+            response = self.router.query(messages, max_tokens, prefer=prefer)
+        except Exception:
+            self.degraded.observe(time.time() - start, ok=False)
+            raise
+        self.degraded.observe(time.time() - start, ok=True)
+        first_user = next((m['content'] for m in messages if m.get('role') == 'user'), None)
+        self.usage.record(session_id, response.get('endpoint'), response.get('usage'), time.time() - start,
+                          prompt=first_user if first_user in SUGGESTED_PROMPTS else None)
+        return response
+
+    @staticmethod
+    def _reported_completion_tokens(response):
+        usage = response.get('usage') or {}
+        return None if usage.get('estimated', True) else usage.get('completion_tokens')
+
     def _format_chat_display(self, chat_history):
-        """Format chat messages for display"""
-        formatted_messages = []
-        for msg in chat_history:
-            if isinstance(msg, dict) and 'role' in msg:
-                # Split content by line breaks and create separate paragraphs
-                content = msg['content']
-                # Split by double newlines (our chunk separator)
-                paragraphs = content.split('\n\n')
-                
-                # Create paragraph elements
-                content_elements = []
-                for para in paragraphs:
-                    if para.strip():  # Only add non-empty paragraphs
-                        # Further split by single newlines for line breaks within paragraphs
-                        lines = para.split('\n')
-                        para_content = []
-                        for i, line in enumerate(lines):
-                            if line.strip():
-                                para_content.append(line)
-                                if i < len(lines) - 1:  # Add br between lines
-                                    para_content.append(html.Br())
-                        
-                        content_elements.append(
-                            html.P(para_content, style={'margin-bottom': '10px'})
-                        )
-                
-                formatted_messages.append(
-                    html.Div([
-                        html.Div([
-                            html.Div('👤' if msg['role'] == 'user' else '🤖', 
-                                    className='message-icon'),
-                            html.Div(content_elements, className='message-text')
-                        ], className=f"chat-message {msg['role']}-message")
-                    ], className=f"message-container {msg['role']}-container")
-                )
-        
-        return formatted_messages
+        """Format chat messages (ChatMessages or stored dicts) for display"""
+        return [_message_fragment(msg) for msg in ChatMessage.from_store(chat_history)]
+
+    @staticmethod
+    def _patchable_turn(trigger, chat_history, start):
+        """
+        Whether the answer can be patched over the typing indicator in place.
+
+        Only when this is the single turn in flight: the history grew by exactly
+        this callback's answer and the indicator sits where the history says.
+        """
+        if trigger.get('turn') != len(chat_history) - 1:
+            return False
+        if len(chat_history) > 2 and chat_history[-3].role == 'user':
+            # Two user messages in a row - another send overlapped this one
+            return False
+        return trigger.get('slot') == len(chat_history) - 1 - start
+
+    def _render_window(self, chat_history):
+        """Render only the latest CHAT_WINDOW_SIZE messages; returns (children, chat-window data, load-earlier style)"""
+        start = max(0, len(chat_history) - CHAT_WINDOW_SIZE)
+        return (self._format_chat_display(chat_history[start:]), {'start': start},
+                self._load_earlier_style(start))
+
+    @staticmethod
+    def _load_earlier_style(start):
+        return {'display': 'block'} if start > 0 else {'display': 'none'}
 
     def _create_typing_indicator(self):
         """Create animated typing indicator"""
@@ -252,210 +630,66 @@ class ClearScoreChatbot:
             ], className='chat-message assistant-message typing-message')
         ], className='message-container assistant-container')
 
+    def _create_busy_notice(self, rejection):
+        """Create the transient notice shown when a request is not admitted"""
+        if rejection.reason == 'rate_limited':
+            text = "You're sending messages a little too quickly."
+        else:
+            text = "We're handling a lot of questions right now."
+        return self._create_notice('⏳', f"{text} Please retry in about {max(1, round(rejection.retry_after))} "
+                                         f"second(s) - your message is back in the input box.")
+
+    def _create_budget_notice(self):
+        """Create the notice shown when a session has used up its budget"""
+        return self._create_notice('🛑', "This chat session has reached its usage limit, so I can't answer "
+                                         "further questions here. Please contact ClearScore support if you "
+                                         "still need help.")
+
+    def _create_notice(self, icon, text):
+        return html.Div([
+            html.Div([
+                html.Div(icon, className='message-icon'),
+                html.Div([
+                    html.P(text, style={'margin-bottom': '0'})
+                ], className='message-text')
+            ], className='chat-message assistant-message busy-message')
+        ], className='message-container assistant-container')
+
     def _add_custom_css(self):
-        """Add custom CSS styling with ClearScore branding"""
-        custom_css = '''
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-        
-        body {
-            font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-            background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 50%, #EC4899 100%);
-            min-height: 100vh;
-        }
-        
-        .chat-container {
-            background-color: #FFFFFF;
-            border-radius: 16px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            padding: 24px;
-        }
-        
-        .chat-card {
-            border: 2px solid #e5e7eb;
-            background-color: #f9fafb;
-            border-radius: 12px;
-            overflow: hidden;
-        }
-        
-        .chat-body {
-            background-color: #ffffff;
-        }
-        
-        .chat-history {
-            overflow-y: auto;
-            padding: 20px;
-            background: linear-gradient(to bottom, #ffffff 0%, #f9fafb 100%);
-        }
-        
-        .message-container {
-            display: flex;
-            margin-bottom: 16px;
-            animation: fadeIn 0.3s ease-in;
-        }
-        
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        .user-container {
-            justify-content: flex-end;
-        }
-        
-        .chat-message {
-            max-width: 75%;
-            padding: 12px 16px;
-            border-radius: 12px;
-            font-size: 15px;
-            line-height: 1.5;
-            display: flex;
-            gap: 10px;
-            align-items: flex-start;
-        }
-        
-        .message-icon {
-            font-size: 20px;
-            flex-shrink: 0;
-        }
-        
-        .message-text {
-            flex: 1;
-            word-wrap: break-word;
-        }
-        
-        .user-message {
-            background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 100%);
-            color: white;
-            box-shadow: 0 4px 12px rgba(79, 70, 229, 0.4);
-        }
-        
-        .assistant-message {
-            background-color: #f3f4f6;
-            color: #1f2937;
-            border: 1px solid #e5e7eb;
-        }
-        
-        .typing-message {
-            background-color: #f3f4f6;
-            border: 1px solid #e5e7eb;
-        }
-        
-        .typing-indicator {
-            display: flex;
-            gap: 4px;
-            padding: 8px 0;
-        }
-        
-        .typing-dot {
-            width: 8px;
-            height: 8px;
-            background-color: #9ca3af;
-            border-radius: 50%;
-            animation: typing-animation 1.4s infinite ease-in-out;
-        }
-        
-        .typing-dot:nth-child(1) { animation-delay: 0s; }
-        .typing-dot:nth-child(2) { animation-delay: 0.2s; }
-        .typing-dot:nth-child(3) { animation-delay: 0.4s; }
-        
-        @keyframes typing-animation {
-            0%, 60%, 100% { transform: translateY(0); }
-            30% { transform: translateY(-8px); }
-        }
-        
-        .user-input {
-            border-radius: 24px;
-            border: 2px solid #e5e7eb;
-            padding: 12px 20px;
-            font-size: 15px;
-        }
-        
-        .user-input:focus {
-            border-color: #4F46E5;
-            box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.1);
-        }
-        
-        #send-button {
-            border-radius: 24px;
-            padding: 12px 28px;
-            font-weight: 600;
-            background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-            border: none;
-        }
-        
-        #send-button:hover {
-            background: linear-gradient(135deg, #059669 0%, #047857 100%);
-            transform: translateY(-1px);
-            box-shadow: 0 4px 12px rgba(16, 185, 129, 0.4);
-        }
-        
-        #clear-button {
-            border-radius: 24px;
-            padding: 12px 24px;
-            font-weight: 600;
-            border: 2px solid #ef4444;
-            color: #ef4444;
-        }
-        
-        #clear-button:hover {
-            background-color: #ef4444;
-            color: white;
-        }
-        
-        .btn-light {
-            background-color: #f3f4f6;
-            border: 1px solid #d1d5db;
-            color: #4b5563;
-            border-radius: 20px;
-            padding: 6px 14px;
-            font-size: 13px;
-            transition: all 0.2s;
-        }
-        
-        .btn-light:hover {
-            background-color: #4F46E5;
-            color: white;
-            border-color: #4F46E5;
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(79, 70, 229, 0.3);
-        }
-        
-        .input-group {
-            gap: 8px;
-        }
-        
-        /* Scrollbar styling */
-        .chat-history::-webkit-scrollbar {
-            width: 8px;
-        }
-        
-        .chat-history::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 4px;
-        }
-        
-        .chat-history::-webkit-scrollbar-thumb {
-            background: #cbd5e1;
-            border-radius: 4px;
-        }
-        
-        .chat-history::-webkit-scrollbar-thumb:hover {
-            background: #94a3b8;
-        }
-        '''
-        
+        """Link the ClearScore stylesheet and self-hosted fonts (see static/chatbot.css)"""
         self.app.index_string = self.app.index_string.replace(
             '</head>',
-            f'<style>{custom_css}</style></head>'
+            f"{self.static_assets.head_tags(['chatbot.css'])}</head>"
         )
 
-        # Auto-scroll chat to bottom
+        # Auto-scroll chat to bottom - or, after older messages were prepended,
+        # keep the view where it was. Also installs the scroll listener that
+        # lazy-loads older pages when the user scrolls to the top.
         self.app.clientside_callback(
             """
             function(children) {
                 var chatHistory = document.getElementById('chat-history');
                 if(chatHistory) {
-                    chatHistory.scrollTop = chatHistory.scrollHeight;
+                    if (!chatHistory.dataset.lazyLoad) {
+                        chatHistory.dataset.lazyLoad = 'on';
+                        chatHistory.addEventListener('scroll', function() {
+                            var container = document.getElementById('load-earlier-container');
+                            if (chatHistory.scrollTop < 40 && container && container.style.display !== 'none'
+                                    && !window._chatPrependFrom) {
+                                window._chatPrependFrom = chatHistory.scrollHeight;
+                                document.getElementById('load-earlier-button').click();
+                            }
+                        });
+                        document.getElementById('load-earlier-button').addEventListener('click', function() {
+                            window._chatPrependFrom = window._chatPrependFrom || chatHistory.scrollHeight;
+                        });
+                    }
+                    if (window._chatPrependFrom) {
+                        chatHistory.scrollTop = chatHistory.scrollHeight - window._chatPrependFrom;
+                        window._chatPrependFrom = null;
+                    } else {
+                        chatHistory.scrollTop = chatHistory.scrollHeight;
+                    }
                 }
                 return '';
             }
@@ -0,0 +1,272 @@
+"""
+Admission control in front of the agent endpoint
+
+Every agent call from the chatbot goes through an AdmissionController:
+
+- a token bucket per session and a global one cap the request rate
+- at most max_concurrent calls run at once; the rest wait in a bounded
+  priority queue where follow-ups in an active conversation are served
+  before first messages
+- requests whose expected queue wait exceeds the SLO are rejected
+  immediately, so the user gets a "busy, retry shortly" message instead of
+  a long hang and p99 latency stays stable under bursts
+- tokens taken for a request that is then rejected as busy are refunded,
+  so a retry is not also rate limited
+- duplicate submissions (same dedup key, e.g. the same message from the
+  same session) are rejected while the original is in flight
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from memory_budget import approx_size, sampled_size
+
+PRIORITY_FOLLOW_UP = 0
+PRIORITY_FIRST_MESSAGE = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Request rejected ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: refills at rate tokens/second up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available; never blocks."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def refund(self, tokens: float = 1.0) -> None:
+        """Give back tokens taken for a request that was not admitted after all."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until tokens will be available."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self.tokens
+            return max(0.0, missing / self.rate) if self.rate > 0 else float('inf')
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until tokens are available and take them."""
+        while not self.try_acquire(tokens):
+            time.sleep(min(1.0, max(0.001, self.wait_time(tokens))))
+
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'session_id', 'dedup_key', 'admitted_at')
+
+    def __init__(self, priority: int, seq: int, session_id: str, dedup_key):
+        self.priority = priority
+        self.seq = seq
+        self.session_id = session_id
+        self.dedup_key = dedup_key
+        self.admitted_at = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class AdmissionController:
+    """Rate limiting, bounded priority queueing and deduplication for agent calls"""
+
+    def __init__(self, max_concurrent: int = None, max_queue: int = None, slo_seconds: float = None,
+                 session_rate_per_minute: float = None, session_burst: float = None,
+                 global_rate_per_second: float = None, global_burst: float = None,
+                 initial_service_time: float = 5.0, max_sessions: int = 10000):
+        """
+        Defaults come from the ADMISSION_* environment variables (see README).
+
+        Args:
+            max_concurrent: Agent calls allowed to run at once per worker
+            max_queue: Requests allowed to wait for a slot
+            slo_seconds: Maximum acceptable queue wait; requests expected to wait longer are rejected
+            session_rate_per_minute: Sustained requests per minute per session
+            session_burst: Requests a session may send back to back
+            global_rate_per_second: Sustained requests per second across all sessions
+            global_burst: Global burst size
+            initial_service_time: Assumed agent call duration before any are observed (seconds)
+            max_sessions: Session buckets kept (least recently used are dropped)
+        """
+        self.max_concurrent = max_concurrent or int(_env_float('ADMISSION_MAX_CONCURRENT', 8))
+        self.max_queue = max_queue if max_queue is not None else int(_env_float('ADMISSION_MAX_QUEUE', 32))
+        self.slo_seconds = slo_seconds or _env_float('ADMISSION_QUEUE_SLO_SECONDS', 10.0)
+        self.session_rate = (session_rate_per_minute or _env_float('ADMISSION_SESSION_RATE_PER_MINUTE', 12.0)) / 60.0
+        self.session_burst = session_burst or _env_float('ADMISSION_SESSION_BURST', 3.0)
+        self.global_bucket = TokenBucket(
+            global_rate_per_second or _env_float('ADMISSION_GLOBAL_RATE_PER_SECOND', 10.0),
+            global_burst or _env_float('ADMISSION_GLOBAL_BURST', 20.0),
+        )
+        self.max_sessions = max_sessions
+        self.service_time = initial_service_time
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._in_flight_keys = set()
+        self._session_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.stats = {'admitted': 0, 'queued': 0, 'rate_limited': 0, 'busy': 0, 'duplicate': 0}
+
+    def _session_bucket(self, session_id: str) -> TokenBucket:
+        """Get or create a session's bucket. Caller holds the lock."""
+        bucket = self._session_buckets.get(session_id)
+        if bucket is None:
+            bucket = TokenBucket(self.session_rate, self.session_burst)
+            self._session_buckets[session_id] = bucket
+            while len(self._session_buckets) > self.max_sessions:
+                self._session_buckets.popitem(last=False)
+        else:
+            self._session_buckets.move_to_end(session_id)
+        return bucket
+
+    def _reject(self, reason: str, retry_after: float):
+        self.stats[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def _expected_wait(self, ticket: _Ticket) -> float:
+        """Estimated queue wait for a ticket. Caller holds the lock."""
+        ahead = sum(1 for other in self._waiting if other < ticket)
+        if self._running < self.max_concurrent and ahead == 0:
+            return 0.0
+        return (ahead + 1) * self.service_time / self.max_concurrent
+
+    def acquire(self, session_id: str, priority: int = PRIORITY_FIRST_MESSAGE, dedup_key=None) -> _Ticket:
+        """
+        Wait for a slot to call the agent.
+
+        Args:
+            session_id: Browser session making the request
+            priority: PRIORITY_FOLLOW_UP or PRIORITY_FIRST_MESSAGE (lower is served first)
+            dedup_key: Identifies the request, e.g. (session, message); a second request
+                with the same key while the first is in flight is rejected as a duplicate
+
+        Returns:
+            Ticket to pass to release()
+
+        Raises:
+            AdmissionRejected: with reason 'duplicate', 'rate_limited' or 'busy'
+        """
+        with self._cond:
+            if dedup_key is not None and dedup_key in self._in_flight_keys:
+                self._reject('duplicate', 0.0)
+
+            session_bucket = self._session_bucket(session_id or 'anonymous')
+            if not session_bucket.try_acquire():
+                self._reject('rate_limited', session_bucket.wait_time())
+            if not self.global_bucket.try_acquire():
+                session_bucket.refund()
+                self._reject('busy', self.global_bucket.wait_time())
+
+            ticket = _Ticket(priority, next(self._seq), session_id, dedup_key)
+            expected_wait = self._expected_wait(ticket)
+            if expected_wait > 0 and (len(self._waiting) >= self.max_queue or expected_wait > self.slo_seconds):
+                session_bucket.refund()
+                self.global_bucket.refund()
+                self._reject('busy', expected_wait)
+
+            if dedup_key is not None:
+                self._in_flight_keys.add(dedup_key)
+            if expected_wait > 0:
+                self.stats['queued'] += 1
+                heapq.heappush(self._waiting, ticket)
+                deadline = time.monotonic() + self.slo_seconds
+                while self._running >= self.max_concurrent or self._waiting[0] is not ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        self._in_flight_keys.discard(dedup_key)
+                        session_bucket.refund()
+                        self.global_bucket.refund()
+                        self._cond.notify_all()
+                        self._reject('busy', self.service_time)
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+                # Let the next waiter check whether another slot is free
+                self._cond.notify_all()
+
+            self._running += 1
+            self.stats['admitted'] += 1
+            ticket.admitted_at = time.monotonic()
+            return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """Free the ticket's slot and update the service-time estimate."""
+        with self._cond:
+            self._running -= 1
+            self._in_flight_keys.discard(ticket.dedup_key)
+            if ticket.admitted_at is not None:
+                elapsed = time.monotonic() - ticket.admitted_at
+                self.service_time += 0.2 * (elapsed - self.service_time)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, session_id: str, priority: int = PRIORITY_FIRST_MESSAGE, dedup_key=None):
+        """Context manager around acquire()/release()."""
+        ticket = self.acquire(session_id, priority, dedup_key)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def memory_size(self) -> int:
+        """Approximate bytes of the per-session buckets (see memory_budget)."""
+        with self._cond:
+            return sampled_size(iter(self._session_buckets.items()), count=len(self._session_buckets))
+
+    def evict_idle(self, target_bytes: int, idle_seconds: float) -> int:
+        """Drop buckets of sessions idle for at least idle_seconds (a new bucket starts full anyway)."""
+        cutoff = time.monotonic() - max(idle_seconds, self.session_burst / self.session_rate if self.session_rate else 0)
+        freed = 0
+        with self._cond:
+            while self._session_buckets and freed < target_bytes:
+                session_id, bucket = next(iter(self._session_buckets.items()))
+                if bucket.updated_at > cutoff:
+                    break
+                del self._session_buckets[session_id]
+                freed += approx_size((session_id, bucket))
+        return freed
+
+    def metrics(self) -> dict:
+        """Queue depth, concurrency and rejection counters for /metrics"""
+        with self._cond:
+            return dict(
+                self.stats,
+                running=self._running,
+                waiting=len(self._waiting),
+                max_concurrent=self.max_concurrent,
+                service_time_ms=round(self.service_time * 1000, 1),
+                sessions_tracked=len(self._session_buckets),
+            )
@@ -8,35 +8,203 @@ This demonstrates how to use Databricks AI functions like:
 - ai_query() - Query knowledge bases
 
 These functions can be called via the Databricks SQL Execution API.
+
+For offline runs and benchmarks (benchmarks/ai_functions.py), pass
+connect=local_ai_sql.connector() or set AI_FUNCTIONS_BACKEND=local to use
+the local SQLite stand-in instead of a warehouse.
 """
 
-from databricks import sql
+from collections import Counter, deque
+from datetime import datetime
+import hashlib
+import itertools
+import json
 import os
+import threading
+import weakref
+
+import local_ai_sql
+from conversation_summarizer import IncrementalSummarizer
+from knowledge_index import KnowledgeIndex
+from memory_budget import TIER_ANALYTICS, TIER_COLD_CACHE, TIER_IDLE_SESSIONS, approx_size, governor, sampled_size
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+
+_instances = itertools.count(1)
 
 
 class DatabricksAIFunctions:
     """Wrapper for Databricks AI Functions using SQL Execution API"""
     
-    def __init__(self):
-        """Initialize connection parameters from environment"""
+    SENTIMENT_LABELS = ['positive', 'neutral', 'negative']
+    INTENT_LABELS = [
+        'check_credit_score',
+        'improve_credit_score',
+        'score_change_inquiry',
+        'update_personal_details',
+        'product_inquiry',
+        'account_closure',
+        'dispute_error',
+        'general_inquiry'
+    ]
+    LANGUAGE_LABELS = ['en', 'es', 'fr', 'de', 'it', 'pt', 'nl', 'pl', 'zh', 'ja']
+    
+    def __init__(self, connect=None, cache: ResponseCache = None):
+        """
+        Initialize connection parameters from environment
+        
+        Args:
+            connect: DB-API connect() to use instead of the Databricks SQL connector,
+                e.g. local_ai_sql.connector() (default: chosen by AI_FUNCTIONS_BACKEND)
+            cache: Result cache (default: in-process LRU in front of the shared cache)
+        """
+        if connect is None and os.getenv('AI_FUNCTIONS_BACKEND', 'databricks').lower() == 'local':
+            connect = local_ai_sql.connector()
+        self._connect = connect
         self.server_hostname = os.getenv('DATABRICKS_SERVER_HOSTNAME', 
                                          'e2-demo-field-eng.cloud.databricks.com')
         self.http_path = os.getenv('DATABRICKS_HTTP_PATH', 
                                    '/sql/1.0/warehouses/xxxxx')  # Update with your SQL warehouse
         self.access_token = os.getenv('DATABRICKS_TOKEN')
+        self.knowledge_index_dir = os.getenv('KNOWLEDGE_INDEX_DIR', 'knowledge_index')
+        self.knowledge_index = None
+        # AI function results are deterministic enough to reuse: in-process LRU
+        # in front of the host-wide shared cache (if SHARED_CACHE_PATH is set)
+        self.cache = cache if cache is not None else ResponseCache(
+            ttl_seconds=float(os.getenv('AI_FUNCTIONS_CACHE_TTL_SECONDS', '86400')),
+            shared=SharedCache.from_env(),
+        )
+        # One component per instance, so a second client does not replace this one's accounting;
+        # it is unregistered with the client, so the governor does not keep the cache alive
+        memory_component = f'ai_functions_cache#{next(_instances)}'
+        governor.register(memory_component, self.cache.memory_size, self.cache.evict, TIER_COLD_CACHE)
+        self._unregister_memory = weakref.finalize(self, governor.unregister, memory_component)
+
+    def close(self):
+        """Stop accounting this client's cache against the memory budget (also done when it is collected)"""
+        self._unregister_memory()
         
     def _get_connection(self):
-        """Create a SQL connection to Databricks"""
+        """Create a SQL connection to Databricks (or the configured local backend)"""
+        if self._connect is not None:
+            return self._connect()
+        from databricks import sql
+        
         return sql.connect(
             server_hostname=self.server_hostname,
             http_path=self.http_path,
             access_token=self.access_token
         )
     
+    @staticmethod
+    def _cache_key(function: str, args: tuple) -> str:
+        return "ai:" + hashlib.sha256(json.dumps([function, args], default=str).encode('utf-8')).hexdigest()
+    
+    def _cached(self, function: str, args: tuple, compute, local_only: bool = False):
+        """
+        Return a cached result for function(args), computing and caching it on a miss
+
+        local_only keeps the result in this process, out of the on-disk shared cache.
+        """
+        key = self._cache_key(function, args)
+        result = self.cache.get(key, local_only=local_only)
+        if result is None:
+            result = compute()
+            self.cache.put(key, result, local_only=local_only)
+        return result
+    
+    @staticmethod
+    def _sql_string(value: str) -> str:
+        """Escape a value for use inside a single-quoted SQL string literal"""
+        return str(value).replace("\\", "\\\\").replace("'", "\\'")
+    
+    @staticmethod
+    def _format_transcript(messages: list) -> str:
+        """Render messages as 'role: content' lines"""
+        return "\n".join([
+            f"{msg['role']}: {msg['content']}" 
+            for msg in messages
+        ])
+    
+    def _summarize_text(self, text: str, max_length: int) -> str:
+        """Run ai_summarize() over a block of text"""
+        def run():
+            with self._get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT ai_summarize(
+                            '{self._sql_string(text)}',
+                            'max_length' => {max_length}
+                        )
+                    """)
+                    result = cursor.fetchone()
+                    return result[0] if result else "Unable to summarize"
+        
+        # Summaries of customer transcripts are personal data, like ai_extract results
+        return self._cached('ai_summarize', (text, max_length), run, local_only=True)
+    
+    def _labels_sql(self, labels: list) -> str:
+        return ", ".join(f"'{self._sql_string(label)}'" for label in labels)
+    
+    def _classify(self, function: str, message: str, labels: list, default: str) -> str:
+        """Run ai_classify() over one message"""
+        def run():
+            with self._get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT ai_classify(
+                            '{self._sql_string(message)}',
+                            ARRAY({self._labels_sql(labels)})
+                        )
+                    """)
+                    result = cursor.fetchone()
+                    return result[0] if result else default
+        
+        return self._cached(function, (message,), run)
+    
+    def _classify_batch(self, function: str, messages: list, labels: list, default: str) -> list:
+        """
+        Run ai_classify() over many messages in one statement
+        
+        Messages already in the cache (under the same keys as the single-message
+        calls) are not sent; the rest share one connection and one query.
+        """
+        keys = [self._cache_key(function, (message,)) for message in messages]
+        results = [self.cache.get(key) for key in keys]
+        missing = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(messages[i], []).append(i)
+        if not missing:
+            return results
+        
+        rows = ",\n".join(f"({n}, '{self._sql_string(message)}')" for n, message in enumerate(missing))
+        with self._get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    WITH batch(idx, text) AS (VALUES
+                        {rows}
+                    )
+                    SELECT idx, ai_classify(text, ARRAY({self._labels_sql(labels)}))
+                    FROM batch
+                """)
+                classified = dict(cursor.fetchall())
+        
+        for n, (message, positions) in enumerate(missing.items()):
+            label = classified.get(n) or default
+            self.cache.put(keys[positions[0]], label)
+            for i in positions:
+                results[i] = label
+        return results
+    
     def summarize_conversation(self, chat_history: list, max_length: int = 150) -> str:
         """
         Summarize a conversation using ai_summarize()
         
+        Sends the whole transcript on every call. For long-running chats use
+        conversation_summarizer.IncrementalSummarizer, which only folds in the
+        turns added since the previous summary.
+        
         Args:
             chat_history: List of message dicts with 'role' and 'content'
             max_length: Maximum length of summary
@@ -44,22 +212,29 @@ class DatabricksAIFunctions:
         Returns:
             Summary string
         """
-        # Combine all messages into one text
-        full_conversation = "\n".join([
-            f"{msg['role']}: {msg['content']}" 
-            for msg in chat_history
-        ])
+        return self._summarize_text(self._format_transcript(chat_history), max_length)
+    
+    def fold_summary(self, previous_summary: str, new_messages: list, max_length: int = 150) -> str:
+        """
+        Fold new conversation turns into an existing summary using ai_summarize()
         
-        with self._get_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT ai_summarize(
-                        '{full_conversation}',
-                        'max_length' => {max_length}
-                    )
-                """)
-                result = cursor.fetchone()
-                return result[0] if result else "Unable to summarize"
+        Args:
+            previous_summary: Summary of the earlier part of the conversation (None for a new one)
+            new_messages: Message dicts added since previous_summary was produced
+            max_length: Maximum length of summary
+            
+        Returns:
+            Updated summary string
+        """
+        transcript = self._format_transcript(new_messages)
+        if not previous_summary:
+            return self._summarize_text(transcript, max_length)
+        
+        text = (
+            f"Summary of the conversation so far:\n{previous_summary}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        return self._summarize_text(text, max_length)
     
     def classify_sentiment(self, message: str) -> str:
         """
@@ -71,16 +246,7 @@ class DatabricksAIFunctions:
         Returns:
             Sentiment: 'positive', 'neutral', or 'negative'
         """
-        with self._get_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT ai_classify(
-                        '{message}',
-                        ARRAY('positive', 'neutral', 'negative')
-                    )
-                """)
-                result = cursor.fetchone()
-                return result[0] if result else "neutral"
+        return self._classify('classify_sentiment', message, self.SENTIMENT_LABELS, 'neutral')
     
     def classify_intent(self, message: str) -> str:
         """
@@ -92,28 +258,31 @@ class DatabricksAIFunctions:
         Returns:
             Intent category
         """
-        intents = [
-            'check_credit_score',
-            'improve_credit_score',
-            'score_change_inquiry',
-            'update_personal_details',
-            'product_inquiry',
-            'account_closure',
-            'dispute_error',
-            'general_inquiry'
-        ]
+        return self._classify('classify_intent', message, self.INTENT_LABELS, 'general_inquiry')
+    
+    def classify_sentiments(self, messages: list) -> list:
+        """
+        Classify the sentiment of many messages with one ai_classify() query
         
-        with self._get_connection() as connection:
-            with connection.cursor() as cursor:
-                intents_str = ", ".join([f"'{intent}'" for intent in intents])
-                cursor.execute(f"""
-                    SELECT ai_classify(
-                        '{message}',
-                        ARRAY({intents_str})
-                    )
-                """)
-                result = cursor.fetchone()
-                return result[0] if result else "general_inquiry"
+        Args:
+            messages: Customer message texts
+            
+        Returns:
+            Sentiments, in the order of messages
+        """
+        return self._classify_batch('classify_sentiment', messages, self.SENTIMENT_LABELS, 'neutral')
+    
+    def classify_intents(self, messages: list) -> list:
+        """
+        Classify the intent of many messages with one ai_classify() query
+        
+        Args:
+            messages: Customer message texts
+            
+        Returns:
+            Intent categories, in the order of messages
+        """
+        return self._classify_batch('classify_intent', messages, self.INTENT_LABELS, 'general_inquiry')
     
     def extract_customer_info(self, message: str) -> dict:
         """
@@ -132,38 +301,72 @@ class DatabricksAIFunctions:
             "account_number": "string"
         }
         
+        # Not cached: the result is personal data and the shared cache is on disk
         with self._get_connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute(f"""
                     SELECT ai_extract(
-                        '{message}',
-                        '{schema}'
+                        '{self._sql_string(message)}',
+                        '{self._sql_string(json.dumps(schema))}'
                     )
                 """)
                 result = cursor.fetchone()
                 return result[0] if result else {}
     
-    def query_knowledge_base(self, question: str, context: str) -> str:
+    def _get_knowledge_index(self):
+        """Open the local knowledge index lazily (see knowledge_index.py)"""
+        if self.knowledge_index is None:
+            self.knowledge_index = KnowledgeIndex(self.knowledge_index_dir)
+            print(f"📚 Loaded knowledge index: {len(self.knowledge_index)} passage(s)")
+        return self.knowledge_index
+    
+    def retrieve_passages(self, question: str, k: int = 4) -> list:
+        """
+        Retrieve the most relevant help-article passages for a question
+        
+        Args:
+            question: Customer's question
+            k: Number of passages to retrieve
+            
+        Returns:
+            List of passage dicts ('id', 'text', 'source', 'score'), best first
+        """
+        return self._get_knowledge_index().search(question, k=k)
+    
+    def query_knowledge_base(self, question: str, context: str = None, k: int = 4) -> str:
         """
         Query knowledge base using ai_query()
         
+        Only the top-k passages retrieved from the local knowledge index are
+        sent to the warehouse, rather than the whole knowledge base.
+        
         Args:
             question: Customer's question
-            context: Knowledge base context or documentation
+            context: Optional explicit context; skips retrieval when given
+            k: Number of passages to retrieve when no context is given
             
         Returns:
             Answer from knowledge base
         """
-        with self._get_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT ai_query(
-                        '{question}',
-                        '{context}'
-                    )
-                """)
-                result = cursor.fetchone()
-                return result[0] if result else "No answer found"
+        if context is None:
+            passages = self.retrieve_passages(question, k=k)
+            if not passages:
+                return "No answer found"
+            context = "\n\n".join(f"[{p['id']}] {p['text']}" for p in passages)
+        
+        def run():
+            with self._get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT ai_query(
+                            '{self._sql_string(question)}',
+                            '{self._sql_string(context)}'
+                        )
+                    """)
+                    result = cursor.fetchone()
+                    return result[0] if result else "No answer found"
+        
+        return self._cached('ai_query', (question, context), run)
     
     def detect_language(self, message: str) -> str:
         """
@@ -175,19 +378,7 @@ class DatabricksAIFunctions:
         Returns:
             Language code (e.g., 'en', 'es', 'fr')
         """
-        languages = ['en', 'es', 'fr', 'de', 'it', 'pt', 'nl', 'pl', 'zh', 'ja']
-        
-        with self._get_connection() as connection:
-            with connection.cursor() as cursor:
-                langs_str = ", ".join([f"'{lang}'" for lang in languages])
-                cursor.execute(f"""
-                    SELECT ai_classify(
-                        '{message}',
-                        ARRAY({langs_str})
-                    )
-                """)
-                result = cursor.fetchone()
-                return result[0] if result else 'en'
+        return self._classify('detect_language', message, self.LANGUAGE_LABELS, 'en')
 
 
 # Example usage in your chatbot
@@ -216,11 +407,19 @@ def enhance_chatbot_with_ai_functions():
         # ... etc
     
     # 2. Summarize conversation when user clicks "Clear Chat"
-    def on_clear_chat(chat_history):
+    # The rolling summary is kept up to date turn by turn, so clearing only
+    # folds in the last few messages instead of the whole transcript
+    summarizer = IncrementalSummarizer(ai_functions)
+    
+    def on_assistant_reply(conversation_id, chat_history):
+        summarizer.summarize(conversation_id, chat_history)
+    
+    def on_clear_chat(conversation_id, chat_history):
         if len(chat_history) > 3:
-            summary = ai_functions.summarize_conversation(chat_history)
+            summary = summarizer.summarize(conversation_id, chat_history)
             # Save summary to database
             save_conversation_summary(summary)
+        summarizer.forget(conversation_id)
     
     # 3. Extract customer information automatically
     def on_extract_info(message):
@@ -237,6 +436,60 @@ def enhance_chatbot_with_ai_functions():
             handle_non_english(message, language)
 
 
+class ConversationAnalytics:
+    """
+    Per-message sentiment/intent records with running totals
+
+    The dashboard is computed from the totals, so old records can be dropped
+    (by the memory governor, or past max_records) without changing it; only
+    the recent per-message detail is lost.
+    """
+
+    def __init__(self, max_records: int = 10000):
+        self.records = deque(maxlen=max_records)
+        self.sentiments = Counter()
+        self.intents = Counter()
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, message: str, sentiment: str, intent: str) -> None:
+        with self._lock:
+            self.records.append({
+                'message': message,
+                'sentiment': sentiment,
+                'intent': intent,
+                'timestamp': datetime.now()
+            })
+            self.sentiments[sentiment] += 1
+            self.intents[intent] += 1
+            self.total += 1
+
+    def dashboard(self):
+        with self._lock:
+            if not self.total:
+                return None
+            return {
+                'total_messages': self.total,
+                'positive_sentiment': self.sentiments['positive'],
+                'neutral_sentiment': self.sentiments['neutral'],
+                'negative_sentiment': self.sentiments['negative'],
+                'top_intent': self.intents.most_common(1)[0][0],
+                'all_intents': list(self.intents)
+            }
+
+    def memory_size(self) -> int:
+        with self._lock:
+            return sampled_size(reversed(self.records), count=len(self.records))
+
+    def evict(self, target_bytes: int, idle_seconds: float = 0) -> int:
+        """Drop the oldest records until about target_bytes are freed (the totals are kept)."""
+        freed = 0
+        with self._lock:
+            while self.records and freed < target_bytes:
+                freed += approx_size(self.records.popleft())
+        return freed
+
+
 # Integration Example: Enhanced Chatbot Component
 class EnhancedClearScoreChatbot:
     """
@@ -248,7 +501,12 @@ class EnhancedClearScoreChatbot:
     def __init__(self, app, endpoint_name, height='700px'):
         # ... existing initialization ...
         self.ai_functions = DatabricksAIFunctions()
-        self.conversation_analytics = []
+        self.summarizer = IncrementalSummarizer(self.ai_functions, max_length=200)
+        self.conversation_analytics = ConversationAnalytics()
+        governor.register('conversation_summaries', self.summarizer.memory_size, self.summarizer.evict_idle,
+                          TIER_IDLE_SESSIONS)
+        governor.register('conversation_analytics', self.conversation_analytics.memory_size,
+                          self.conversation_analytics.evict, TIER_ANALYTICS)
     
     def process_user_message(self, message):
         """Enhanced message processing with AI functions"""
@@ -258,12 +516,7 @@ class EnhancedClearScoreChatbot:
         intent = self.ai_functions.classify_intent(message)
         
         # 2. Track analytics
-        self.conversation_analytics.append({
-            'message': message,
-            'sentiment': sentiment,
-            'intent': intent,
-            'timestamp': datetime.now()
-        })
+        self.conversation_analytics.record(message, sentiment, intent)
         
         # 3. Show intent indicator to customer service rep
         # (if this is being monitored)
@@ -276,33 +529,19 @@ class EnhancedClearScoreChatbot:
         # 5. Call the agent endpoint normally
         return self.call_agent_endpoint(message)
     
-    def summarize_conversation_history(self, chat_history):
-        """Summarize long conversations"""
+    def summarize_conversation_history(self, chat_history, conversation_id='default'):
+        """Summarize long conversations, folding in only the turns since the last summary"""
         if len(chat_history) > 10:
-            summary = self.ai_functions.summarize_conversation(
-                chat_history, 
-                max_length=200
-            )
-            return summary
+            return self.summarizer.summarize(conversation_id, chat_history)
         return None
     
+    def get_conversation_summary(self, conversation_id='default'):
+        """Cached summary for handoff and analytics - never calls the warehouse"""
+        return self.summarizer.get(conversation_id)
+    
     def generate_analytics_dashboard(self):
         """Generate insights from conversation analytics"""
-        if not self.conversation_analytics:
-            return None
-        
-        # Calculate metrics
-        sentiments = [a['sentiment'] for a in self.conversation_analytics]
-        intents = [a['intent'] for a in self.conversation_analytics]
-        
-        return {
-            'total_messages': len(self.conversation_analytics),
-            'positive_sentiment': sentiments.count('positive'),
-            'neutral_sentiment': sentiments.count('neutral'),
-            'negative_sentiment': sentiments.count('negative'),
-            'top_intent': max(set(intents), key=intents.count),
-            'all_intents': list(set(intents))
-        }
+        return self.conversation_analytics.dashboard()
 
 
 # Configuration example for app.yaml
@@ -2,12 +2,20 @@ import os
 import dash
 import dash_bootstrap_components as dbc
 from dash import html
-from ClearScoreChatbot import ClearScoreChatbot
+import metrics
+import warmup
+from profiler import profiler
+from ClearScoreChatbot import ClearScoreChatbot, SUGGESTED_PROMPTS
+from compression import CallbackCompression
+from memory_budget import governor
 from model_serving_utils import is_endpoint_supported
+from static_assets import StaticAssets
 
 # Get serving endpoint from environment
 # For local development, set: export SERVING_ENDPOINT=mas-691e9159-endpoint
 # For Databricks Apps deployment, this is set in app.yaml
+# A weighted list routes across several endpoints with failover, e.g.
+#   export SERVING_ENDPOINT="ka-6859840b-endpoint:3,ka-backup-endpoint:1"
 serving_endpoint = os.getenv('SERVING_ENDPOINT')
 
 if not serving_endpoint:
@@ -22,8 +30,26 @@ print(f"   Skipping strict validation - will attempt connection when first messa
 endpoint_supported = True  # Always allow the chatbot to load
 
 # Initialize the Dash app with a modern theme
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
+# The theme, stylesheet and fonts are served fingerprinted from static/ when
+# available (run ./fetch_static_assets.sh), falling back to the CDN theme
+static_assets = StaticAssets()
+app = dash.Dash(__name__, external_stylesheets=[
+    static_assets.stylesheet_url('vendor/flatly.min.css', fallback=dbc.themes.FLATLY)
+])
 app.title = "ClearScore Customer Service AI Agent"
+static_assets.register(app)
+metrics.register_routes(app)
+# Opt-in request profiling (PROFILE_ENABLED=true or POST /admin/profiler)
+profiler.register(app)
+metrics.register_source('profiler', profiler.metrics)
+# Compress large callback responses (chat-history-store grows with the conversation)
+callback_compression = CallbackCompression()
+callback_compression.register(app)
+metrics.register_source('callback_compression', callback_compression.metrics)
+# Memory budget across sessions and caches, with a breakdown at /admin/memory
+governor.register_routes(app)
+governor.start()
+metrics.register_source('memory', governor.metrics)
 
 # Define the app layout based on endpoint support
 if not endpoint_supported:
@@ -56,9 +82,15 @@ else:
     chatbot = ClearScoreChatbot(
         app=app, 
         endpoint_name=serving_endpoint, 
-        height='700px'
+        height='700px',
+        static_assets=static_assets
     )
     
+    # Optional warm-up (WARMUP_ENABLED=true): wake the endpoint and prefetch the
+    # suggested prompts; /ready reports not-ready until it has finished
+    warmup.start(app, chatbot, SUGGESTED_PROMPTS)
+    metrics.register_source('warmup', warmup.state.snapshot)
+    
     app.layout = dbc.Container([
         dbc.Row([
             dbc.Col([
@@ -0,0 +1 @@
+"""Offline benchmarks for the ClearScore chatbot (run with python -m benchmarks.<name>)"""
@@ -0,0 +1,257 @@
+"""
+Latency and throughput of the AI function (SQL warehouse) paths
+
+Runs DatabricksAIFunctions against the local SQLite backend
+(local_ai_sql), whose fake ai_* functions model the warehouse with injected
+delays, so the numbers show where the time of each path goes rather than
+what a real warehouse would take. Reports:
+
+- connection setup: opening and closing one connection
+- per-call latency of every path (summarize, fold, sentiment, intent,
+  language, extract, knowledge-base query with explicit context)
+- batched vs per-message throughput: classify_intents() over a batch against
+  classify_intent() per message, at several batch sizes
+- concurrency scaling: classify_intent() from 1..N threads, against a
+  warehouse that runs at most --max-concurrency statements at once
+- with --failure-rate, the share of calls that failed on every path
+
+The batching speedup in particular is a property of the model, not a
+measurement: it follows almost entirely from --batch-parallelism (rows of
+one statement the fake warehouse processes at once) and the per-statement
+and connect delays, so it is printed next to those parameters. Likewise
+concurrency scaling levels off at --max-concurrency by construction. Measure
+against a real warehouse before relying on it.
+
+Every call uses fresh message text and a private in-process cache, so no
+result is served from cache and nothing is written to the shared cache.
+
+Usage:
+    python -m benchmarks.ai_functions
+    python -m benchmarks.ai_functions --latency-ms 80 --connect-ms 300 --failure-rate 0.02 --json
+"""
+
+import argparse
+import itertools
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import local_ai_sql
+from ai_functions_example import DatabricksAIFunctions
+from response_cache import ResponseCache
+
+_MESSAGES = (
+    "How do I check my credit score?",
+    "My score dropped by 40 points and I think it's wrong",
+    "Thanks, that was really helpful!",
+    "I want to update my address, my name is Sam Taylor",
+    "Can you close my account please? My email is sam@example.com",
+    "Hola, como puedo ver mi puntuacion de credito?",
+    "Why was I declined for a credit card?",
+    "How can I improve my credit score quickly?",
+)
+_CONTEXT = (
+    "Your credit score updates every week when we receive new data from the credit reference agency.\n\n"
+    "To improve your score, pay bills on time and keep your credit utilisation below 30%.\n\n"
+    "To dispute an error on your report, contact the credit reference agency directly."
+)
+_counter = itertools.count()
+
+
+def _message() -> str:
+    """A message that has not been seen before, so it cannot be a cache hit."""
+    n = next(_counter)
+    return f"{_MESSAGES[n % len(_MESSAGES)]} (ref {n})"
+
+
+def _client(connect) -> DatabricksAIFunctions:
+    return DatabricksAIFunctions(connect=connect, cache=ResponseCache(max_entries=100_000, shared=None))
+
+
+def _paths(ai: DatabricksAIFunctions) -> dict:
+    def history():
+        return [{'role': 'user', 'content': _message()}, {'role': 'assistant', 'content': _CONTEXT}]
+
+    return {
+        'summarize_conversation': lambda: ai.summarize_conversation(history()),
+        'fold_summary': lambda: ai.fold_summary(_message(), history()),
+        'classify_sentiment': lambda: ai.classify_sentiment(_message()),
+        'classify_intent': lambda: ai.classify_intent(_message()),
+        'detect_language': lambda: ai.detect_language(_message()),
+        'extract_customer_info': lambda: ai.extract_customer_info(_message()),
+        'query_knowledge_base': lambda: ai.query_knowledge_base(_message(), context=_CONTEXT),
+    }
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure_connect(connect, repeats: int) -> dict:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        connect().close()
+        times.append(time.perf_counter() - start)
+    return {'median_ms': _ms(statistics.median(times)), 'max_ms': _ms(max(times))}
+
+
+def measure_calls(connect, repeats: int) -> dict:
+    """Median latency and failure share of every path, one call at a time."""
+    results = {}
+    for name, call in _paths(_client(connect)).items():
+        times, failures = [], 0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                failures += 1
+            times.append(time.perf_counter() - start)
+        results[name] = {'median_ms': _ms(statistics.median(times)), 'p90_ms': _ms(_percentile(times, 0.9)),
+                         'error_rate': round(failures / repeats, 3)}
+    return results
+
+
+def measure_batching(connect, batch_sizes: list) -> list:
+    """
+    classify_intents() over a batch against classify_intent() per message.
+
+    One failing row fails the whole batched statement, so with failures
+    injected the batched side reports whether its statement failed.
+    """
+    ai = _client(connect)
+    rows = []
+    for size in batch_sizes:
+        messages = [_message() for _ in range(size)]
+        failures = 0
+        start = time.perf_counter()
+        for message in messages:
+            try:
+                ai.classify_intent(message)
+            except Exception:
+                failures += 1
+        per_message = time.perf_counter() - start
+
+        messages = [_message() for _ in range(size)]
+        batch_failed = False
+        start = time.perf_counter()
+        try:
+            ai.classify_intents(messages)
+        except Exception:
+            batch_failed = True
+        batched = time.perf_counter() - start
+        rows.append({
+            'batch_size': size,
+            'per_message_ms': _ms(per_message),
+            'batched_ms': _ms(batched),
+            'per_message_msgs_per_s': round(size / per_message, 1),
+            'batched_msgs_per_s': round(size / batched, 1),
+            'speedup': round(per_message / batched, 1),
+            'per_message_errors': failures,
+            'batch_failed': batch_failed,
+        })
+    return rows
+
+
+def measure_concurrency(connect, thread_counts: list, calls_per_thread: int) -> list:
+    """classify_intent() throughput from a growing number of threads."""
+    ai = _client(connect)
+    rows = []
+    for threads in thread_counts:
+        failures = 0
+        lock = threading.Lock()
+
+        def worker(_):
+            nonlocal failures
+            for _ in range(calls_per_thread):
+                try:
+                    ai.classify_intent(_message())
+                except Exception:
+                    with lock:
+                        failures += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+        calls = threads * calls_per_thread
+        rows.append({'threads': threads, 'calls': calls, 'elapsed_ms': _ms(elapsed),
+                     'calls_per_s': round(calls / elapsed, 1), 'error_rate': round(failures / calls, 3)})
+    return rows
+
+
+def run(args) -> dict:
+    connect = local_ai_sql.connector(latency_ms=args.latency_ms, failure_rate=args.failure_rate,
+                                     connect_ms=args.connect_ms, query_ms=args.query_ms,
+                                     batch_parallelism=args.batch_parallelism,
+                                     max_concurrency=args.max_concurrency, seed=args.seed)
+    return {
+        'config': {'latency_ms': args.latency_ms, 'connect_ms': args.connect_ms, 'query_ms': args.query_ms,
+                   'failure_rate': args.failure_rate, 'batch_parallelism': args.batch_parallelism,
+                   'max_concurrency': args.max_concurrency, 'modelled': True},
+        'connect': measure_connect(connect, args.repeats),
+        'calls': measure_calls(connect, args.repeats),
+        'batching': measure_batching(connect, args.batch_sizes),
+        'concurrency': measure_concurrency(connect, args.threads, args.calls_per_thread),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AI function paths against the local SQL backend')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Delay of every AI function call')
+    parser.add_argument('--connect-ms', type=float, default=200.0, help='Connection setup delay')
+    parser.add_argument('--query-ms', type=float, default=20.0, help='Fixed delay per statement')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of AI function calls that fail')
+    parser.add_argument('--batch-parallelism', type=int, default=8,
+                        help='Rows of one statement processed in parallel')
+    parser.add_argument('--max-concurrency', type=int, default=4,
+                        help='Statements the modelled warehouse runs at once')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--calls-per-thread', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Print the raw results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    config = results['config']
+    model = (f"batch parallelism {config['batch_parallelism']}, {config['latency_ms']:g} ms per AI call, "
+             f"{config['connect_ms']:g} ms connect, {config['query_ms']:g} ms per statement")
+    print(f"Local backend (modelled delays, not a warehouse): {model}, failure rate {config['failure_rate']:g}")
+    print(f"\nConnection setup: median {results['connect']['median_ms']} ms, max {results['connect']['max_ms']} ms")
+
+    print(f"\n{'path':<24} {'median ms':>10} {'p90 ms':>10} {'errors':>8}")
+    for name, r in results['calls'].items():
+        print(f"{name:<24} {r['median_ms']:>10} {r['p90_ms']:>10} {r['error_rate']:>8.1%}")
+
+    print(f"\nBatched vs per-message - modelled speedup, determined by the parameters: {model}")
+    print(f"{'batch':>6} {'per-msg ms':>11} {'batched ms':>11} {'per-msg/s':>10} {'batched/s':>10} "
+          f"{'speedup':>8} {'errors':>7}")
+    for r in results['batching']:
+        errors = f"{r['per_message_errors']}/{'batch' if r['batch_failed'] else '-'}"
+        print(f"{r['batch_size']:>6} {r['per_message_ms']:>11} {r['batched_ms']:>11} "
+              f"{r['per_message_msgs_per_s']:>10} {r['batched_msgs_per_s']:>10} {r['speedup']:>7}x {errors:>7}")
+
+    print(f"\nConcurrency - modelled, capped at {config['max_concurrency']} statements at once "
+          f"({config['connect_ms']:g} ms connect, {config['query_ms']:g} ms per statement, "
+          f"{config['latency_ms']:g} ms per AI call)")
+    print(f"{'threads':>7} {'calls':>6} {'elapsed ms':>11} {'calls/s':>9} {'errors':>8}")
+    for r in results['concurrency']:
+        print(f"{r['threads']:>7} {r['calls']:>6} {r['elapsed_ms']:>11} {r['calls_per_s']:>9} {r['error_rate']:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
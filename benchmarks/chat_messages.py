@@ -0,0 +1,132 @@
+"""
+Compare plain message dicts with ChatMessage over a long chat session
+
+Replays a synthetic session turn by turn the way the chat callback sees it:
+on every turn the whole history arrives freshly decoded from
+chat-history-store, and the server computes the cache key, the prompt token
+estimate for the context window and the paragraph split used for
+rendering. The dict pipeline recomputes all of that for every message on
+every turn; the ChatMessage pipeline interns the messages and reuses their
+cached fields. Reports CPU time per turn, plus the memory (tracemalloc)
+retained after the session, which for ChatMessage is the price of the
+cached fields, and the peak during it.
+
+The speedup depends on the machine, the Python version and the shape of
+the session (turns, message length), so it is a measurement of this run,
+not a fixed figure.
+
+Usage:
+    python -m benchmarks.chat_messages
+    python -m benchmarks.chat_messages --turns 500 --json
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import chat_message
+from chat_message import ChatMessage, paragraph_segments
+from context_window import message_tokens
+from response_cache import conversation_key
+
+_WORDS = ('credit', 'score', 'report', 'account', 'payment', 'balance', 'limit', 'utilisation',
+          'lender', 'search', 'address', 'electoral', 'roll', 'missed', 'default', 'months')
+
+
+def _text(rng: random.Random, paragraphs: int) -> str:
+    return '\n\n'.join(
+        '\n'.join(' '.join(rng.choice(_WORDS) for _ in range(rng.randint(6, 18)))
+                  for _ in range(rng.randint(1, 3)))
+        for _ in range(paragraphs)
+    )
+
+
+def build_session(turns: int, seed: int = 7) -> list[dict]:
+    """A synthetic conversation of `turns` user/assistant exchanges."""
+    rng = random.Random(seed)
+    history = []
+    for _ in range(turns):
+        history.append({'role': 'user', 'content': _text(rng, 1)})
+        history.append({'role': 'assistant', 'content': _text(rng, rng.randint(2, 5))})
+    return history
+
+
+def _dict_turn(stored: list) -> int:
+    key = conversation_key(stored)
+    tokens = sum(message_tokens(m) for m in stored)
+    segments = [paragraph_segments(m['content']) for m in stored]
+    return len(key) + tokens + len(segments)
+
+
+def _chat_message_turn(stored: list) -> int:
+    messages = ChatMessage.from_store(stored)
+    key = conversation_key(messages)
+    tokens = sum(message_tokens(m) for m in messages)
+    segments = [m.paragraphs for m in messages]
+    return len(key) + tokens + len(segments)
+
+
+def run_pipeline(history: list, turn_fn, every: int = 1, trace_memory: bool = False) -> dict:
+    """Replay the session through one pipeline, decoding the stored history on every turn."""
+    chat_message.clear_intern_table()
+    if trace_memory:
+        tracemalloc.start()
+    elapsed = 0.0
+    turns = 0
+    for end in range(2, len(history) + 1, 2 * every):
+        # Dash hands the callback a freshly decoded copy of the store every time
+        stored = json.loads(json.dumps(history[:end]))
+        start = time.perf_counter()
+        turn_fn(stored)
+        elapsed += time.perf_counter() - start
+        turns += 1
+    del stored
+    if not trace_memory:
+        return {'turns_measured': turns,
+                'cpu_ms_total': round(elapsed * 1000, 1),
+                'cpu_ms_per_turn': round(elapsed * 1000 / max(turns, 1), 3)}
+    # Retained memory is what outlives the callbacks (the interned messages and their fields)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'retained_kb': round(current / 1024, 1), 'peak_kb': round(peak / 1024, 1)}
+
+
+def measure(history: list, turn_fn, every: int) -> dict:
+    """CPU time from an untraced replay, memory from a second replay under tracemalloc."""
+    result = run_pipeline(history, turn_fn, every)
+    result.update(run_pipeline(history, turn_fn, every, trace_memory=True))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark message dicts against ChatMessage')
+    parser.add_argument('--turns', type=int, default=1000, help='User/assistant exchanges in the session')
+    parser.add_argument('--every', type=int, default=10, help='Measure every Nth turn (the full replay is quadratic)')
+    parser.add_argument('--json', action='store_true', help='Print the raw results as JSON')
+    args = parser.parse_args()
+
+    history = build_session(args.turns)
+    results = {
+        'turns': args.turns,
+        'messages': len(history),
+        'dicts': measure(history, _dict_turn, args.every),
+        'chat_message': measure(history, _chat_message_turn, args.every),
+    }
+    base, new = results['dicts'], results['chat_message']
+    results['cpu_speedup'] = round(base['cpu_ms_total'] / max(new['cpu_ms_total'], 1e-9), 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.turns} turns ({len(history)} messages), measured every {args.every} turn(s)")
+    print(f"{'':14} {'ms/turn':>10} {'retained KB':>12} {'peak KB':>10}")
+    for name in ('dicts', 'chat_message'):
+        r = results[name]
+        print(f"{name:14} {r['cpu_ms_per_turn']:>10} {r['retained_kb']:>12} {r['peak_kb']:>10}")
+    print(f"CPU speedup: {results['cpu_speedup']}x on this machine (varies with hardware, Python and --turns)")
+
+
+if __name__ == '__main__':
+    main()
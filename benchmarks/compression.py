@@ -0,0 +1,144 @@
+"""
+Bytes on the wire and latency of compressed agent calls by history length
+
+Starts a local mock serving endpoint (HTTP on 127.0.0.1) that decodes the
+request body, and answers with a multi-chunk agent "output" response
+compressed according to Accept-Encoding. The link is modelled by sleeping
+for the transfer time of the bytes actually sent at --bandwidth-mbps in each
+direction, so compression trades CPU time against transfer time the way it
+does across a real network.
+
+For each conversation length, every request is sent through
+CompressedServingClient with each available encoding, and the report shows
+request/response bytes on the wire and the median end-to-end latency. The
+size of the chat callback response carrying chat-history-store is reported
+alongside, as sent with CallbackCompression.
+
+Usage:
+    python -m benchmarks.compression
+    python -m benchmarks.compression --turns 10 100 500 --bandwidth-mbps 10 --json
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.chat_messages import build_session
+from compression import CompressedServingClient, available_encodings, compress, decompress
+
+
+def _agent_response(messages: list) -> dict:
+    """A multi-chunk agent answer that grows (up to a point) with the conversation."""
+    chunks = [{'type': 'output_text', 'text': m['content']}
+              for m in messages[-12:] if m['role'] == 'assistant']
+    return {'output': [{'type': 'message', 'role': 'assistant', 'content': chunks}]}
+
+
+def start_mock_endpoint(bandwidth_mbps: float, min_bytes: int):
+    """Serve the mock endpoint in a background thread; returns (server, base URL)."""
+    seconds_per_byte = 8 / (bandwidth_mbps * 1_000_000)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(len(body) * seconds_per_byte)
+            inputs = json.loads(decompress(body, self.headers.get('Content-Encoding', 'identity')))
+
+            data = json.dumps(_agent_response(inputs['input'])).encode('utf-8')
+            accepted = [e.strip() for e in self.headers.get('Accept-Encoding', '').split(',')]
+            encoding = next((e for e in available_encodings() if e in accepted), 'identity')
+            if len(data) < min_bytes:
+                encoding = 'identity'
+            data = compress(data, encoding)
+            time.sleep(len(data) * seconds_per_byte)
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if encoding != 'identity':
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def measure(url: str, messages: list, encoding: str, min_bytes: int, repeats: int) -> dict:
+    client = CompressedServingClient(url, auth=dict, encoding=encoding, min_bytes=min_bytes)
+    inputs = {'input': messages, 'max_tokens': 1024}
+    client.predict('bench', inputs)  # connect and warm up
+    client.stats = dict.fromkeys(client.stats, 0)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        client.predict('bench', inputs)
+        latencies.append(time.perf_counter() - start)
+    stats = client.stats
+    return {
+        'request_bytes': stats['request_bytes_sent'] // repeats,
+        'response_bytes': stats['response_bytes_received'] // repeats,
+        'latency_ms': round(statistics.median(latencies) * 1000, 2),
+    }
+
+
+def callback_bytes(messages: list, encoding: str, min_bytes: int) -> int:
+    """Size of a chat callback response carrying chat-history-store."""
+    data = json.dumps({'multi': True, 'response': {'chat-history-store': {'data': messages}}}).encode('utf-8')
+    return len(compress(data, encoding if len(data) >= min_bytes else 'identity'))
+
+
+def run(turns_list: list, bandwidth_mbps: float, min_bytes: int, repeats: int) -> list:
+    server, url = start_mock_endpoint(bandwidth_mbps, min_bytes)
+    encodings = ('identity',) + available_encodings()
+    results = []
+    try:
+        for turns in turns_list:
+            messages = build_session(turns)
+            row = {'turns': turns, 'raw_request_bytes': len(json.dumps({'input': messages, 'max_tokens': 1024}))}
+            for encoding in encodings:
+                row[encoding] = measure(url, messages, encoding, min_bytes, repeats)
+                row[encoding]['callback_bytes'] = callback_bytes(
+                    messages, 'gzip' if encoding != 'identity' else 'identity', min_bytes)
+            results.append(row)
+    finally:
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compressed serving-endpoint calls')
+    parser.add_argument('--turns', type=int, nargs='+', default=[1, 10, 50, 200, 1000],
+                        help='Conversation lengths (user/assistant exchanges)')
+    parser.add_argument('--bandwidth-mbps', type=float, default=20.0, help='Modelled link bandwidth')
+    parser.add_argument('--min-bytes', type=int, default=1024, help='Compression threshold')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print the raw results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.turns, args.bandwidth_mbps, args.min_bytes, args.repeats)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Link: {args.bandwidth_mbps:g} Mbit/s each way, threshold {args.min_bytes} bytes")
+    print(f"{'turns':>6} {'encoding':>9} {'request B':>11} {'response B':>11} {'callback B':>11} {'latency ms':>11}")
+    for row in results:
+        for encoding in ('identity',) + available_encodings():
+            r = row[encoding]
+            print(f"{row['turns']:>6} {encoding:>9} {r['request_bytes']:>11} {r['response_bytes']:>11} "
+                  f"{r['callback_bytes']:>11} {r['latency_ms']:>11}")
+
+
+if __name__ == '__main__':
+    main()
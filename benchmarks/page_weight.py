@@ -0,0 +1,164 @@
+"""
+Page-weight and first-paint benchmark for the chatbot page
+
+Loads the app in-process through Flask's test client (no network, no
+serving endpoint needed), fetches the index page and every resource it
+references, and reports:
+
+- bytes transferred on a first visit and on a repeat visit (resources with
+  a fresh Cache-Control max-age are served from the browser cache; the rest
+  are revalidated with If-None-Match / If-Modified-Since)
+- render-blocking resources in <head> and whether any of them is on an
+  external host, i.e. whether first paint waits on a CDN
+- server time to produce each response
+
+Usage:
+    python -m benchmarks.page_weight
+    python -m benchmarks.page_weight --encoding identity --json
+"""
+
+import argparse
+import json
+import re
+import time
+
+_TAG_RE = re.compile(r'<(link|script)\b([^>]*)>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([\w-]+)(?:="([^"]*)")?')
+_CSS_URL_RE = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def _resources(html: str) -> list[dict]:
+    """Extract linked stylesheets, preloads and scripts from the index HTML."""
+    head_end = html.find('</head>')
+    resources = []
+    for match in _TAG_RE.finditer(html):
+        attrs = {k.lower(): v for k, v in _ATTR_RE.findall(match.group(2))}
+        url = attrs.get('href') or attrs.get('src')
+        if not url:
+            continue
+        rel = attrs.get('rel', '')
+        if match.group(1).lower() == 'link' and rel not in ('stylesheet', 'preload'):
+            continue
+        in_head = match.start() < head_end
+        blocking = in_head and (rel == 'stylesheet' or (match.group(1).lower() == 'script'
+                                                         and 'async' not in attrs and 'defer' not in attrs))
+        resources.append({'url': url, 'kind': rel or 'script', 'render_blocking': blocking or rel == 'preload'})
+    return resources
+
+
+def _fetch(client, url: str, encoding: str, headers: dict = None):
+    request_headers = {'Accept-Encoding': encoding}
+    request_headers.update(headers or {})
+    start = time.perf_counter()
+    response = client.get(url, headers=request_headers)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    body = response.get_data()
+    return response, len(body), elapsed_ms
+
+
+def _is_fresh(response) -> bool:
+    match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+    return bool(match and int(match.group(1)) > 0 and 'no-cache' not in response.headers.get('Cache-Control', ''))
+
+
+def run(encoding: str) -> dict:
+    from app import app
+
+    client = app.server.test_client()
+    index_response, index_bytes, index_ms = _fetch(client, '/', encoding)
+    html = index_response.get_data(as_text=True)
+    resources = _resources(html)
+
+    # Resources the page fetches from JavaScript before anything is shown
+    resources += [
+        {'url': '/_dash-layout', 'kind': 'xhr', 'render_blocking': False},
+        {'url': '/_dash-dependencies', 'kind': 'xhr', 'render_blocking': False},
+    ]
+
+    rows = []
+    seen = set()
+    queue = list(resources)
+    while queue:
+        resource = queue.pop(0)
+        url = resource['url']
+        if url in seen:
+            continue
+        seen.add(url)
+
+        if url.startswith(('http://', 'https://', '//')):
+            rows.append(dict(resource, external=True, status=None, bytes=None,
+                             repeat_bytes=None, server_ms=None, cache_control=''))
+            continue
+
+        response, size, elapsed_ms = _fetch(client, url, encoding)
+
+        # Simulate the repeat visit
+        if _is_fresh(response):
+            repeat_bytes = 0
+        else:
+            conditional = {}
+            if response.headers.get('ETag'):
+                conditional['If-None-Match'] = response.headers['ETag']
+            if response.headers.get('Last-Modified'):
+                conditional['If-Modified-Since'] = response.headers['Last-Modified']
+            _, repeat_bytes, _ = _fetch(client, url, encoding, conditional)
+
+        rows.append(dict(resource, external=False, status=response.status_code, bytes=size,
+                         repeat_bytes=repeat_bytes, server_ms=elapsed_ms,
+                         cache_control=response.headers.get('Cache-Control', ''),
+                         content_encoding=response.headers.get('Content-Encoding', 'identity')))
+
+        # Follow url(...) references (fonts, images) from stylesheets
+        if response.mimetype == 'text/css' and response.status_code == 200:
+            css = client.get(url).get_data(as_text=True)
+            for _, ref in _CSS_URL_RE.findall(css):
+                if not ref.startswith('data:'):
+                    queue.append({'url': ref, 'kind': 'css-ref', 'render_blocking': False})
+
+    local = [r for r in rows if not r['external']]
+    blocking = [r for r in rows if r['render_blocking']]
+    return {
+        'encoding': encoding,
+        'index_bytes': index_bytes,
+        'index_ms': index_ms,
+        'resources': rows,
+        'first_visit_bytes': index_bytes + sum(r['bytes'] for r in local),
+        'repeat_visit_bytes': index_bytes + sum(r['repeat_bytes'] for r in local),
+        'render_blocking_bytes': sum(r['bytes'] or 0 for r in blocking),
+        'render_blocking_external': [r['url'] for r in blocking if r['external']],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure chatbot page weight and first-paint dependencies')
+    parser.add_argument('--encoding', default='br, gzip', help='Accept-Encoding header to send')
+    parser.add_argument('--json', action='store_true', help='Print the full result as JSON')
+    args = parser.parse_args()
+
+    result = run(args.encoding)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"\n📊 Page weight (Accept-Encoding: {result['encoding']})")
+    print(f"   {'resource':<70} {'enc':>8} {'first':>10} {'repeat':>8} {'ms':>7}")
+    for r in result['resources']:
+        if r['external']:
+            print(f"   {r['url'][:70]:<70} {'EXTERNAL':>8}")
+            continue
+        print(f"   {r['url'][:70]:<70} {r['content_encoding']:>8} {r['bytes']:>10,} "
+              f"{r['repeat_bytes']:>8,} {r['server_ms']:>7.1f}")
+    print(f"\n   First visit:  {result['first_visit_bytes']:>10,} bytes")
+    print(f"   Repeat visit: {result['repeat_visit_bytes']:>10,} bytes")
+    print(f"   Render-blocking (same origin): {result['render_blocking_bytes']:,} bytes")
+    if result['render_blocking_external']:
+        print("   ⚠️  First paint waits on external hosts:")
+        for url in result['render_blocking_external']:
+            print(f"      {url}")
+    else:
+        print("   ✅ No external requests on the first-paint path")
+
+
+if __name__ == '__main__':
+    main()
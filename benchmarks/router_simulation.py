@@ -0,0 +1,133 @@
+"""
+Exercise EndpointRouter against local mock serving endpoints
+
+Each mock endpoint has its own latency profile and can be scripted to fail
+or slow down for a window of time (e.g. scaling from zero). The simulation
+drives concurrent traffic through the router and prints how requests were
+distributed, how many failed over and the latency percentiles, followed by
+the router's /metrics snapshot.
+
+Usage:
+    python -m benchmarks.router_simulation
+    python -m benchmarks.router_simulation --requests 2000 --concurrency 16
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_serving_utils import EndpointRouter
+
+
+class MockEndpoint:
+    """A fake serving endpoint with scripted latency and outages"""
+
+    def __init__(self, name: str, latency: float, jitter: float = 0.2,
+                 down_between: tuple = None, slow_between: tuple = None, slow_factor: float = 10.0):
+        """
+        Args:
+            name: Endpoint name
+            latency: Median response time in seconds
+            jitter: Relative latency jitter
+            down_between: (start, end) seconds since simulation start during which every call fails
+            slow_between: (start, end) seconds during which latency is multiplied by slow_factor
+            slow_factor: Latency multiplier inside slow_between
+        """
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.down_between = down_between
+        self.slow_between = slow_between
+        self.slow_factor = slow_factor
+        self.started_at = time.time()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _within(self, window) -> bool:
+        if not window:
+            return False
+        elapsed = time.time() - self.started_at
+        return window[0] <= elapsed < window[1]
+
+    def __call__(self, messages, max_tokens):
+        with self._lock:
+            self.calls += 1
+        latency = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self._within(self.slow_between):
+            latency *= self.slow_factor
+        time.sleep(latency)
+        if self._within(self.down_between):
+            raise Exception(f"{self.name}: 503 Service Unavailable")
+        return {'role': 'assistant', 'content': f"answer from {self.name}"}
+
+
+def run(requests: int, concurrency: int, time_scale: float) -> dict:
+    mocks = {
+        'ka-primary': MockEndpoint('ka-primary', latency=0.05 * time_scale,
+                                   down_between=(1.0, 3.0)),
+        'ka-secondary': MockEndpoint('ka-secondary', latency=0.08 * time_scale,
+                                     slow_between=(4.0, 5.0)),
+        'ka-cold': MockEndpoint('ka-cold', latency=0.04 * time_scale,
+                                slow_between=(0.0, 1.5), slow_factor=20.0),
+    }
+    router = EndpointRouter(
+        [('ka-primary', 3.0), ('ka-secondary', 1.0), ('ka-cold', 1.0)],
+        query_fn=lambda name, messages, max_tokens: mocks[name](messages, max_tokens),
+        cooldown_seconds=0.5,
+        slow_start_seconds=1.0,
+        decay_seconds=2.0,
+        initial_latency=0.1,
+    )
+
+    latencies = []
+    answered_by = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def one_request(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            response = router.query([{'role': 'user', 'content': f"question {i}"}], max_tokens=64)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            answered_by[response['endpoint']] = answered_by.get(response['endpoint'], 0) + 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(requests)))
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': requests,
+        'errors': errors,
+        'answered_by': answered_by,
+        'p50_ms': round(quantiles[49] * 1000, 1),
+        'p95_ms': round(quantiles[94] * 1000, 1),
+        'p99_ms': round(quantiles[98] * 1000, 1),
+        'router': router.metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate routed traffic across mock serving endpoints')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Multiply mock latencies')
+    args = parser.parse_args()
+
+    result = run(args.requests, args.concurrency, args.time_scale)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
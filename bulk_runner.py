@@ -0,0 +1,284 @@
+"""
+Run a file of customer questions through the agent from the command line
+
+Input is JSONL, one question per line, either {"id": ..., "question": "..."}
+or {"id": ..., "messages": [{"role": ..., "content": ...}, ...]}; lines without
+an id are identified by their line number. Lines are read lazily, so the
+input can be arbitrarily large.
+
+Questions run on a thread pool at --concurrency with a token bucket capping
+the request rate (--rate per second). Each result is appended to the output
+JSONL as soon as it completes, so the output file doubles as the checkpoint:
+re-running with the same --output skips every id already answered (and,
+with --retry-errors, re-runs the ones that failed). Ctrl-C stops taking new
+questions, lets in-flight ones finish and still prints the report; a second
+Ctrl-C writes whatever has completed and abandons the rest, which the next
+run picks up from the checkpoint.
+
+Answers go through the chatbot's response cache: questions already cached
+are answered from it, and every new answer is written to it. With
+SHARED_CACHE_PATH pointing at the app's shared cache, a bulk run therefore
+pre-populates the cache the app serves from (use --no-cache to bypass it).
+
+    python bulk_runner.py questions.jsonl --output answers.jsonl --concurrency 8 --rate 4
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from admission_control import TokenBucket
+from response_cache import ResponseCache
+
+
+def read_questions(path: str):
+    """Yield (id, messages) for every usable line of a JSONL question file."""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️  Skipping line {line_number}: {e}", file=sys.stderr)
+                continue
+            if isinstance(item, str):
+                item = {'question': item}
+            messages = item.get('messages') or [{'role': 'user', 'content': item.get('question', '')}]
+            if not messages[-1].get('content'):
+                print(f"⚠️  Skipping line {line_number}: no question", file=sys.stderr)
+                continue
+            yield str(item.get('id', line_number)), messages
+
+
+def load_checkpoint(output_path: str, retry_errors: bool) -> set:
+    """Ids already present in the output file (only successful ones with retry_errors)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interruption
+                continue
+            if retry_errors and result.get('error'):
+                continue
+            done.add(str(result['id']))
+    return done
+
+
+class BulkRunner:
+    """Runs questions concurrently and rate limited, writing results as they finish"""
+
+    def __init__(self, query_fn, concurrency: int = 4, rate: float = 2.0, burst: float = None,
+                 max_tokens: int = 2048, retries: int = 2, cache: ResponseCache = None):
+        """
+        Args:
+            query_fn: Callable (messages, max_tokens) -> response message dict
+            concurrency: Questions in flight at once
+            rate: Requests started per second (token bucket refill rate)
+            burst: Token bucket capacity (default: concurrency)
+            max_tokens: Maximum tokens to generate per answer
+            retries: Extra attempts per question after a failure, with exponential backoff
+            cache: Response cache answers are read from and written to, as by the chatbot
+        """
+        self.query_fn = query_fn
+        self.cache = cache
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst or concurrency)
+        self.max_tokens = max_tokens
+        self.retries = retries
+        self.latencies = []
+        self.answered_by = {}
+        self.errors = 0
+        self.cached = 0
+        self.tokens = {'prompt_tokens': 0, 'completion_tokens': 0}
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _run_one(self, question_id: str, messages: list[dict]) -> dict:
+        result = {'id': question_id, 'question': messages[-1]['content']}
+        if self.cache is not None:
+            cached = self.cache.get_for(messages)
+            if cached is not None:
+                result.update(answer=cached, cached=True, latency_ms=0.0, attempts=0)
+                return result
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.query_fn(messages, self.max_tokens)
+            except Exception as e:
+                result['error'] = str(e)[:500]
+                if attempt < self.retries and not self._stop.is_set():
+                    time.sleep(min(30.0, 2 ** attempt))
+                    continue
+                break
+            result.pop('error', None)
+            result['answer'] = response.get('content', '')
+            if self.cache is not None and result['answer']:
+                self.cache.put_for(messages, result['answer'])
+            for key in ('endpoint', 'usage'):
+                if key in response:
+                    result[key] = response[key]
+            break
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        result['attempts'] = attempt + 1
+        return result
+
+    def _record(self, result: dict, out) -> None:
+        with self._write_lock:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            if result.get('error'):
+                self.errors += 1
+            elif result.get('cached'):
+                self.cached += 1
+            else:
+                self.latencies.append(result['latency_ms'])
+                endpoint = result.get('endpoint')
+                if endpoint:
+                    self.answered_by[endpoint] = self.answered_by.get(endpoint, 0) + 1
+                for key in self.tokens:
+                    self.tokens[key] += result.get('usage', {}).get(key, 0)
+
+    def run(self, questions, output_path: str, skip: set = frozenset(), progress_every: int = 50) -> dict:
+        """
+        Run every question not in skip, appending results to output_path.
+
+        Only a bounded number of questions is held in memory at a time, so the
+        input iterator is consumed lazily.
+        """
+        started = time.perf_counter()
+        completed = skipped = 0
+        max_pending = self.concurrency * 2
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bulk')
+        abandon = False
+        with open(output_path, 'a', encoding='utf-8') as out:
+            pending = set()
+
+            def record_done():
+                """Write every finished result, so nothing completed is lost on an interrupt."""
+                nonlocal completed
+                for future in [f for f in pending if f.done()]:
+                    pending.discard(future)
+                    if future.cancelled():
+                        continue
+                    self._record(future.result(), out)
+                    completed += 1
+                    if progress_every and completed % progress_every == 0:
+                        elapsed = time.perf_counter() - started
+                        print(f"   {completed} done ({completed / elapsed:.1f}/s, {self.errors} errors)",
+                              file=sys.stderr)
+
+            def drain(block_until_below: int):
+                while len(pending) >= block_until_below:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                    record_done()
+
+            try:
+                for question_id, messages in questions:
+                    if question_id in skip:
+                        skipped += 1
+                        continue
+                    drain(max_pending)
+                    pending.add(pool.submit(self._run_one, question_id, messages))
+                drain(1)
+            except KeyboardInterrupt:
+                self._stop.set()
+                record_done()
+                print(f"⏹️ Interrupted, finishing {len(pending)} in-flight question(s) "
+                      f"(Ctrl-C again to stop now)...", file=sys.stderr)
+                try:
+                    drain(1)
+                except KeyboardInterrupt:
+                    abandon = True
+                    record_done()
+                    print(f"⏹️ Stopped; {len(pending)} unfinished question(s) will run on the next resume",
+                          file=sys.stderr)
+            finally:
+                pool.shutdown(wait=not abandon, cancel_futures=True)
+
+        return self.report(completed, skipped, time.perf_counter() - started)
+
+    def report(self, completed: int, skipped: int, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        result = {
+            'completed': completed,
+            'succeeded': completed - self.errors,
+            'errors': self.errors,
+            'from_cache': self.cached,
+            'skipped_from_checkpoint': skipped,
+            'elapsed_seconds': round(elapsed, 1),
+            'throughput_per_second': round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+            'answered_by': self.answered_by,
+            'tokens': self.tokens,
+        }
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            result.update(
+                mean_ms=round(statistics.fmean(latencies), 1),
+                p50_ms=round(quantiles[49], 1),
+                p95_ms=round(quantiles[94], 1),
+                p99_ms=round(quantiles[98], 1),
+            )
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a JSONL file of questions through the agent endpoint')
+    parser.add_argument('input', help='JSONL file of questions')
+    parser.add_argument('--output', required=True, help='JSONL file results are appended to (also the checkpoint)')
+    parser.add_argument('--endpoint', default=os.getenv('SERVING_ENDPOINT'),
+                        help='Endpoint name or weighted list (default: SERVING_ENDPOINT)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help='Requests started per second')
+    parser.add_argument('--max-tokens', type=int, default=2048)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--retry-errors', action='store_true', help='Re-run questions that failed last time')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Neither read nor write the response cache (default: warm it, see SHARED_CACHE_PATH)')
+    parser.add_argument('--verbose', action='store_true', help='Show per-request endpoint logs')
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        parser.error('--endpoint or SERVING_ENDPOINT is required')
+
+    from model_serving_utils import EndpointRouter
+    from shared_cache import SharedCache
+
+    cache = None
+    if not args.no_cache:
+        # The same cache the chatbot reads; only the shared tier outlives this process
+        cache = ResponseCache(shared=SharedCache.from_env())
+        if cache.shared is None:
+            print("⚠️  SHARED_CACHE_PATH is not set, so answers are cached for this run only "
+                  "and will not warm the app", file=sys.stderr)
+
+    router = EndpointRouter.from_spec(args.endpoint)
+    runner = BulkRunner(router.query, concurrency=args.concurrency, rate=args.rate,
+                        max_tokens=args.max_tokens, retries=args.retries, cache=cache)
+    done = load_checkpoint(args.output, args.retry_errors)
+    if done:
+        print(f"↩️ Resuming: {len(done)} question(s) already in {args.output}", file=sys.stderr)
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        result = runner.run(read_questions(args.input), args.output, skip=done)
+    result['router'] = router.metrics()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
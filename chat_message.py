@@ -0,0 +1,177 @@
+"""
+Compact chat message model shared across the chat pipeline
+
+Conversations are stored in the browser as plain {'role', 'content'} dicts,
+but on the server every turn re-derives the same things from every message:
+the normalised text and fingerprint for cache keys, a token estimate for
+the context window, and the paragraph/line split for rendering.
+
+ChatMessage is an immutable message with __slots__ and an interned role
+that computes those derived fields on first use and keeps them. Messages
+coming from the store are interned too (from_dict returns the same object
+for the same role and content, within a bounded table), so the cached
+fields survive from one callback to the next instead of being recomputed
+for the whole history on every turn.
+
+ChatMessage also behaves like the dicts it replaces (msg['role'],
+msg.get('content')), so code that only reads messages accepts either.
+"""
+
+import sys
+
+from memory_budget import evictable_lru_cache
+from response_cache import message_digest, normalize_text
+from token_policy import estimate_tokens
+
+# Per-message overhead of the chat format (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+INTERN_TABLE_SIZE = 65536
+
+# Approximate bytes of a message beyond its content: the object, digest, dict and
+# paragraph tuples (the normalised text is counted as a second copy of the content)
+MESSAGE_FIELDS_BYTES = 600
+
+
+def paragraph_segments(content: str) -> tuple:
+    """Split message text into paragraphs (blank-line separated) of non-empty lines."""
+    paragraphs = []
+    for para in content.split('\n\n'):
+        if para.strip():
+            lines = tuple(line for line in para.split('\n') if line.strip())
+            if lines:
+                paragraphs.append(lines)
+    return tuple(paragraphs)
+
+
+class ChatMessage:
+    """One chat message with lazily cached derived fields"""
+
+    __slots__ = ('role', 'content', '_hash', '_normalized', '_digest', '_tokens', '_paragraphs', '_dict')
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(str(role))
+        self.content = str(content)
+        self._hash = None
+        self._normalized = None
+        self._digest = None
+        self._tokens = None
+        self._paragraphs = None
+        self._dict = None
+
+    @staticmethod
+    def intern(role: str, content: str) -> "ChatMessage":
+        """The shared ChatMessage for a role and content (created on first use)."""
+        return _intern(sys.intern(str(role)), str(content))
+
+    @classmethod
+    def from_dict(cls, message) -> "ChatMessage":
+        """The (interned) ChatMessage for a stored message dict; ChatMessages are returned as-is."""
+        if isinstance(message, ChatMessage):
+            return message
+        return cls.intern(message['role'], message['content'])
+
+    @classmethod
+    def from_store(cls, messages) -> list:
+        """Convert chat-history-store data into ChatMessages, skipping malformed entries."""
+        return [cls.from_dict(m) for m in messages or []
+                if isinstance(m, ChatMessage) or (isinstance(m, dict) and 'role' in m and 'content' in m)]
+
+    @staticmethod
+    def to_store(messages) -> list:
+        """Convert messages back into JSON-serialisable dicts for chat-history-store."""
+        return [m.to_dict() if isinstance(m, ChatMessage) else m for m in messages]
+
+    def to_dict(self) -> dict:
+        """{'role', 'content'} for JSON payloads; the same dict is reused, so do not mutate it."""
+        if self._dict is None:
+            self._dict = {'role': self.role, 'content': self.content}
+        return self._dict
+
+    # Derived fields, computed once per message
+
+    @property
+    def normalized(self) -> str:
+        if self._normalized is None:
+            self._normalized = normalize_text(self.content)
+        return self._normalized
+
+    @property
+    def digest(self) -> str:
+        """Fingerprint of the normalised message (see response_cache.conversation_key)"""
+        if self._digest is None:
+            self._digest = message_digest(self.role, self.normalized)
+        return self._digest
+
+    @property
+    def tokens(self) -> int:
+        """Estimated prompt tokens, including the per-message overhead"""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.content) + MESSAGE_OVERHEAD_TOKENS
+        return self._tokens
+
+    @property
+    def paragraphs(self) -> tuple:
+        """Rendered paragraph segments: a tuple of paragraphs, each a tuple of lines"""
+        if self._paragraphs is None:
+            self._paragraphs = paragraph_segments(self.content)
+        return self._paragraphs
+
+    # Read-only dict compatibility
+
+    def __getitem__(self, key):
+        if key == 'role':
+            return self.role
+        if key == 'content':
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        return key in ('role', 'content')
+
+    def __eq__(self, other):
+        if isinstance(other, ChatMessage):
+            return self is other or (self.role == other.role and self.content == other.content)
+        return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.role, self.content))
+        return self._hash
+
+    def __repr__(self):
+        preview = self.content if len(self.content) <= 40 else self.content[:37] + '...'
+        return f"ChatMessage({self.role!r}, {preview!r})"
+
+
+_interned_content = {'messages': 0, 'bytes': 0}
+
+
+@evictable_lru_cache(maxsize=INTERN_TABLE_SIZE)
+def _intern(role: str, content: str) -> ChatMessage:
+    _interned_content['messages'] += 1
+    _interned_content['bytes'] += sys.getsizeof(content)
+    return ChatMessage(role, content)
+
+
+def intern_table_size() -> int:
+    """Approximate bytes held by the interned messages and their cached fields (see memory_budget)."""
+    average_content = _interned_content['bytes'] // max(_interned_content['messages'], 1)
+    return len(_intern) * (2 * average_content + MESSAGE_FIELDS_BYTES)
+
+
+def clear_intern_table(target_bytes: int = 0, idle_seconds: float = 0) -> int:
+    """
+    Drop the least recently used interned messages until about target_bytes are freed
+    (the whole table by default); evicted messages are re-interned on their next turn.
+    """
+    freed = _intern.evict_bytes(target_bytes, intern_table_size)
+    if not len(_intern):
+        _interned_content.update(messages=0, bytes=0)
+    return freed
@@ -0,0 +1,270 @@
+"""
+Compressed transport for serving-endpoint calls and Dash callback responses
+
+Long conversations make both hops heavy: _query_endpoint posts the whole
+conversation on every turn, multi-chunk agent answers come back as large
+JSON documents, and every chat callback response carries chat-history-store
+back to the browser. All of it is repetitive JSON that compresses well.
+
+CompressedServingClient is an opt-in drop-in for the MLflow deployment
+client's predict() that talks to the serving REST API directly over one
+pooled session, so the encoding can be negotiated:
+
+- responses: Accept-Encoding advertises zstd (when the zstandard package is
+  installed and urllib3 can decode it) and gzip, and the body is decoded
+  transparently
+- requests: bodies of at least min_bytes are sent compressed with
+  Content-Encoding. An endpoint that rejects an encoding (HTTP 415) is
+  retried once uncompressed and remembered, so it is only sent identity
+  bodies from then on
+- transient failures (408, 429, 5xx) are retried with exponential backoff
+  and jitter, honouring Retry-After, like the MLflow client does while an
+  endpoint scales from zero; the MLFLOW_HTTP_REQUEST_MAX_RETRIES,
+  _BACKOFF_FACTOR and _BACKOFF_JITTER settings apply to both
+
+CallbackCompression compresses /_dash-update-component responses of at
+least min_bytes with the best encoding the browser accepts (brotli when the
+brotli package is installed, then gzip). Small payloads skip compression
+either way, since a few hundred bytes do not repay the CPU time.
+
+SERVING_COMPRESSION=off (default: use the MLflow client unchanged) | auto
+(zstd when available, else gzip) | zstd | gzip. DASH_COMPRESSION=true|false.
+COMPRESSION_MIN_BYTES sets the threshold for both (default 1024).
+"""
+
+import gzip
+import json
+import os
+import threading
+
+import flask
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 5
+
+
+def available_encodings() -> tuple:
+    """Content-Encodings this process can produce and decode, best first."""
+    return (('zstd',) if zstandard is not None else ()) + ('gzip',)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data with a Content-Encoding ('identity' returns it unchanged)."""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'identity':
+        return data
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Reverse compress()."""
+    if encoding in ('', 'identity'):
+        return data
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if encoding == 'br' and brotli is not None:
+        return brotli.decompress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def _response_encodings() -> str:
+    """Accept-Encoding for serving responses: only what the HTTP stack decodes for us."""
+    from urllib3.util.request import ACCEPT_ENCODING
+
+    accepted = [e.strip() for e in ACCEPT_ENCODING.split(',')]
+    return ', '.join(e for e in ('zstd', 'gzip') if e in accepted)
+
+
+def _min_bytes() -> int:
+    return int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+
+
+class ServingError(Exception):
+    """A serving endpoint answered with an HTTP error"""
+
+    def __init__(self, endpoint: str, status: int, body: str):
+        super().__init__(f"Endpoint {endpoint} returned HTTP {status}: {body[:300]}")
+        self.status = status
+
+
+class CompressedServingClient:
+    """predict() over the serving REST API with negotiated request/response compression"""
+
+    def __init__(self, host: str, auth, encoding: str = None, min_bytes: int = None,
+                 timeout: float = 120.0, session=None, max_retries: int = None,
+                 backoff_factor: float = None, backoff_jitter: float = None):
+        """
+        Args:
+            host: Workspace URL, e.g. https://adb-123.azuredatabricks.net
+            auth: Callable returning the auth headers for a request
+            encoding: Request body encoding ('zstd', 'gzip', 'auto' or 'identity')
+            min_bytes: Bodies smaller than this are sent uncompressed
+            timeout: Request timeout in seconds
+            session: requests.Session to use (default: a new pooled session with retries)
+            max_retries: Retries of transient failures (default: MLFLOW_HTTP_REQUEST_MAX_RETRIES or 7)
+            backoff_factor: Exponential backoff factor in seconds
+                (default: MLFLOW_HTTP_REQUEST_BACKOFF_FACTOR or 2)
+            backoff_jitter: Random extra backoff in seconds (default: MLFLOW_HTTP_REQUEST_BACKOFF_JITTER or 1)
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.host = host.rstrip('/')
+        self.auth = auth
+        encoding = encoding or 'auto'
+        self.encoding = available_encodings()[0] if encoding == 'auto' else encoding
+        if self.encoding not in available_encodings() + ('identity',):
+            raise ValueError(f"Encoding {self.encoding!r} is not available (have {available_encodings()})")
+        self.min_bytes = min_bytes if min_bytes is not None else _min_bytes()
+        self.timeout = timeout
+        if session is None:
+            retry = Retry(
+                total=max_retries if max_retries is not None
+                else int(os.getenv('MLFLOW_HTTP_REQUEST_MAX_RETRIES', '7')),
+                backoff_factor=backoff_factor if backoff_factor is not None
+                else float(os.getenv('MLFLOW_HTTP_REQUEST_BACKOFF_FACTOR', '2')),
+                backoff_jitter=backoff_jitter if backoff_jitter is not None
+                else float(os.getenv('MLFLOW_HTTP_REQUEST_BACKOFF_JITTER', '1.0')),
+                status_forcelist=TRANSIENT_STATUS_CODES,
+                allowed_methods=None,  # predict is a POST, but retrying it is safe
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(max_retries=retry)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        # 'identity' turns compression off in both directions (used as the benchmark baseline)
+        self._accept_encoding = 'identity' if self.encoding == 'identity' else _response_encodings()
+        self._identity_only = set()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'request_bytes_raw': 0, 'request_bytes_sent': 0,
+                      'response_bytes_raw': 0, 'response_bytes_received': 0,
+                      'compressed_requests': 0, 'encoding_rejected': 0}
+
+    @classmethod
+    def from_env(cls):
+        """The client configured by SERVING_COMPRESSION, or None when it is off (the default)."""
+        encoding = os.getenv('SERVING_COMPRESSION', 'off').lower()
+        if encoding in ('off', 'false', 'identity', 'none'):
+            return None
+        from databricks.sdk.core import Config
+
+        config = Config()
+        return cls(config.host, config.authenticate, encoding=encoding)
+
+    def predict(self, endpoint: str, inputs) -> dict:
+        """POST inputs to an endpoint's invocations URL and return the decoded JSON response."""
+        raw = json.dumps(inputs).encode('utf-8')
+        encoding = self.encoding
+        if len(raw) < self.min_bytes or endpoint in self._identity_only:
+            encoding = 'identity'
+
+        response = self._post(endpoint, raw, encoding)
+        if encoding != 'identity' and response.status_code == 415:
+            print(f"   Endpoint {endpoint} does not accept {encoding} request bodies; sending them uncompressed")
+            with self._lock:
+                self._identity_only.add(endpoint)
+                self.stats['encoding_rejected'] += 1
+            response = self._post(endpoint, raw, 'identity')
+
+        if response.status_code >= 400:
+            raise ServingError(endpoint, response.status_code, response.text)
+        return response.json()
+
+    def _post(self, endpoint: str, raw: bytes, encoding: str):
+        body = compress(raw, encoding)
+        headers = dict(self.auth())
+        headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': self._accept_encoding,
+        })
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        response = self.session.post(f"{self.host}/serving-endpoints/{endpoint}/invocations",
+                                     data=body, headers=headers, timeout=self.timeout)
+        wire_bytes = response.headers.get('Content-Length')
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['request_bytes_raw'] += len(raw)
+            self.stats['request_bytes_sent'] += len(body)
+            self.stats['compressed_requests'] += encoding != 'identity'
+            self.stats['response_bytes_raw'] += len(response.content)
+            self.stats['response_bytes_received'] += int(wire_bytes) if wire_bytes else len(response.content)
+        return response
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, encoding=self.encoding, min_bytes=self.min_bytes,
+                        identity_only=sorted(self._identity_only))
+
+
+class CallbackCompression:
+    """Compresses large Dash callback responses"""
+
+    def __init__(self, enabled: bool = None, min_bytes: int = None):
+        """
+        Args:
+            enabled: Compress callback responses (default: DASH_COMPRESSION or true)
+            min_bytes: Responses smaller than this are sent uncompressed (default: COMPRESSION_MIN_BYTES)
+        """
+        self.enabled = (enabled if enabled is not None
+                        else os.getenv('DASH_COMPRESSION', 'true').lower() in ('1', 'true', 'yes'))
+        self.min_bytes = min_bytes if min_bytes is not None else _min_bytes()
+        self._lock = threading.Lock()
+        self.stats = {'responses': 0, 'compressed': 0, 'bytes_raw': 0, 'bytes_sent': 0}
+
+    def _compress_response(self, response):
+        if (not self.enabled
+                or flask.request.path != '/_dash-update-component'
+                or response.status_code != 200
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        data = response.get_data()
+        encoding = 'identity'
+        if len(data) >= self.min_bytes:
+            offered = (('br',) if brotli is not None else ()) + ('gzip',)
+            encoding = flask.request.accept_encodings.best_match(offered) or 'identity'
+        body = compress(data, encoding)
+        with self._lock:
+            self.stats['responses'] += 1
+            self.stats['bytes_raw'] += len(data)
+            self.stats['bytes_sent'] += len(body)
+            self.stats['compressed'] += encoding != 'identity'
+        if encoding != 'identity':
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def register(self, app) -> None:
+        """Compress the callback responses of a Dash app's Flask server."""
+        app.server.after_request(self._compress_response)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, enabled=self.enabled, min_bytes=self.min_bytes)
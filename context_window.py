@@ -0,0 +1,73 @@
+"""
+Context-window management for agent calls
+
+The chatbot keeps the full conversation for display, but the agent only
+needs enough of it to answer the latest question. ContextWindow trims the
+messages sent to the agent to a prompt-token budget: system messages and
+the latest user message are always kept, then earlier turns are added back
+newest first while they fit. Sessions past their soft usage budget (see
+usage_accounting.py) get the tighter compact budget.
+"""
+
+import os
+
+from chat_message import MESSAGE_OVERHEAD_TOKENS
+from token_policy import estimate_tokens
+
+
+def message_tokens(message) -> int:
+    """Estimated prompt tokens of a message (cached on ChatMessages)."""
+    tokens = getattr(message, 'tokens', None)
+    if tokens is not None:
+        return tokens
+    return estimate_tokens(str(message.get('content', ''))) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """Trims conversations to a prompt-token budget before they are sent to the agent"""
+
+    def __init__(self, max_prompt_tokens: int = None, compact_prompt_tokens: int = None):
+        """
+        Args:
+            max_prompt_tokens: Normal prompt budget (default: CONTEXT_MAX_PROMPT_TOKENS or 6000)
+            compact_prompt_tokens: Budget for sessions near their usage limit
+                (default: CONTEXT_COMPACT_PROMPT_TOKENS or 1500)
+        """
+        self.max_prompt_tokens = max_prompt_tokens or int(os.getenv('CONTEXT_MAX_PROMPT_TOKENS', '6000'))
+        self.compact_prompt_tokens = compact_prompt_tokens or int(os.getenv('CONTEXT_COMPACT_PROMPT_TOKENS', '1500'))
+
+    def fit(self, messages: list[dict], compact: bool = False) -> list[dict]:
+        """
+        Return the messages to send for a conversation.
+
+        Args:
+            messages: Full conversation, ending with the user's latest message
+            compact: Use the tighter compact budget
+
+        Returns:
+            The conversation itself if it fits, otherwise a trimmed copy
+        """
+        budget = self.compact_prompt_tokens if compact else self.max_prompt_tokens
+        sizes = [message_tokens(m) for m in messages]
+        if sum(sizes) <= budget or len(messages) <= 1:
+            return messages
+
+        keep = {len(messages) - 1}
+        used = sizes[-1]
+        for i, message in enumerate(messages[:-1]):
+            if message.get('role') == 'system':
+                keep.add(i)
+                used += sizes[i]
+        for i in range(len(messages) - 2, -1, -1):
+            if i in keep:
+                continue
+            if used + sizes[i] > budget:
+                break
+            keep.add(i)
+            used += sizes[i]
+
+        trimmed = [messages[i] for i in sorted(keep)]
+        # Agents expect the conversation after any system prompt to start with the user
+        while len(trimmed) > 1 and trimmed[0].get('role') == 'assistant':
+            trimmed.pop(0)
+        return trimmed
@@ -0,0 +1,148 @@
+"""
+Incremental rolling summaries for ClearScore conversations
+
+Instead of re-sending the whole transcript to ai_summarize() every time a
+summary is needed, each conversation keeps a rolling summary plus a
+watermark (the number of messages already folded into it). Only the turns
+after the watermark are sent, together with the previous summary, so the
+cost of keeping a summary up to date stays proportional to the new turns.
+
+Cached summaries can be read back with get() at no cost, which makes them
+cheap to use for agent handoff, analytics and context compaction.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from memory_budget import approx_size, sampled_size
+
+
+@dataclass
+class RollingSummary:
+    """Rolling summary state for a single conversation"""
+    summary: str
+    watermark: int
+    last_folded: tuple
+    updated_at: float = field(default_factory=time.time)
+
+
+def _message_key(msg: dict) -> tuple:
+    """Cheap identity for a message, used to detect rewritten histories."""
+    return (msg.get('role'), msg.get('content'))
+
+
+class IncrementalSummarizer:
+    """Keeps a per-conversation rolling summary and folds in new turns only"""
+
+    def __init__(self, ai_functions, max_length: int = 200,
+                 min_new_messages: int = 2, max_conversations: int = 1000):
+        """
+        Args:
+            ai_functions: Object exposing fold_summary(previous_summary, messages, max_length),
+                e.g. DatabricksAIFunctions
+            max_length: Maximum length of each summary
+            min_new_messages: Number of new messages required before the summary is refreshed
+            max_conversations: Number of conversations kept in the cache (least recently used are dropped)
+        """
+        self.ai_functions = ai_functions
+        self.max_length = max_length
+        self.min_new_messages = max(1, min_new_messages)
+        self.max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def summarize(self, conversation_id: str, chat_history: list) -> Optional[str]:
+        """
+        Return an up-to-date summary of a conversation, folding in only the
+        messages added since the last call.
+
+        Args:
+            conversation_id: Stable identifier of the conversation
+            chat_history: Full list of message dicts with 'role' and 'content'
+
+        Returns:
+            Summary string, or None if the conversation is empty
+        """
+        if not chat_history:
+            return None
+
+        with self._lock:
+            state = self._summaries.get(conversation_id)
+            if state is not None:
+                self._summaries.move_to_end(conversation_id)
+                state.updated_at = time.time()
+
+        if state is not None and not self._is_continuation(state, chat_history):
+            # The history was cleared or rewritten - start a new summary
+            print(f"🔄 Conversation {conversation_id} changed, restarting rolling summary")
+            state = None
+
+        watermark = state.watermark if state else 0
+        new_messages = chat_history[watermark:]
+
+        if state is not None and len(new_messages) < self.min_new_messages:
+            return state.summary
+
+        summary = self.ai_functions.fold_summary(
+            state.summary if state else None,
+            new_messages,
+            max_length=self.max_length
+        )
+        print(f"📝 Folded {len(new_messages)} new message(s) into summary for {conversation_id}")
+
+        with self._lock:
+            self._summaries[conversation_id] = RollingSummary(
+                summary=summary,
+                watermark=len(chat_history),
+                last_folded=_message_key(chat_history[-1])
+            )
+            self._summaries.move_to_end(conversation_id)
+            while len(self._summaries) > self.max_conversations:
+                self._summaries.popitem(last=False)
+
+        return summary
+
+    def get(self, conversation_id: str) -> Optional[str]:
+        """Return the cached summary for a conversation without calling ai_summarize()."""
+        with self._lock:
+            state = self._summaries.get(conversation_id)
+            return state.summary if state else None
+
+    def watermark(self, conversation_id: str) -> int:
+        """Return the number of messages already folded into the cached summary."""
+        with self._lock:
+            state = self._summaries.get(conversation_id)
+            return state.watermark if state else 0
+
+    def memory_size(self) -> int:
+        """Approximate bytes of the cached summaries (see memory_budget)."""
+        with self._lock:
+            return sampled_size(iter(self._summaries.items()), count=len(self._summaries))
+
+    def evict_idle(self, target_bytes: int, idle_seconds: float) -> int:
+        """Drop summaries of conversations idle for at least idle_seconds, least recently used first."""
+        cutoff = time.time() - idle_seconds
+        freed = 0
+        with self._lock:
+            while self._summaries and freed < target_bytes:
+                conversation_id, state = next(iter(self._summaries.items()))
+                if state.updated_at > cutoff:
+                    break
+                del self._summaries[conversation_id]
+                freed += approx_size((conversation_id, state))
+        return freed
+
+    def forget(self, conversation_id: str) -> None:
+        """Drop the cached summary for a conversation (e.g. when the chat is cleared)."""
+        with self._lock:
+            self._summaries.pop(conversation_id, None)
+
+    @staticmethod
+    def _is_continuation(state: RollingSummary, chat_history: list) -> bool:
+        """Check that chat_history extends the messages already folded into the summary."""
+        if len(chat_history) < state.watermark:
+            return False
+        return _message_key(chat_history[state.watermark - 1]) == state.last_folded
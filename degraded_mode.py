@@ -0,0 +1,244 @@
+"""
+Degraded-service mode for slow or failing agent endpoints
+
+While the serving endpoint scales from zero or is throttled, users would
+otherwise wait for a long request to fail. DegradedMode watches the outcome
+of every agent call: when at least enter_ratio of the recent calls failed or
+took longer than the SLO, it switches on; it switches off again only once
+the bad fraction is back under exit_ratio and it has been on for at least
+min_degraded_seconds, so it does not flap.
+
+While it is on, the chatbot waits at most slo_seconds for the agent. If no
+answer has arrived by then, it replies with the best saved answer for the
+same or a similar question (nearest neighbour over hashed word features,
+see knowledge_index.HashingEmbedder), clearly marked as such, and lets the
+real request finish in the background so the cache is refreshed
+(stale-while-revalidate). A failed agent call is covered the same way, but
+only while degraded mode is on.
+
+Saved answers are shared between sessions, so only stand-alone questions are
+saved and served: the first question of a conversation, with at least
+DEGRADED_MIN_QUESTION_WORDS words. Follow-ups such as "yes" or "why?" depend
+on the earlier turns, and another user's answer to them would be wrong (and
+could reveal that user's conversation), so they always wait for the agent.
+
+DEGRADED_MODE=auto (default) | on (force, e.g. during an incident) | off.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from knowledge_index import HashingEmbedder
+from memory_budget import sampled_size
+from response_cache import normalize_text
+
+
+class AnswerIndex:
+    """Bounded nearest-neighbour index of recently answered questions"""
+
+    def __init__(self, max_answers: int = 2000, dim: int = 256):
+        self.max_answers = max_answers
+        self.embedder = HashingEmbedder(dim=dim)
+        self._vectors = np.zeros((max_answers, dim), dtype=np.float32)
+        self._entries = [None] * max_answers
+        self._rows = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def memory_size(self) -> int:
+        """Approximate bytes of the index (a fixed-size ring, so it is accounted but never evicted)."""
+        with self._lock:
+            # The row map shares its key strings with the entries
+            entries = (entry for entry in self._entries if entry is not None)
+            return self._vectors.nbytes + sampled_size(entries, count=len(self._rows))
+
+    def remember(self, question: str, answer: str) -> None:
+        """Save (or refresh) the answer to a question."""
+        key = normalize_text(question)
+        vector = self.embedder.embed([key])[0]
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                # Ring buffer: overwrite the oldest row once full
+                row = self._next
+                self._next = (self._next + 1) % self.max_answers
+                evicted = self._entries[row]
+                if evicted is not None:
+                    self._rows.pop(evicted[0], None)
+                self._rows[key] = row
+            self._vectors[row] = vector
+            self._entries[row] = (key, answer, time.time())
+
+    def nearest(self, question: str, min_similarity: float) -> Optional[tuple]:
+        """Return (answer, similarity, answered_at) of the closest saved question, or None."""
+        key = normalize_text(question)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                _, answer, answered_at = self._entries[row]
+                return answer, 1.0, answered_at
+            if not self._rows:
+                return None
+            scores = self._vectors @ self.embedder.embed([key])[0]
+            row = int(np.argmax(scores))
+            if self._entries[row] is None or scores[row] < min_similarity:
+                return None
+            _, answer, answered_at = self._entries[row]
+            return answer, float(scores[row]), answered_at
+
+
+class DegradedMode:
+    """Switches degraded service on and off from agent latency and error signals"""
+
+    def __init__(self, mode: str = None, slo_seconds: float = None, window: int = 20,
+                 enter_ratio: float = 0.5, exit_ratio: float = 0.1, min_samples: int = 5,
+                 min_degraded_seconds: float = None, sample_ttl_seconds: float = 300.0,
+                 min_similarity: float = None, max_background: int = None, min_question_words: int = None):
+        """
+        Defaults come from the DEGRADED_* environment variables (see README).
+
+        Args:
+            mode: 'auto', 'on' or 'off'
+            slo_seconds: Longest a user waits for the agent while degraded
+            window: Recent agent calls considered
+            enter_ratio: Fraction of bad (failed or over-SLO) calls that switches degraded mode on
+            exit_ratio: Fraction of bad calls below which it may switch off again
+            min_samples: Calls needed before switching on
+            min_degraded_seconds: Minimum time spent degraded before switching off
+            sample_ttl_seconds: Calls older than this no longer count
+            min_similarity: Cosine similarity a saved question needs to be served for another
+            max_background: SLO-bound agent calls in flight at once (each may outlive its request)
+            min_question_words: Shortest question (in words) whose answer is saved or served
+        """
+        self.mode = (mode or os.getenv('DEGRADED_MODE', 'auto')).lower()
+        self.slo_seconds = slo_seconds or float(os.getenv('DEGRADED_SLO_SECONDS', '15'))
+        self.enter_ratio = enter_ratio
+        self.exit_ratio = exit_ratio
+        self.min_samples = min_samples
+        self.min_degraded_seconds = min_degraded_seconds or float(os.getenv('DEGRADED_MIN_SECONDS', '60'))
+        self.sample_ttl_seconds = sample_ttl_seconds
+        self.min_similarity = min_similarity or float(os.getenv('DEGRADED_MIN_SIMILARITY', '0.75'))
+        self.max_background = max_background or int(os.getenv('DEGRADED_MAX_BACKGROUND', '4'))
+        self.min_question_words = min_question_words or int(os.getenv('DEGRADED_MIN_QUESTION_WORDS', '4'))
+        self.answers = AnswerIndex()
+
+        self._samples = deque(maxlen=window)
+        self._degraded_since = None
+        self._background = 0
+        self._lock = threading.Lock()
+        self.stats = {'entered': 0, 'exited': 0, 'timeouts': 0, 'errors_covered': 0,
+                      'served_exact': 0, 'served_similar': 0, 'no_fallback': 0, 'not_standalone': 0,
+                      'revalidations': 0}
+
+    @property
+    def active(self) -> bool:
+        if self.mode == 'on':
+            return True
+        if self.mode == 'off':
+            return False
+        with self._lock:
+            self._evaluate(time.time())
+            return self._degraded_since is not None
+
+    def _bad_ratio(self, now: float) -> float:
+        """Fraction of recent calls that were bad. Caller holds the lock."""
+        while self._samples and now - self._samples[0][0] > self.sample_ttl_seconds:
+            self._samples.popleft()
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, bad in self._samples if bad) / len(self._samples)
+
+    def _evaluate(self, now: float) -> None:
+        """Apply the hysteresis rule. Caller holds the lock."""
+        ratio = self._bad_ratio(now)
+        if self._degraded_since is None:
+            if len(self._samples) >= self.min_samples and ratio >= self.enter_ratio:
+                self._degraded_since = now
+                self.stats['entered'] += 1
+                print(f"🟠 Degraded mode on: {ratio:.0%} of recent agent calls failed or exceeded "
+                      f"{self.slo_seconds:.0f}s")
+        elif now - self._degraded_since >= self.min_degraded_seconds and ratio <= self.exit_ratio:
+            print(f"🟢 Degraded mode off after {now - self._degraded_since:.0f}s")
+            self._degraded_since = None
+            self.stats['exited'] += 1
+
+    def observe(self, latency: float, ok: bool) -> None:
+        """Record the outcome of one agent call."""
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, not ok or latency > self.slo_seconds))
+            self._evaluate(now)
+
+    def standalone_question(self, messages: list) -> Optional[str]:
+        """The conversation's question if it can be answered without earlier turns, else None."""
+        if any(m.get('role') == 'assistant' for m in messages):
+            return None
+        questions = [m.get('content') for m in messages if m.get('role') == 'user']
+        if len(questions) != 1 or not questions[0]:
+            return None
+        if len(normalize_text(questions[0]).split()) < self.min_question_words:
+            return None
+        return questions[0]
+
+    def remember(self, messages: list, answer: str) -> None:
+        """Save a fresh agent answer as a future fallback for its question."""
+        question = self.standalone_question(messages)
+        if question and answer:
+            self.answers.remember(question, answer)
+
+    def fallback(self, messages: list) -> Optional[str]:
+        """The best saved answer for a stand-alone question, marked as such, or None."""
+        question = self.standalone_question(messages)
+        if question is None:
+            self.stats['not_standalone'] += 1
+            return None
+        match = self.answers.nearest(question, self.min_similarity)
+        if match is None:
+            self.stats['no_fallback'] += 1
+            return None
+        answer, similarity, answered_at = match
+        age_minutes = max(1, round((time.time() - answered_at) / 60))
+        if similarity >= 0.999:
+            self.stats['served_exact'] += 1
+            note = f"here is the answer I gave to this question about {age_minutes} minute(s) ago"
+        else:
+            self.stats['served_similar'] += 1
+            note = f"here is a saved answer to a similar question ({similarity:.0%} match)"
+        return (f"⚠️ I'm responding slowly right now, so {note}. "
+                f"Please ask again in a moment if it doesn't fully cover your question.\n\n{answer}")
+
+    def try_reserve(self) -> bool:
+        """Reserve a slot for an SLO-bound agent call, which may outlive its request."""
+        with self._lock:
+            if self._background >= self.max_background:
+                return False
+            self._background += 1
+            return True
+
+    def release(self, _future=None) -> None:
+        with self._lock:
+            self._background -= 1
+
+    def metrics(self) -> dict:
+        now = time.time()
+        with self._lock:
+            self._evaluate(now)
+            return dict(
+                self.stats,
+                mode=self.mode,
+                active=self.mode == 'on' or (self.mode == 'auto' and self._degraded_since is not None),
+                degraded_for_seconds=round(now - self._degraded_since, 1) if self._degraded_since else None,
+                bad_ratio=round(self._bad_ratio(now), 3),
+                slo_seconds=self.slo_seconds,
+                background=self._background,
+                answers_saved=len(self.answers),
+            )
+
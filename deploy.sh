@@ -36,9 +36,8 @@ rm -rf "$DEPLOY_DIR"
 mkdir -p "$DEPLOY_DIR"
 
 # Copy only the necessary files
-cp app.py "$DEPLOY_DIR/"
-cp ClearScoreChatbot.py "$DEPLOY_DIR/"
-cp model_serving_utils.py "$DEPLOY_DIR/"
+cp *.py "$DEPLOY_DIR/"
+cp -r static "$DEPLOY_DIR/"
 cp app.yml "$DEPLOY_DIR/"
 cp requirements.txt "$DEPLOY_DIR/"
 
@@ -43,7 +43,7 @@ echo "📦 Creating app bundle..."
 
 # Create a zip file with all source code
 BUNDLE_NAME="clearscore-app-bundle.zip"
-zip -r $BUNDLE_NAME app.py ClearScoreChatbot.py model_serving_utils.py app.yml requirements.txt
+zip -r $BUNDLE_NAME *.py static app.yml requirements.txt
 
 print_success "Bundle created: $BUNDLE_NAME"
 
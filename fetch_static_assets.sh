@@ -0,0 +1,30 @@
+#!/bin/bash
+# Fetch self-hosted static assets for the ClearScore Chatbot
+# Downloads the Inter font and the Bootstrap theme into static/ so that
+# first paint never waits on an external CDN. Commit the downloaded files
+# (or run this before deploy.sh) - static_assets.py fingerprints them.
+# Usage: ./fetch_static_assets.sh
+
+set -e
+
+INTER_URL="https://rsms.me/inter/font-files/InterVariable.woff2"
+THEME_URL=$(python -c "import dash_bootstrap_components as dbc; print(dbc.themes.FLATLY)")
+
+echo "📥 Fetching static assets..."
+mkdir -p static/fonts static/vendor
+
+curl -fsSL "$INTER_URL" -o static/fonts/InterVariable.woff2
+echo "   ✅ Inter font -> static/fonts/InterVariable.woff2"
+
+curl -fsSL "$THEME_URL" -o static/vendor/flatly.min.css
+# Bootswatch themes @import their web font from Google Fonts - drop it so
+# the theme never blocks first paint on an external request
+python - <<'PYEOF'
+import re
+path = 'static/vendor/flatly.min.css'
+css = open(path).read()
+open(path, 'w').write(re.sub(r'@import url\([^)]*fonts\.googleapis\.com[^)]*\);?', '', css))
+PYEOF
+echo "   ✅ Flatly theme -> static/vendor/flatly.min.css"
+
+echo "✅ Static assets ready"
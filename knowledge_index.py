@@ -0,0 +1,402 @@
+"""
+Local vector retrieval index for ClearScore help articles
+
+Help articles are chunked and embedded offline, the vectors are stored in a
+memory-mapped NumPy matrix and the passage text lives in an id -> text side
+table. Top-k similarity queries are a single matrix-vector product over the
+mapped rows, so they answer in milliseconds and only the retrieved passages
+need to be sent to ai_query().
+
+Passages can be added and deleted incrementally: deleted rows are tombstoned
+and reused by later additions, and the matrix file only grows (by doubling)
+when it runs out of free rows.
+
+Usage:
+    python knowledge_index.py build path/to/help_articles --index-dir knowledge_index
+    python knowledge_index.py query "How do I close my account?" --index-dir knowledge_index
+    python knowledge_index.py delete account/closing-your-account.md --index-dir knowledge_index
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+VECTORS_FILE = 'vectors.f32'
+PASSAGES_FILE = 'passages.json'
+ARTICLE_EXTENSIONS = ('.md', '.txt', '.html')
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def chunk_text(text: str, max_chars: int = 800, overlap: int = 100) -> list[str]:
+    """
+    Split an article into passages of roughly max_chars characters.
+
+    Paragraphs are kept together where possible; paragraphs longer than
+    max_chars are split with a small character overlap so that sentences
+    on a boundary are still retrievable.
+
+    Args:
+        text: Article text
+        max_chars: Target maximum passage length
+        overlap: Characters shared between consecutive pieces of a long paragraph
+
+    Returns:
+        List of passage strings
+    """
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    chunks = []
+    current = ''
+
+    for para in paragraphs:
+        if len(para) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            step = max(1, max_chars - overlap)
+            for start in range(0, len(para), step):
+                chunks.append(para[start:start + max_chars])
+                if start + max_chars >= len(para):
+                    break
+        elif current and len(current) + len(para) + 2 > max_chars:
+            chunks.append(current)
+            current = para
+        else:
+            current = f"{current}\n\n{para}" if current else para
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder using feature hashing of word unigrams and bigrams.
+
+    Good enough for keyword-heavy help-centre retrieval and fully offline.
+    Swap in ServingEndpointEmbedder for semantic embeddings.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Embed texts into L2-normalised float32 vectors of shape (len(texts), dim)"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                sign = 1.0 if value & 1 else -1.0
+                vectors[row, (value >> 1) % self.dim] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class ServingEndpointEmbedder:
+    """Embedder backed by a Databricks embedding serving endpoint (e.g. databricks-gte-large-en)"""
+
+    def __init__(self, endpoint_name: str, dim: int = 1024, batch_size: int = 32):
+        self.endpoint_name = endpoint_name
+        self.name = f"endpoint:{endpoint_name}"
+        self.dim = dim
+        self.batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Embed texts through the serving endpoint into L2-normalised float32 vectors"""
+        from mlflow.deployments import get_deploy_client
+        client = get_deploy_client('databricks')
+
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            res = client.predict(endpoint=self.endpoint_name, inputs={'input': batch})
+            rows.extend(item['embedding'] for item in res['data'])
+
+        vectors = np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def get_embedder(name: str, dim: int):
+    """Recreate the embedder an index was built with"""
+    if name.startswith('endpoint:'):
+        return ServingEndpointEmbedder(name.split(':', 1)[1], dim=dim)
+    return HashingEmbedder(dim=dim)
+
+
+class KnowledgeIndex:
+    """Memory-mapped vector index with an id -> text side table"""
+
+    def __init__(self, index_dir: str, embedder=None, initial_capacity: int = 1024):
+        """
+        Open an existing index or create an empty one.
+
+        Args:
+            index_dir: Directory holding vectors.f32 and passages.json
+            embedder: Embedder for new indexes (existing indexes reuse the one they were built
+                with by default; one passed for an existing index must match it)
+            initial_capacity: Number of rows allocated for a new index
+
+        Raises:
+            ValueError: If embedder differs in kind or dimension from an existing index's
+        """
+        self.index_dir = index_dir
+        self._lock = threading.RLock()
+        os.makedirs(index_dir, exist_ok=True)
+
+        meta_path = os.path.join(index_dir, PASSAGES_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if embedder is not None and (embedder.name != meta['embedder'] or embedder.dim != meta['dim']):
+                # Vectors from two embedders are not comparable, and a different
+                # dimension would not even fit the matrix rows
+                raise ValueError(
+                    f"Index in {index_dir} was built with {meta['embedder']} ({meta['dim']}-d) "
+                    f"but {embedder.name} ({embedder.dim}-d) was given; rebuild it in a new directory")
+            self.embedder = embedder or get_embedder(meta['embedder'], meta['dim'])
+            self.dim = meta['dim']
+            self.capacity = meta['capacity']
+            # JSON keys are strings - rows are ints
+            self.passages = {int(row): p for row, p in meta['passages'].items()}
+        else:
+            self.embedder = embedder or HashingEmbedder()
+            self.dim = self.embedder.dim
+            self.capacity = max(1, initial_capacity)
+            self.passages = {}
+
+        self._open_vectors()
+        self._row_by_id = {p['id']: row for row, p in self.passages.items()}
+        self._live = np.zeros(self.capacity, dtype=bool)
+        self._live[list(self.passages)] = True
+        self._high_water = max(self.passages, default=-1) + 1
+        self._free_rows = [row for row in range(self._high_water) if row not in self.passages]
+
+    def _open_vectors(self) -> None:
+        path = os.path.join(self.index_dir, VECTORS_FILE)
+        mode = 'r+' if os.path.exists(path) else 'w+'
+        self._vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+
+    def _grow(self, min_capacity: int) -> None:
+        """Double the matrix file until it holds min_capacity rows; existing rows are kept in place."""
+        new_capacity = self.capacity
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+        print(f"📈 Growing knowledge index from {self.capacity} to {new_capacity} rows")
+        self._vectors.flush()
+        del self._vectors
+        path = os.path.join(self.index_dir, VECTORS_FILE)
+        with open(path, 'r+b') as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._open_vectors()
+        self._live = np.concatenate([self._live, np.zeros(new_capacity - len(self._live), dtype=bool)])
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add(self, passages: list[dict]) -> int:
+        """
+        Embed and add passages, replacing any existing passage with the same id.
+
+        Args:
+            passages: Dicts with 'id' and 'text' and optionally 'source' and 'title'
+
+        Returns:
+            Number of passages written
+        """
+        if not passages:
+            return 0
+        vectors = self.embedder.embed([p['text'] for p in passages])
+
+        with self._lock:
+            self.delete([p['id'] for p in passages], save=False)
+            needed = len(passages) - len(self._free_rows)
+            if self._high_water + max(0, needed) > self.capacity:
+                self._grow(self._high_water + needed)
+
+            for passage, vector in zip(passages, vectors):
+                if self._free_rows:
+                    row = self._free_rows.pop()
+                else:
+                    row = self._high_water
+                    self._high_water += 1
+                self._vectors[row] = vector
+                self._live[row] = True
+                self.passages[row] = {
+                    'id': passage['id'],
+                    'text': passage['text'],
+                    'source': passage.get('source'),
+                    'title': passage.get('title'),
+                }
+                self._row_by_id[passage['id']] = row
+            self.save()
+        return len(passages)
+
+    def add_document(self, doc_id: str, text: str, title: str = None, **chunk_kwargs) -> int:
+        """Chunk an article and add its passages, replacing any earlier version of it."""
+        self.delete_document(doc_id, save=False)
+        passages = [
+            {'id': f"{doc_id}#{i}", 'text': chunk, 'source': doc_id, 'title': title}
+            for i, chunk in enumerate(chunk_text(text, **chunk_kwargs))
+        ]
+        return self.add(passages)
+
+    def delete(self, passage_ids: list[str], save: bool = True) -> int:
+        """Tombstone passages by id; their rows are reused by later additions."""
+        removed = 0
+        with self._lock:
+            for passage_id in passage_ids:
+                row = self._row_by_id.pop(passage_id, None)
+                if row is None:
+                    continue
+                self._live[row] = False
+                self._vectors[row] = 0.0
+                del self.passages[row]
+                self._free_rows.append(row)
+                removed += 1
+            if removed and save:
+                self.save()
+        return removed
+
+    def delete_document(self, doc_id: str, save: bool = True) -> int:
+        """Delete every passage chunked from an article."""
+        with self._lock:
+            ids = [p['id'] for p in self.passages.values() if p.get('source') == doc_id]
+            return self.delete(ids, save=save)
+
+    def save(self) -> None:
+        """Flush vectors and atomically rewrite the side table."""
+        with self._lock:
+            self._vectors.flush()
+            meta = {
+                'embedder': self.embedder.name,
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'passages': self.passages,
+            }
+            path = os.path.join(self.index_dir, PASSAGES_FILE)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, path)
+
+    def search(self, query: str, k: int = 4, min_score: float = 0.0) -> list[dict]:
+        """
+        Return the k passages most similar to the query.
+
+        Args:
+            query: Customer question
+            k: Number of passages to return
+            min_score: Drop passages with cosine similarity below this value
+
+        Returns:
+            List of passage dicts with an added 'score', best first
+        """
+        query_vector = self.embedder.embed([query])[0]
+
+        with self._lock:
+            if not self.passages:
+                return []
+            rows = self._high_water
+            scores = np.asarray(self._vectors[:rows] @ query_vector)
+            scores[~self._live[:rows]] = -np.inf
+
+            k = min(k, len(self.passages))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                dict(self.passages[int(row)], score=float(scores[row]))
+                for row in top
+                if scores[row] >= min_score
+            ]
+
+
+def _read_article(path: str) -> tuple[str, str]:
+    """Read an article file and return (title, text)"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.endswith('.html'):
+        text = _TAG_RE.sub(' ', text)
+    first_line = text.strip().split('\n', 1)[0]
+    return first_line.lstrip('# ').strip(), text
+
+
+def build_index(articles_dir: str, index_dir: str, embedder=None) -> KnowledgeIndex:
+    """Chunk, embed and index every help article under articles_dir"""
+    index = KnowledgeIndex(index_dir, embedder=embedder)
+    for root, _, files in os.walk(articles_dir):
+        for name in sorted(files):
+            if not name.endswith(ARTICLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            doc_id = os.path.relpath(path, articles_dir)
+            title, text = _read_article(path)
+            count = index.add_document(doc_id, text, title=title)
+            print(f"   📄 {doc_id}: {count} passage(s)")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the local ClearScore knowledge index')
+    parser.add_argument('--index-dir', default=os.getenv('KNOWLEDGE_INDEX_DIR', 'knowledge_index'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Chunk and embed help articles from a directory')
+    build.add_argument('articles_dir')
+    build.add_argument('--embedding-endpoint', help='Use a serving endpoint instead of the hashing embedder')
+    build.add_argument('--dim', type=int, default=512)
+
+    query = subparsers.add_parser('query', help='Run a top-k similarity query')
+    query.add_argument('question')
+    query.add_argument('-k', type=int, default=4)
+
+    delete = subparsers.add_parser('delete', help='Remove an article from the index')
+    delete.add_argument('doc_id')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.embedding_endpoint:
+            embedder = ServingEndpointEmbedder(args.embedding_endpoint, dim=args.dim)
+        else:
+            embedder = HashingEmbedder(dim=args.dim)
+        print(f"🔨 Building knowledge index in {args.index_dir}")
+        try:
+            index = build_index(args.articles_dir, args.index_dir, embedder=embedder)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"✅ Indexed {len(index)} passage(s)")
+    elif args.command == 'query':
+        index = KnowledgeIndex(args.index_dir)
+        start = time.perf_counter()
+        results = index.search(args.question, k=args.k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"🔎 {len(results)} result(s) in {elapsed_ms:.1f} ms")
+        for result in results:
+            print(f"   [{result['score']:.3f}] {result['id']}: {result['text'][:120]!r}")
+    elif args.command == 'delete':
+        index = KnowledgeIndex(args.index_dir)
+        removed = index.delete_document(args.doc_id)
+        print(f"🗑️ Removed {removed} passage(s) for {args.doc_id}")
+
+
+if __name__ == '__main__':
+    main()
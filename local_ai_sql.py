@@ -0,0 +1,279 @@
+"""
+Local SQL stand-in for the Databricks SQL warehouse's AI functions
+
+DatabricksAIFunctions talks to a SQL warehouse through the DB-API
+connector. This module provides a drop-in connect() backed by in-memory
+SQLite, with fake ai_classify, ai_summarize, ai_extract and ai_query
+functions registered on every connection, so the enrichment paths can be
+exercised and benchmarked offline:
+
+    ai = DatabricksAIFunctions(connect=local_ai_sql.connector(latency_ms=80, failure_rate=0.01))
+
+(or AI_FUNCTIONS_BACKEND=local, configured by the LOCAL_AI_* variables).
+
+The fakes are deterministic and cheap: ai_classify picks the label sharing
+the most words with the text, ai_summarize keeps the first words,
+ai_extract finds e-mail addresses, phone and account numbers with regular
+expressions, and ai_query answers with the context passage closest to the
+question. Warehouse behaviour is modelled with injected delays (connection
+setup, per statement, per function call, with the rows of one statement
+processed partly in parallel), a cap on statements the warehouse runs at
+once (further statements queue) and a failure rate, so optimisations such as
+batching, caching or connection reuse show up as they would against a real
+warehouse.
+
+Databricks SQL is translated to SQLite before execution: ARRAY(...)
+becomes json_array(...), named arguments ('max_length' => 100 or
+max_length => 100) become positional, and backslash-escaped string literals are re-quoted. STRUCT
+results (ai_extract) are returned as dicts, like the connector does.
+"""
+
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_PHONE_RE = re.compile(r"(?:\+44\s?|\b0)\d{3,4}\s?\d{3}\s?\d{3,4}\b")
+_ACCOUNT_RE = re.compile(r"\b\d{8,12}\b")
+_NAME_RE = re.compile(r"\b(?i:my name is|i am|i'm)\s+([A-Z][a-z]+(?:\s[A-Z][a-z]+)?)")
+
+_SENTIMENT_WORDS = {
+    'positive': {'thanks', 'thank', 'great', 'love', 'helpful', 'brilliant', 'good', 'happy', 'improved'},
+    'negative': {'angry', 'terrible', 'awful', 'wrong', 'frustrated', 'annoyed', 'dropped', 'worst',
+                 'unhappy', 'complaint', 'error', 'cant', 'not'},
+}
+_LANGUAGE_WORDS = {
+    'es': {'hola', 'gracias', 'puntuacion', 'credito', 'cuenta', 'como'},
+    'fr': {'bonjour', 'merci', 'compte', 'comment', 'mon', 'est'},
+    'de': {'hallo', 'danke', 'konto', 'wie', 'meine', 'ist'},
+}
+
+
+class InjectedFailure(Exception):
+    """A failure injected by the local backend"""
+
+
+def _words(text) -> set:
+    return set(_WORD_RE.findall(str(text).lower().replace("'", '')))
+
+
+class _Behaviour:
+    """Injected delay and failure rate for one kind of operation"""
+
+    def __init__(self, latency_ms: float, jitter: float, failure_rate: float, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, function: str, scale: float = 1.0) -> None:
+        with self._lock:
+            fail = self.random.random() < self.failure_rate
+            delay = scale * self.latency * (1 + self.jitter * (2 * self.random.random() - 1))
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise InjectedFailure(f"{function}: injected failure")
+
+
+# Fake AI functions
+
+def ai_classify(text, labels_json):
+    labels = json.loads(labels_json)
+    words = _words(text)
+    if set(labels) == {'positive', 'neutral', 'negative'}:
+        scores = {label: len(words & _SENTIMENT_WORDS.get(label, set())) for label in labels}
+        best = max(scores, key=scores.get)
+        return best if scores[best] else 'neutral'
+    if 'en' in labels:
+        scores = {label: len(words & _LANGUAGE_WORDS.get(label, set())) for label in labels}
+        best = max(scores, key=scores.get)
+        return best if scores[best] else 'en'
+    scores = {label: len(words & set(label.split('_'))) for label in labels}
+    best = max(labels, key=lambda label: scores[label])
+    if scores[best]:
+        return best
+    return next((label for label in labels if 'general' in label), labels[0])
+
+
+def ai_summarize(text, max_length=50):
+    words = str(text).split()
+    return ' '.join(words[:int(max_length)])
+
+
+def ai_extract(text, _schema=None):
+    text = str(text)
+    email = _EMAIL_RE.search(text)
+    phone = _PHONE_RE.search(text)
+    account = _ACCOUNT_RE.search(_PHONE_RE.sub(' ', text))
+    name = _NAME_RE.search(text)
+    return json.dumps({
+        'customer_name': name.group(1) if name else None,
+        'email': email.group(0) if email else None,
+        'phone': phone.group(0) if phone else None,
+        'account_number': account.group(0) if account else None,
+    })
+
+
+def ai_query(question, context=''):
+    passages = [p for p in str(context).split('\n\n') if p.strip()]
+    if not passages:
+        return "No answer found"
+    words = _words(question)
+    best = max(passages, key=lambda p: len(words & _words(p)))
+    return f"Based on our help articles: {best.strip()}"
+
+
+FUNCTIONS = {
+    'ai_classify': (ai_classify, 2),
+    'ai_summarize': (ai_summarize, 2),
+    'ai_extract': (ai_extract, 2),
+    'ai_query': (ai_query, 2),
+}
+
+
+# Databricks SQL -> SQLite
+
+_STRING_RE = re.compile(r"'((?:[^'\\]|\\.)*)'", re.DOTALL)
+_NAMED_ARG_RE = re.compile(r"(?:\x00\d+\x00|\b[A-Za-z_]\w*)\s*=>\s*")
+_ARRAY_RE = re.compile(r"\bARRAY\s*\(", re.IGNORECASE)
+
+
+def translate(statement: str) -> str:
+    """Rewrite the Databricks SQL used by DatabricksAIFunctions for SQLite."""
+    literals = []
+
+    def stash(match):
+        # Databricks escapes quotes with a backslash; SQLite doubles them
+        value = re.sub(r"\\(.)", r"\1", match.group(1), flags=re.DOTALL)
+        literals.append("'" + value.replace("'", "''") + "'")
+        return f"\x00{len(literals) - 1}\x00"
+
+    statement = _STRING_RE.sub(stash, statement)
+    statement = _NAMED_ARG_RE.sub('', statement)
+    statement = _ARRAY_RE.sub('json_array(', statement)
+    return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], statement)
+
+
+class LocalCursor:
+    """DB-API cursor over SQLite that accepts Databricks SQL"""
+
+    def __init__(self, connection: "LocalConnection"):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, statement: str, parameters=()):
+        # A statement holds one of the warehouse's slots from queueing to its last row
+        with self.connection.slots:
+            self.connection.behaviour.call('query')
+            self.connection.calls_in_statement = 0
+            self._cursor.execute(translate(statement), parameters)
+        return self
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        # STRUCT results come back as dicts, as with the Databricks connector
+        return tuple(json.loads(v) if isinstance(v, str) and v.startswith('{"') else v for v in row)
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class LocalConnection:
+    """DB-API connection to an in-memory SQLite database with the fake AI functions"""
+
+    def __init__(self, function_behaviour: _Behaviour, query_behaviour: _Behaviour, batch_parallelism: int,
+                 slots: threading.Semaphore):
+        self._db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.behaviour = query_behaviour
+        self.slots = slots
+        self.batch_parallelism = max(1, batch_parallelism)
+        self.calls_in_statement = 0
+        for name, (fn, arity) in FUNCTIONS.items():
+            self._db.create_function(name, arity, self._wrap(name, fn, function_behaviour), deterministic=True)
+
+    def _wrap(self, name, fn, behaviour):
+        def call(*args):
+            # The warehouse runs the AI function over a batch of rows in parallel, so after
+            # the first row of a statement each call adds only a share of the latency
+            self.calls_in_statement += 1
+            behaviour.call(name, 1.0 if self.calls_in_statement == 1 else 1.0 / self.batch_parallelism)
+            return fn(*args)
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def cursor(self) -> LocalCursor:
+        return LocalCursor(self)
+
+    def close(self):
+        self._db.close()
+
+
+def connector(latency_ms: float = None, failure_rate: float = None, connect_ms: float = None,
+              query_ms: float = None, batch_parallelism: int = None, max_concurrency: int = None,
+              jitter: float = 0.2, seed=None):
+    """
+    Build a connect() function for DatabricksAIFunctions.
+
+    Defaults come from the LOCAL_AI_* environment variables.
+
+    Args:
+        latency_ms: Delay of every AI function call (LOCAL_AI_LATENCY_MS, default 50)
+        failure_rate: Probability that an AI function call fails (LOCAL_AI_FAILURE_RATE, default 0)
+        connect_ms: Connection setup delay (LOCAL_AI_CONNECT_MS, default 200)
+        query_ms: Fixed delay per statement, e.g. warehouse queueing (LOCAL_AI_QUERY_MS, default 20)
+        batch_parallelism: Rows of one statement the warehouse processes in parallel
+            (LOCAL_AI_BATCH_PARALLELISM, default 8)
+        max_concurrency: Statements the warehouse runs at once, across all connections
+            from this connector; the rest wait (LOCAL_AI_MAX_CONCURRENCY, default 4)
+        jitter: Relative random variation of every delay
+        seed: Random seed for reproducible runs
+
+    Returns:
+        Callable returning a new LocalConnection
+    """
+    latency_ms = latency_ms if latency_ms is not None else float(os.getenv('LOCAL_AI_LATENCY_MS', '50'))
+    failure_rate = failure_rate if failure_rate is not None else float(os.getenv('LOCAL_AI_FAILURE_RATE', '0'))
+    connect_ms = connect_ms if connect_ms is not None else float(os.getenv('LOCAL_AI_CONNECT_MS', '200'))
+    query_ms = query_ms if query_ms is not None else float(os.getenv('LOCAL_AI_QUERY_MS', '20'))
+    batch_parallelism = batch_parallelism or int(os.getenv('LOCAL_AI_BATCH_PARALLELISM', '8'))
+    max_concurrency = max_concurrency or int(os.getenv('LOCAL_AI_MAX_CONCURRENCY', '4'))
+    slots = threading.BoundedSemaphore(max(1, max_concurrency))
+    function_behaviour = _Behaviour(latency_ms, jitter, failure_rate, seed)
+    query_behaviour = _Behaviour(query_ms, jitter, 0.0, seed)
+    connect_behaviour = _Behaviour(connect_ms, jitter, 0.0, seed)
+
+    def connect(**_ignored) -> LocalConnection:
+        connect_behaviour.call('connect')
+        return LocalConnection(function_behaviour, query_behaviour, batch_parallelism, slots)
+
+    return connect
@@ -0,0 +1,408 @@
+"""
+Memory accounting and budget enforcement for long-lived structures
+
+Every structure that grows with traffic (per-session state, caches,
+analytics) registers with the process-wide governor, giving a cheap
+approximate size function and an eviction function. A background thread
+checks the total every MEMORY_CHECK_SECONDS. When the accounted total is
+over MEMORY_BUDGET_MB (or the process RSS is over MEMORY_RSS_LIMIT_MB, if
+set), it evicts tier by tier until usage is back under
+MEMORY_TARGET_RATIO of the budget:
+
+1. idle sessions (untouched for MEMORY_SESSION_IDLE_SECONDS)
+2. analytics detail, folded into running totals
+3. cold cache entries, least recently used first
+
+Sessions that are still active are never evicted. Caches shed their least
+recently used entries, only as many as needed.
+
+RSS rarely falls after Python frees objects, so after an RSS-driven pass
+further RSS-driven passes are skipped until RSS grows past the level seen at
+that pass; otherwise every check would evict again while RSS stays put.
+
+Sizes are estimates from a small sample of entries (see sampled_size). They
+are meant for spotting trends and deciding what to drop, not for exact
+accounting.
+
+Routes (guarded by ADMIN_TOKEN, see metrics.require_admin):
+    GET  /admin/memory          per-component breakdown, RSS and, while tracing, the
+                                top tracemalloc allocation growth since the baseline
+    POST /admin/memory          {"tracemalloc": "start" | "reset" | "stop"} and/or {"enforce": true}
+"""
+
+import functools
+import math
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import flask
+
+import metrics
+
+TIER_IDLE_SESSIONS = 0
+TIER_ANALYTICS = 1
+TIER_COLD_CACHE = 2
+TIER_NAMES = {TIER_IDLE_SESSIONS: 'idle_sessions', TIER_ANALYTICS: 'analytics', TIER_COLD_CACHE: 'cold_cache'}
+
+MAX_DEPTH = 4
+SAMPLE_SIZE = 32
+
+
+def approx_size(obj, depth: int = MAX_DEPTH) -> int:
+    """Approximate deep size of an object in bytes (containers and slots followed to a fixed depth)."""
+    size = sys.getsizeof(obj)
+    if depth <= 0 or isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approx_size(k, depth - 1) + approx_size(v, depth - 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(item, depth - 1) for item in obj)
+    slots = getattr(type(obj), '__slots__', None)
+    if slots:
+        return size + sum(approx_size(getattr(obj, name, None), depth - 1) for name in slots)
+    if hasattr(obj, '__dict__'):
+        return size + approx_size(vars(obj), depth - 1)
+    return size
+
+
+def sampled_size(items, count: int = None, sample: int = SAMPLE_SIZE) -> int:
+    """
+    Estimate the total size of a collection from a random sample of its items.
+
+    Args:
+        items: Sequence (or iterable, of which the first `sample` items are used)
+        count: Number of items in the collection (default: len(items))
+        sample: Items measured
+
+    Returns:
+        Approximate bytes for all items (not counting the container itself)
+    """
+    count = len(items) if count is None else count
+    if count == 0:
+        return 0
+    if isinstance(items, (list, tuple)):
+        picked = random.sample(items, min(sample, count))
+    else:
+        picked = []
+        for item in items:
+            picked.append(item)
+            if len(picked) >= sample:
+                break
+    return int(sum(approx_size(item) for item in picked) / max(len(picked), 1) * count)
+
+
+def process_rss() -> int:
+    """Current resident set size in bytes (None where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_MISSING = object()
+
+
+class EvictableLRU:
+    """
+    Memoising LRU cache like functools.lru_cache, but able to drop only its coldest entries
+
+    functools.lru_cache can only be emptied as a whole, which also throws away
+    the hot entries; evict_oldest lets a governor evictor shed just enough.
+    """
+
+    def __init__(self, fn, maxsize: int):
+        self.fn = fn
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        functools.update_wrapper(self, fn)
+
+    def __call__(self, *args):
+        # Hits skip the lock: single OrderedDict operations are atomic, and an entry
+        # evicted between the lookup and move_to_end is simply not refreshed
+        value = self._entries.get(args, _MISSING)
+        if value is not _MISSING:
+            try:
+                self._entries.move_to_end(args)
+            except KeyError:
+                pass
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.fn(*args)
+        with self._lock:
+            # Another thread may have computed it meanwhile; keep the first so callers share one object
+            value = self._entries.setdefault(args, value)
+            self._entries.move_to_end(args)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def evict_oldest(self, count: int) -> list:
+        """Drop the count least recently used entries and return their values."""
+        evicted = []
+        with self._lock:
+            while self._entries and len(evicted) < count:
+                evicted.append(self._entries.popitem(last=False)[1])
+        return evicted
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def evict_bytes(self, target_bytes: int, size_fn) -> int:
+        """
+        Drop the coldest entries until about target_bytes are freed (all of them if target_bytes <= 0).
+
+        Args:
+            target_bytes: Bytes to free
+            size_fn: Callable returning the cache's current approximate size in bytes
+
+        Returns:
+            Approximate bytes freed
+        """
+        count = len(self)
+        if count == 0:
+            return 0
+        size = size_fn()
+        if target_bytes <= 0 or target_bytes >= size:
+            self.cache_clear()
+            return size
+        self.evict_oldest(math.ceil(target_bytes / max(size / count, 1)))
+        return size - size_fn()
+
+
+def evictable_lru_cache(maxsize: int):
+    """Decorator form of EvictableLRU."""
+    return lambda fn: EvictableLRU(fn, maxsize)
+
+
+class _Component:
+    __slots__ = ('name', 'size_fn', 'evict_fn', 'tier', 'last_size', 'evictions', 'freed')
+
+    def __init__(self, name: str, size_fn, evict_fn, tier: int):
+        self.name = name
+        self.size_fn = size_fn
+        self.evict_fn = evict_fn
+        self.tier = tier
+        self.last_size = 0
+        self.evictions = 0
+        self.freed = 0
+
+
+class MemoryGovernor:
+    """Process-wide memory budget over registered components"""
+
+    def __init__(self, budget_mb: float = None, rss_limit_mb: float = None, target_ratio: float = None,
+                 session_idle_seconds: float = None, check_seconds: float = None):
+        """
+        Defaults come from the MEMORY_* environment variables (see README).
+
+        Args:
+            budget_mb: Budget for the accounted structures
+            rss_limit_mb: Also enforce when the process RSS exceeds this (0 disables)
+            target_ratio: Eviction stops once usage is under this fraction of the budget
+            session_idle_seconds: Sessions untouched for this long may be evicted
+            check_seconds: Interval of the background check
+        """
+        self.budget_bytes = int((budget_mb or float(os.getenv('MEMORY_BUDGET_MB', '256'))) * 1024 * 1024)
+        rss_limit_mb = rss_limit_mb if rss_limit_mb is not None else float(os.getenv('MEMORY_RSS_LIMIT_MB', '0'))
+        self.rss_limit_bytes = int(rss_limit_mb * 1024 * 1024)
+        self.target_ratio = target_ratio or float(os.getenv('MEMORY_TARGET_RATIO', '0.8'))
+        self.session_idle_seconds = (session_idle_seconds if session_idle_seconds is not None
+                                     else float(os.getenv('MEMORY_SESSION_IDLE_SECONDS', '1800')))
+        self.check_seconds = check_seconds or float(os.getenv('MEMORY_CHECK_SECONDS', '10'))
+
+        self._components: dict[str, _Component] = {}
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+        self._checker = None
+        self._baseline = None
+        # RSS at the last RSS-driven enforcement; RSS-only pressure re-arms once RSS exceeds it
+        self._rss_enforced_at = None
+        self.stats = {'checks': 0, 'enforcements': 0, 'bytes_freed': 0, 'still_over_budget': 0,
+                      'rss_checks_skipped': 0}
+
+    def register(self, name: str, size_fn, evict_fn=None, tier: int = TIER_COLD_CACHE) -> None:
+        """
+        Account a long-lived structure against the budget.
+
+        Args:
+            name: Component name (re-registering a name replaces it)
+            size_fn: Callable returning the approximate size in bytes; called on every check, so keep it cheap
+            evict_fn: Callable (target_bytes, idle_seconds) -> bytes freed, or None if it cannot shrink
+            tier: TIER_IDLE_SESSIONS, TIER_ANALYTICS or TIER_COLD_CACHE (lower tiers are evicted first)
+        """
+        with self._lock:
+            self._components[name] = _Component(name, size_fn, evict_fn, tier)
+
+    def unregister(self, name: str) -> None:
+        """Stop accounting a component (no-op if it is not registered)."""
+        with self._lock:
+            self._components.pop(name, None)
+
+    def measure(self) -> int:
+        """Refresh every component's size and return the accounted total."""
+        with self._lock:
+            components = list(self._components.values())
+        total = 0
+        for component in components:
+            try:
+                component.last_size = int(component.size_fn())
+            except Exception as e:
+                print(f"⚠️  Memory size of {component.name} failed: {e}")
+            total += component.last_size
+        return total
+
+    def _over_by(self, accounted: int) -> tuple:
+        """Bytes to free to get under the budget target, bytes to free to get under the RSS target, and RSS."""
+        budget_excess = accounted - int(self.budget_bytes * self.target_ratio) if accounted > self.budget_bytes else 0
+        rss_excess, rss = 0, None
+        if self.rss_limit_bytes:
+            rss = process_rss()
+            if rss is not None and rss > self.rss_limit_bytes:
+                rss_excess = rss - int(self.rss_limit_bytes * self.target_ratio)
+        return max(0, budget_excess), rss_excess, rss
+
+    def check(self, force: bool = False) -> int:
+        """Measure, and evict if over budget (or if force). Returns bytes freed."""
+        with self._enforce_lock:
+            self.stats['checks'] += 1
+            accounted = self.measure()
+            to_free, rss_excess, rss = self._over_by(accounted)
+            if force:
+                to_free = max(to_free, accounted - int(self.budget_bytes * self.target_ratio))
+            if not rss_excess:
+                self._rss_enforced_at = None
+            elif self._rss_enforced_at is not None and rss <= self._rss_enforced_at:
+                # The last RSS-driven pass did not bring RSS down, and it has not grown since
+                self.stats['rss_checks_skipped'] += 1
+            elif rss_excess > to_free:
+                to_free = rss_excess
+                self._rss_enforced_at = rss
+            if to_free <= 0:
+                return 0
+            return self._enforce(accounted, to_free)
+
+    def _enforce(self, accounted: int, to_free: int) -> int:
+        """Evict tier by tier until to_free bytes are released. Caller holds the enforce lock."""
+        self.stats['enforcements'] += 1
+        freed = 0
+        with self._lock:
+            components = sorted((c for c in self._components.values() if c.evict_fn is not None),
+                                key=lambda c: (c.tier, -c.last_size))
+        for component in components:
+            if freed >= to_free:
+                break
+            try:
+                released = int(component.evict_fn(to_free - freed, self.session_idle_seconds) or 0)
+            except Exception as e:
+                print(f"⚠️  Memory eviction in {component.name} failed: {e}")
+                continue
+            if released > 0:
+                component.evictions += 1
+                component.freed += released
+                freed += released
+        self.stats['bytes_freed'] += freed
+        if freed < to_free:
+            self.stats['still_over_budget'] += 1
+        print(f"🧹 Memory over budget ({accounted / 2**20:.1f} MB accounted, "
+              f"budget {self.budget_bytes / 2**20:.0f} MB): freed ~{freed / 2**20:.1f} MB")
+        self.measure()
+        return freed
+
+    def _check_loop(self) -> None:
+        while True:
+            time.sleep(self.check_seconds)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️  Memory check failed: {e}")
+
+    def start(self) -> None:
+        """Start the background budget check (once per process)."""
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_loop, name='memory-governor', daemon=True)
+                self._checker.start()
+        if os.getenv('MEMORY_TRACEMALLOC', 'false').lower() in ('1', 'true', 'yes'):
+            self.start_tracing()
+
+    # tracemalloc
+
+    def start_tracing(self) -> None:
+        """Start tracemalloc (if needed) and take the baseline snapshot diffs are taken against."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.getenv('MEMORY_TRACEMALLOC_FRAMES', '1')))
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self) -> None:
+        self._baseline = None
+        tracemalloc.stop()
+
+    def tracemalloc_diff(self, top: int = 20) -> dict:
+        """Largest allocation growth by source line since the baseline snapshot."""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return {'tracing': False}
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        stats = snapshot.compare_to(self._baseline.filter_traces(filters), 'lineno')
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'tracing': True,
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'top_growth': [{'where': str(stat.traceback), 'size_diff': stat.size_diff, 'size': stat.size,
+                            'count_diff': stat.count_diff}
+                           for stat in stats[:top]],
+        }
+
+    def metrics(self) -> dict:
+        """Budget, totals and per-component sizes (from the last check) for /metrics"""
+        with self._lock:
+            components = sorted(self._components.values(), key=lambda c: -c.last_size)
+            return dict(
+                self.stats,
+                budget_bytes=self.budget_bytes,
+                rss_limit_bytes=self.rss_limit_bytes or None,
+                accounted_bytes=sum(c.last_size for c in components),
+                rss_bytes=process_rss(),
+                components={c.name: {'tier': TIER_NAMES.get(c.tier, c.tier), 'bytes': c.last_size,
+                                     'evictions': c.evictions, 'freed_bytes': c.freed}
+                            for c in components},
+            )
+
+    def register_routes(self, app) -> None:
+        """Add /admin/memory to a Dash app's Flask server."""
+
+        @metrics.require_admin
+        def memory():
+            if flask.request.method == 'POST':
+                body = flask.request.get_json(silent=True) or {}
+                action = body.get('tracemalloc')
+                if action in ('start', 'reset'):
+                    self.start_tracing()
+                elif action == 'stop':
+                    self.stop_tracing()
+                if body.get('enforce'):
+                    self.check(force=True)
+            self.measure()
+            top = int(flask.request.args.get('top', '20'))
+            return flask.jsonify(dict(self.metrics(), tracemalloc=self.tracemalloc_diff(top)))
+
+        app.server.add_url_rule('/admin/memory', 'admin_memory', memory, methods=['GET', 'POST'])
+
+
+governor = MemoryGovernor()
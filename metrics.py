@@ -0,0 +1,69 @@
+"""
+Metrics surface for the ClearScore chatbot
+
+Components register a snapshot function under a name; GET /metrics returns
+the JSON of every snapshot. Snapshots are only computed when the route is
+polled, so registering a source costs nothing on the request path.
+
+Operational /admin routes are wrapped in require_admin: they require
+ADMIN_TOKEN in the X-Admin-Token header (or ?token=), and are disabled
+(403) when ADMIN_TOKEN is not set, since they can write profiles to disk and
+drop caches.
+"""
+
+import functools
+import hmac
+import os
+import threading
+import time
+
+import flask
+
+_sources = {}
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+def register_source(name: str, snapshot_fn) -> None:
+    """
+    Expose a component's metrics under /metrics.
+
+    Args:
+        name: Key in the /metrics JSON document
+        snapshot_fn: Callable returning a JSON-serialisable dict
+    """
+    with _lock:
+        _sources[name] = snapshot_fn
+
+
+def snapshot() -> dict:
+    """Collect every registered source; a failing source reports its error instead."""
+    with _lock:
+        sources = dict(_sources)
+
+    result = {'uptime_seconds': round(time.time() - _started_at, 1)}
+    for name, snapshot_fn in sources.items():
+        try:
+            result[name] = snapshot_fn()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
+
+
+def register_routes(app) -> None:
+    """Add GET /metrics to a Dash app's Flask server."""
+    app.server.add_url_rule('/metrics', 'metrics', lambda: flask.jsonify(snapshot()))
+
+
+def require_admin(view):
+    """Reject requests to an admin view that do not carry ADMIN_TOKEN (all of them when it is unset)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.getenv('ADMIN_TOKEN')
+        if not token:
+            flask.abort(403)
+        supplied = flask.request.headers.get('X-Admin-Token') or flask.request.args.get('token', '')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            flask.abort(403)
+        return view(*args, **kwargs)
+    return wrapper
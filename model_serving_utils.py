@@ -1,9 +1,21 @@
 """
 Utilities for interacting with Databricks Model Serving endpoints
 """
+import functools
+import random
+import threading
+import time
+from typing import Optional
+
 from mlflow.deployments import get_deploy_client
 from databricks.sdk import WorkspaceClient
 
+import metrics
+from compression import CompressedServingClient
+from context_window import message_tokens
+from token_policy import estimate_tokens
+from trace_replay import get_recorder
+
 def _get_endpoint_task_type(endpoint_name: str) -> str:
     """Get the task type of a serving endpoint."""
     try:
@@ -43,14 +55,41 @@ def _validate_endpoint_task_type(endpoint_name: str) -> None:
             f"For more information, see https://docs.databricks.com/en/generative-ai/agent-framework/chat-app"
         )
 
-def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens: int) -> list[dict[str, str]]:
+@functools.lru_cache(maxsize=1)
+def get_serving_client():
+    """
+    Shared serving client.
+    
+    Created once per process and reused for every request, so connection
+    setup (auth, DNS, TLS) is paid once rather than per message. This is the
+    MLflow deployment client unless SERVING_COMPRESSION opts in to a
+    CompressedServingClient, which compresses large request bodies and
+    accepts compressed responses (see compression.py).
+    """
+    try:
+        client = CompressedServingClient.from_env()
+    except Exception as e:
+        print(f"⚠️  Compressed serving transport unavailable ({e}); using the MLflow client")
+        client = None
+    if client is None:
+        return get_deploy_client('databricks')
+    metrics.register_source('serving_transport', client.metrics)
+    return client
+
+def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens: int,
+                    client=None) -> list[dict[str, str]]:
     """
     Calls a Databricks model serving endpoint.
     
+    When TRACE_RECORD_PATH is set, every request payload, raw response and
+    timing is also written (PII-redacted) to a local trace file for offline
+    replay - see trace_replay.py.
+    
     Args:
         endpoint_name: Name of the serving endpoint
         messages: List of chat messages with 'role' and 'content' keys
         max_tokens: Maximum tokens to generate
+        client: Deployment client to use (default: the shared serving client)
         
     Returns:
         List of message dictionaries with the assistant response
@@ -60,165 +99,64 @@ def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_toke
     print(f"   Max tokens: {max_tokens}")
     
     try:
-        # Use MLflow deployment client to call the endpoint
-        client = get_deploy_client('databricks')
+        # Use the shared MLflow deployment client to call the endpoint
+        client = client or get_serving_client()
+        recorder = get_recorder()
         
         # Format the input for Databricks Agent API (responses.create format)
         # This matches: client.responses.create(model="...", input=[...])
-        input_messages = [{'role': msg['role'], 'content': msg['content']} for msg in messages]
+        # ChatMessages reuse their cached dict; plain dicts are copied down to role/content
+        input_messages = [
+            msg.to_dict() if hasattr(msg, 'to_dict') else {'role': msg['role'], 'content': msg['content']}
+            for msg in messages
+        ]
         
         print(f"   Using Databricks Agent API format (input=)")
         
+        request_started = time.time()
         try:
             # Primary format: input= (for agent endpoints like ka-6859840b-endpoint)
             # Note: Some agent endpoints may not support max_tokens parameter
+            request_inputs = {'input': input_messages, 'max_tokens': max_tokens}
             res = client.predict(
                 endpoint=endpoint_name,
-                inputs={'input': input_messages, 'max_tokens': max_tokens},
+                inputs=request_inputs,
             )
             print(f"   ✅ Success with 'input' format (with max_tokens={max_tokens})")
         except Exception as e1:
             print(f"   Format 1 (input=) failed: {str(e1)[:100]}")
             try:
                 # Fallback format: messages= (for standard chat endpoints)
+                request_inputs = {'messages': input_messages, "max_tokens": max_tokens}
                 res = client.predict(
                     endpoint=endpoint_name,
-                    inputs={'messages': messages, "max_tokens": max_tokens},
+                    inputs=request_inputs,
                 )
                 print(f"   ✅ Success with 'messages' format")
             except Exception as e2:
                 print(f"   Format 2 (messages=) failed: {str(e2)[:100]}")
                 # Last try: just the messages array
+                request_inputs = input_messages
                 res = client.predict(
                     endpoint=endpoint_name,
-                    inputs=messages,
+                    inputs=request_inputs,
                 )
                 print(f"   ✅ Success with direct messages array")
         
         print(f"📥 Response received: {type(res)}")
         print(f"   Response keys: {res.keys() if isinstance(res, dict) else 'not a dict'}")
         
-        # Handle different response formats
-        
-        # Format 1: Direct messages array
-        if "messages" in res:
-            print("   Response format: messages array")
-            return res["messages"]
-        
-        # Format 2: OpenAI-compatible format with choices
-        elif "choices" in res:
-            print("   Response format: choices array")
-            choice_message = res["choices"][0]["message"]
-            choice_content = choice_message.get("content")
-            
-            # Case 2a: Content is a list of structured objects
-            if isinstance(choice_content, list):
-                print("   Content type: structured list")
-                combined_content = "".join([
-                    part.get("text", "") 
-                    for part in choice_content 
-                    if part.get("type") == "text"
-                ])
-                reformatted_message = {
-                    "role": choice_message.get("role"),
-                    "content": combined_content
-                }
-                return [reformatted_message]
-            
-            # Case 2b: Content is a simple string
-            elif isinstance(choice_content, str):
-                print("   Content type: string")
-                return [choice_message]
+        if recorder is not None:
+            recorder.record(endpoint_name, request_inputs, res, time.time() - request_started)
         
-        # Format 3: Databricks agent format with output
-        # This matches: response.output[0].content[0].text
-        elif "output" in res:
-            print("   Response format: Databricks agent output")
-            output = res["output"]
-            
-            if isinstance(output, list) and len(output) > 0:
-                # Extract content from output array
-                first_output = output[0]
-                print(f"   First output type: {type(first_output)}")
-                
-                if isinstance(first_output, dict):
-                    # Check for content array (response.output[0].content[].text)
-                    # IMPORTANT: content is a LIST of chunks, each with its own text!
-                    if "content" in first_output and isinstance(first_output["content"], list):
-                        content_list = first_output["content"]
-                        print(f"   Content list length: {len(content_list)} chunks")
-                        
-                        # Concatenate ALL text chunks from all content items
-                        all_text_chunks = []
-                        for i, content_item in enumerate(content_list):
-                            if isinstance(content_item, dict) and "text" in content_item:
-                                chunk_text = content_item["text"]
-                                all_text_chunks.append(chunk_text.strip())  # Strip whitespace
-                                print(f"   Chunk {i}: {len(chunk_text)} chars")
-                            elif isinstance(content_item, str):
-                                all_text_chunks.append(content_item.strip())
-                        
-                        # Combine all chunks with blank lines between them for readability
-                        full_text = "\n\n".join(all_text_chunks)
-                        print(f"   ✅ Total extracted text length: {len(full_text)} chars")
-                        
-                        return [{
-                            "role": "assistant",
-                            "content": full_text
-                        }]
-                    # Check for direct content string
-                    elif "content" in first_output and isinstance(first_output["content"], str):
-                        return [{
-                            "role": "assistant",
-                            "content": first_output["content"]
-                        }]
-                    # Check if output itself has text field
-                    elif "text" in first_output:
-                        return [{
-                            "role": "assistant",
-                            "content": first_output["text"]
-                        }]
-        
-        # Format 4: Direct text response (some simple endpoints)
-        elif "text" in res:
-            print("   Response format: direct text")
-            return [{
-                "role": "assistant",
-                "content": res["text"]
-            }]
-        
-        # Format 5: Direct content field
-        elif "content" in res:
-            print("   Response format: direct content")
-            return [{
-                "role": "assistant",
-                "content": res["content"]
-            }]
-        
-        # If we get here, log the response and try to extract any text
-        print(f"⚠️  Unrecognized response format. Full response: {res}")
-        
-        # Last resort: try to find any text-like content
-        if isinstance(res, dict):
-            # Check if there's a predictions field
-            if "predictions" in res:
-                pred = res["predictions"]
-                if isinstance(pred, list) and len(pred) > 0:
-                    return [{
-                        "role": "assistant",
-                        "content": str(pred[0])
-                    }]
-            
-            # Try to convert the whole response to string
-            return [{
-                "role": "assistant",
-                "content": f"Response received (unexpected format): {str(res)[:500]}"
-            }]
-        
-        raise Exception(
-            f"Unable to parse response from endpoint. Response type: {type(res)}. "
-            "Please check the endpoint output format."
-        )
+        response_messages = list(_parse_endpoint_response(res))
+        answer = response_messages[-1].get("content") or ""
+        usage = _extract_usage(res) or _estimate_usage(messages, answer)
+        response_messages[-1] = dict(response_messages[-1], usage=usage)
+        finish_reason = _extract_finish_reason(res)
+        if finish_reason is not None:
+            response_messages[-1]["finish_reason"] = finish_reason
+        return response_messages
         
     except Exception as e:
         print(f"❌ Error querying endpoint: {str(e)}")
@@ -226,18 +164,439 @@ def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_toke
         traceback.print_exc()
         raise
 
-def query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens: int = 2048) -> dict[str, str]:
+def _parse_endpoint_response(res) -> list[dict[str, str]]:
+    """
+    Extract the assistant message(s) from a raw serving-endpoint response.
+    
+    Args:
+        res: Response returned by client.predict()
+        
+    Returns:
+        List of message dictionaries with the assistant response
+    """
+    # Handle different response formats
+
+    # Format 1: Direct messages array
+    if "messages" in res:
+        print("   Response format: messages array")
+        return res["messages"]
+
+    # Format 2: OpenAI-compatible format with choices
+    elif "choices" in res:
+        print("   Response format: choices array")
+        choice_message = res["choices"][0]["message"]
+        choice_content = choice_message.get("content")
+
+        # Case 2a: Content is a list of structured objects
+        if isinstance(choice_content, list):
+            print("   Content type: structured list")
+            combined_content = "".join([
+                part.get("text", "") 
+                for part in choice_content 
+                if part.get("type") == "text"
+            ])
+            reformatted_message = {
+                "role": choice_message.get("role"),
+                "content": combined_content
+            }
+            return [reformatted_message]
+
+        # Case 2b: Content is a simple string
+        elif isinstance(choice_content, str):
+            print("   Content type: string")
+            return [choice_message]
+
+    # Format 3: Databricks agent format with output
+    # This matches: response.output[0].content[0].text
+    elif "output" in res:
+        print("   Response format: Databricks agent output")
+        output = res["output"]
+
+        if isinstance(output, list) and len(output) > 0:
+            # Extract content from output array
+            first_output = output[0]
+            print(f"   First output type: {type(first_output)}")
+
+            if isinstance(first_output, dict):
+                # Check for content array (response.output[0].content[].text)
+                # IMPORTANT: content is a LIST of chunks, each with its own text!
+                if "content" in first_output and isinstance(first_output["content"], list):
+                    content_list = first_output["content"]
+                    print(f"   Content list length: {len(content_list)} chunks")
+
+                    # Concatenate ALL text chunks from all content items
+                    all_text_chunks = []
+                    for i, content_item in enumerate(content_list):
+                        if isinstance(content_item, dict) and "text" in content_item:
+                            chunk_text = content_item["text"]
+                            all_text_chunks.append(chunk_text.strip())  # Strip whitespace
+                            print(f"   Chunk {i}: {len(chunk_text)} chars")
+                        elif isinstance(content_item, str):
+                            all_text_chunks.append(content_item.strip())
+
+                    # Combine all chunks with blank lines between them for readability
+                    full_text = "\n\n".join(all_text_chunks)
+                    print(f"   ✅ Total extracted text length: {len(full_text)} chars")
+
+                    return [{
+                        "role": "assistant",
+                        "content": full_text
+                    }]
+                # Check for direct content string
+                elif "content" in first_output and isinstance(first_output["content"], str):
+                    return [{
+                        "role": "assistant",
+                        "content": first_output["content"]
+                    }]
+                # Check if output itself has text field
+                elif "text" in first_output:
+                    return [{
+                        "role": "assistant",
+                        "content": first_output["text"]
+                    }]
+
+    # Format 4: Direct text response (some simple endpoints)
+    elif "text" in res:
+        print("   Response format: direct text")
+        return [{
+            "role": "assistant",
+            "content": res["text"]
+        }]
+
+    # Format 5: Direct content field
+    elif "content" in res:
+        print("   Response format: direct content")
+        return [{
+            "role": "assistant",
+            "content": res["content"]
+        }]
+
+    # If we get here, log the response and try to extract any text
+    print(f"⚠️  Unrecognized response format. Full response: {res}")
+
+    # Last resort: try to find any text-like content
+    if isinstance(res, dict):
+        # Check if there's a predictions field
+        if "predictions" in res:
+            pred = res["predictions"]
+            if isinstance(pred, list) and len(pred) > 0:
+                return [{
+                    "role": "assistant",
+                    "content": str(pred[0])
+                }]
+
+        # Try to convert the whole response to string
+        return [{
+            "role": "assistant",
+            "content": f"Response received (unexpected format): {str(res)[:500]}"
+        }]
+
+    raise Exception(
+        f"Unable to parse response from endpoint. Response type: {type(res)}. "
+        "Please check the endpoint output format."
+    )
+
+def _extract_usage(res) -> Optional[dict]:
+    """
+    Token usage reported by the endpoint, if any.
+    
+    Chat endpoints return usage.prompt_tokens/completion_tokens, agent
+    (responses API) endpoints usage.input_tokens/output_tokens.
+    """
+    if not isinstance(res, dict):
+        return None
+    usage = res.get("usage")
+    if not isinstance(usage, dict) and isinstance(res.get("metadata"), dict):
+        usage = res["metadata"].get("usage")
+    if not isinstance(usage, dict):
+        return None
+    prompt_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    return {
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "estimated": False,
+    }
+
+def _extract_finish_reason(res) -> Optional[str]:
+    """
+    Why generation stopped, if the endpoint says; "length" when max_tokens ran out.
+    
+    Chat endpoints return choices[0].finish_reason, agent (responses API)
+    endpoints status "incomplete" with incomplete_details.reason.
+    """
+    if not isinstance(res, dict):
+        return None
+    choices = res.get("choices")
+    if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+        return choices[0].get("finish_reason")
+    details = res.get("incomplete_details")
+    if isinstance(details, dict) and details.get("reason"):
+        return "length" if details["reason"] == "max_output_tokens" else details["reason"]
+    if res.get("status") == "completed":
+        return "stop"
+    return None
+
+def _estimate_usage(messages: list[dict[str, str]], answer) -> dict:
+    """Heuristic usage for responses without a usage field."""
+    return {
+        "prompt_tokens": sum(message_tokens(msg) for msg in messages),
+        "completion_tokens": estimate_tokens(str(answer)),
+        "estimated": True,
+    }
+
+def query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens: int = 2048,
+                   client=None) -> dict[str, str]:
     """
     Query a Databricks serving endpoint and return the last message.
     
     Args:
         endpoint_name: Name of the serving endpoint
         messages: List of chat messages
-        max_tokens: Maximum tokens to generate (default: 512)
+        max_tokens: Maximum tokens to generate (default: 2048)
+        client: Deployment client to use (default: the shared serving client)
         
     Returns:
-        The last message dictionary from the response
+        The last message dictionary from the response, with the call's token
+        usage under 'usage' and, when the endpoint reports it, 'finish_reason'
     """
-    response_messages = _query_endpoint(endpoint_name, messages, max_tokens)
+    response_messages = _query_endpoint(endpoint_name, messages, max_tokens, client=client)
     return response_messages[-1]
 
+
+def parse_endpoint_spec(spec: str) -> list[tuple[str, float]]:
+    """
+    Parse a SERVING_ENDPOINT value into (endpoint_name, weight) pairs.
+    
+    Accepts a single endpoint name or a comma-separated weighted list,
+    e.g. "ka-6859840b-endpoint" or "ka-primary:3, ka-secondary:1".
+    Weights default to 1.
+    """
+    endpoints = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, weight = part, 1.0
+        if ':' in part:
+            candidate, _, raw_weight = part.rpartition(':')
+            try:
+                name, weight = candidate.strip(), float(raw_weight)
+            except ValueError:
+                name, weight = part, 1.0
+        if weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive: {part}")
+        endpoints.append((name, weight))
+    if not endpoints:
+        raise ValueError(f"No serving endpoints in spec: {spec!r}")
+    return endpoints
+
+
+class EndpointStats:
+    """Live routing statistics for one serving endpoint"""
+    
+    def __init__(self, name: str, weight: float, initial_latency: float):
+        self.name = name
+        self.weight = weight
+        self.ewma_latency = initial_latency
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.recovered_at = None
+        self.last_observed_at = None
+        self.selected = 0
+        self.successes = 0
+        self.failures = 0
+    
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+    
+    def snapshot(self, now: float, slow_start_factor: float) -> dict:
+        return {
+            'weight': self.weight,
+            'ewma_latency_ms': round(self.ewma_latency * 1000, 1),
+            'error_rate': round(self.error_rate, 4),
+            'in_flight': self.in_flight,
+            'ejected': self.is_ejected(now),
+            'ejections': self.ejections,
+            'slow_start_factor': round(slow_start_factor, 3),
+            'selected': self.selected,
+            'successes': self.successes,
+            'failures': self.failures,
+        }
+
+
+class EndpointRouter:
+    """
+    Latency-aware router over one or more serving endpoints.
+    
+    Each request goes to the endpoint with the lowest expected cost: EWMA
+    latency times (in-flight + 1), divided by the endpoint's weight scaled
+    down by its recent error rate. Endpoints that fail eject_after times in
+    a row are ejected for a cooldown (doubling on repeated ejections); once
+    the cooldown passes they receive a probe request, and after a success
+    their share of traffic ramps up linearly over slow_start_seconds.
+    Failed requests fail over to the next best endpoint.
+    
+    Latency and error penalties fade with a half-life of decay_seconds while
+    an endpoint is not receiving traffic, so an endpoint that was slow once
+    is eventually retried instead of being starved forever.
+    """
+    
+    def __init__(self, endpoints: list[tuple[str, float]], query_fn=None, alpha: float = 0.3,
+                 initial_latency: float = 2.0, eject_after: int = 3, cooldown_seconds: float = 30.0,
+                 max_cooldown_seconds: float = 300.0, slow_start_seconds: float = 60.0,
+                 decay_seconds: float = 30.0):
+        """
+        Args:
+            endpoints: (endpoint_name, weight) pairs, e.g. from parse_endpoint_spec()
+            query_fn: Callable(endpoint_name, messages, max_tokens) -> message dict
+                (default: query_endpoint; pass a mock for local testing)
+            alpha: EWMA smoothing factor for latency and error rate
+            initial_latency: Latency assumed for endpoints with no observations yet (seconds)
+            eject_after: Consecutive failures before an endpoint is ejected
+            cooldown_seconds: First ejection duration
+            max_cooldown_seconds: Upper bound for repeated ejections
+            slow_start_seconds: Time over which a recovered endpoint ramps back to full weight
+            decay_seconds: Half-life of latency and error penalties for idle endpoints
+        """
+        self.query_fn = query_fn or query_endpoint
+        self.alpha = alpha
+        self.eject_after = eject_after
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.slow_start_seconds = slow_start_seconds
+        self.decay_seconds = decay_seconds
+        self.endpoints = [EndpointStats(name, weight, initial_latency) for name, weight in endpoints]
+        self.failovers = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_spec(cls, spec: str, **kwargs) -> "EndpointRouter":
+        """Build a router from a SERVING_ENDPOINT value (see parse_endpoint_spec)."""
+        return cls(parse_endpoint_spec(spec), **kwargs)
+    
+    @property
+    def endpoint_names(self) -> list[str]:
+        return [ep.name for ep in self.endpoints]
+    
+    def _slow_start_factor(self, ep: EndpointStats, now: float) -> float:
+        if ep.recovered_at is None or self.slow_start_seconds <= 0:
+            return 1.0
+        return min(1.0, max(0.1, (now - ep.recovered_at) / self.slow_start_seconds))
+    
+    def _cost(self, ep: EndpointStats, now: float, fastest: float) -> float:
+        latency, error_rate = ep.ewma_latency, ep.error_rate
+        if ep.last_observed_at is not None and self.decay_seconds > 0:
+            # Fade stale penalties towards the fastest endpoint's latency and no errors
+            remaining = 0.5 ** ((now - ep.last_observed_at) / self.decay_seconds)
+            latency = fastest + (latency - fastest) * remaining
+            error_rate *= remaining
+        effective_weight = ep.weight * self._slow_start_factor(ep, now) * max(0.05, 1.0 - error_rate)
+        # Tiny jitter spreads ties between identical idle endpoints
+        return latency * (ep.in_flight + 1) / effective_weight * (1 + random.random() * 0.01)
+    
+    def _choose(self, exclude: set, prefer: Optional[str] = None) -> Optional[EndpointStats]:
+        """Pick the next endpoint and count it as in flight. Caller holds the lock."""
+        now = time.time()
+        candidates = [ep for ep in self.endpoints if ep.name not in exclude]
+        if not candidates:
+            return None
+        healthy = [ep for ep in candidates if not ep.is_ejected(now)]
+        preferred = next((ep for ep in healthy if ep.name == prefer), None)
+        if preferred is not None:
+            chosen = preferred
+        elif healthy:
+            fastest = min(ep.ewma_latency for ep in healthy)
+            chosen = min(healthy, key=lambda ep: self._cost(ep, now, fastest))
+        else:
+            # Everything is ejected - probe the one that comes back soonest
+            chosen = min(candidates, key=lambda ep: ep.ejected_until)
+        chosen.in_flight += 1
+        chosen.selected += 1
+        return chosen
+    
+    def _record(self, ep: EndpointStats, latency: float, ok: bool) -> None:
+        now = time.time()
+        with self._lock:
+            ep.in_flight -= 1
+            ep.last_observed_at = now
+            ep.error_rate += self.alpha * ((0.0 if ok else 1.0) - ep.error_rate)
+            if ok:
+                ep.ewma_latency += self.alpha * (latency - ep.ewma_latency)
+                ep.successes += 1
+                if ep.consecutive_failures >= self.eject_after:
+                    print(f"💚 Endpoint {ep.name} recovered, slow-starting over {self.slow_start_seconds:.0f}s")
+                    ep.recovered_at = now
+                    ep.ejected_until = 0.0
+                ep.consecutive_failures = 0
+            else:
+                ep.failures += 1
+                ep.consecutive_failures += 1
+                if ep.consecutive_failures >= self.eject_after:
+                    cooldown = min(self.max_cooldown_seconds,
+                                   self.cooldown_seconds * 2 ** (ep.consecutive_failures - self.eject_after))
+                    ep.ejected_until = now + cooldown
+                    ep.ejections += 1
+                    print(f"🚫 Endpoint {ep.name} ejected for {cooldown:.0f}s "
+                          f"after {ep.consecutive_failures} consecutive failures")
+    
+    def query(self, messages: list[dict[str, str]], max_tokens: int = 2048,
+              prefer: Optional[str] = None) -> dict[str, str]:
+        """
+        Route a request, failing over to the other endpoints on error.
+        
+        Args:
+            messages: List of chat messages
+            max_tokens: Maximum tokens to generate
+            prefer: Endpoint to use while it is healthy (e.g. a larger model for
+                long-form questions); falls back to normal routing otherwise
+            
+        Returns:
+            The last message dictionary from the response, with the endpoint
+            that answered under 'endpoint'
+        """
+        tried = set()
+        last_error = None
+        while True:
+            with self._lock:
+                ep = self._choose(tried, prefer)
+            if ep is None:
+                break
+            if tried:
+                with self._lock:
+                    self.failovers += 1
+                print(f"↪️ Failing over to endpoint {ep.name}")
+            tried.add(ep.name)
+            
+            start = time.time()
+            try:
+                response = self.query_fn(ep.name, messages, max_tokens)
+            except Exception as e:
+                self._record(ep, time.time() - start, ok=False)
+                last_error = e
+                continue
+            self._record(ep, time.time() - start, ok=True)
+            return dict(response, endpoint=ep.name)
+        
+        with self._lock:
+            self.exhausted += 1
+        raise last_error or Exception("No serving endpoints available")
+    
+    def metrics(self) -> dict:
+        """Routing decisions and per-endpoint health, for the /metrics route"""
+        now = time.time()
+        with self._lock:
+            return {
+                'failovers': self.failovers,
+                'exhausted': self.exhausted,
+                'endpoints': {
+                    ep.name: ep.snapshot(now, self._slow_start_factor(ep, now))
+                    for ep in self.endpoints
+                },
+            }
@@ -0,0 +1,260 @@
+"""
+Opt-in sampling profiler for Dash callback requests
+
+When enabled (PROFILE_ENABLED=true, or POST /admin/profiler at runtime), a
+fraction of Dash callback requests whose outputs match PROFILE_OUTPUTS
+(by default the chat callbacks: sending a message, loading older messages,
+clearing) are profiled. While a profiled request is running, a background
+thread samples that request's Python stack every PROFILE_INTERVAL_MS and
+counts the collapsed stacks, so the profile covers the whole request:
+callback argument decoding, the agent call and response parsing, rendering
+and the JSON serialisation of the response.
+
+The PROFILE_KEEP_SLOWEST slowest profiles are kept in memory and written to
+PROFILE_DIR as collapsed-stack ("folded") files, which flamegraph.pl,
+speedscope and inferno read directly. Stacks from every sampled request are
+also merged into one aggregate profile.
+
+When profiling is off the only cost is one attribute check per request.
+
+Routes (guarded by ADMIN_TOKEN, see metrics.require_admin):
+    GET  /admin/profiler                  status and the slowest profiles
+    POST /admin/profiler                  {"enabled": true, "sample_rate": 0.1}
+    GET  /admin/profiler/<id>.folded      one profile
+    GET  /admin/profiler/aggregate.folded all sampled requests merged
+"""
+
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import flask
+
+import metrics
+
+MAX_STACK_DEPTH = 128
+
+
+def _collapse(frame) -> str:
+    """Render a frame's stack root-first in collapsed-stack format."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Profile:
+    __slots__ = ('id', 'path', 'outputs', 'started_at', 'duration', 'samples', 'file')
+
+    def __init__(self, profile_id: int, path: str, outputs: str):
+        self.id = profile_id
+        self.path = path
+        self.outputs = outputs
+        self.started_at = time.time()
+        self.duration = None
+        self.samples = Counter()
+        self.file = None
+
+    def __lt__(self, other):
+        return self.duration < other.duration
+
+    def folded(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'outputs': self.outputs,
+            'started_at': round(self.started_at, 3),
+            'duration_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'samples': sum(self.samples.values()),
+            'file': self.file,
+        }
+
+
+class SamplingProfiler:
+    """Statistical profiler for a sampled subset of requests"""
+
+    def __init__(self, enabled: bool = None, sample_rate: float = None, interval_ms: float = None,
+                 keep_slowest: int = None, output_dir: str = None, outputs_filter: str = None):
+        """
+        Defaults come from the PROFILE_* environment variables (see README).
+
+        Args:
+            enabled: Profile requests at all
+            sample_rate: Fraction of matching requests profiled
+            interval_ms: Stack sampling interval
+            keep_slowest: Slowest profiles kept in memory and on disk
+            output_dir: Directory the folded profiles are written to
+            outputs_filter: Only Dash callbacks whose outputs contain this string are profiled
+        """
+        self.enabled = (enabled if enabled is not None
+                        else os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes'))
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILE_SAMPLE_RATE', '0.05'))
+        self.interval = (interval_ms or float(os.getenv('PROFILE_INTERVAL_MS', '5'))) / 1000
+        self.keep_slowest = keep_slowest or int(os.getenv('PROFILE_KEEP_SLOWEST', '20'))
+        self.output_dir = output_dir or os.getenv('PROFILE_DIR', 'profiles')
+        self.outputs_filter = outputs_filter if outputs_filter is not None else os.getenv('PROFILE_OUTPUTS', 'chat-history')
+
+        self._active = {}
+        self._slowest: list[_Profile] = []
+        self._aggregate = Counter()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._sampler = None
+        self.stats = {'requests_seen': 0, 'profiled': 0, 'samples': 0}
+
+    def _ensure_sampler(self) -> None:
+        """Start the sampling thread on first use. Caller holds the lock."""
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                active = dict(self._active)
+            frames = sys._current_frames()
+            with self._cond:
+                for thread_id, profile in active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.samples[_collapse(frame)] += 1
+                        self.stats['samples'] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def start(self, path: str, outputs: str):
+        """Begin profiling the current thread's request, or return None if not sampled."""
+        self.stats['requests_seen'] += 1
+        if random.random() >= self.sample_rate:
+            return None
+        profile = _Profile(next(self._ids), path, outputs)
+        with self._cond:
+            self._ensure_sampler()
+            self._active[threading.get_ident()] = profile
+            self.stats['profiled'] += 1
+            self._cond.notify()
+        return profile
+
+    def stop(self, profile: _Profile) -> None:
+        """Finish a profile and keep it if it is among the slowest."""
+        with self._cond:
+            self._active.pop(threading.get_ident(), None)
+            profile.duration = time.time() - profile.started_at
+            self._aggregate.update(profile.samples)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, profile)
+                evicted = None
+            elif self._slowest and profile.duration > self._slowest[0].duration:
+                evicted = heapq.heapreplace(self._slowest, profile)
+            else:
+                return
+        self._write(profile)
+        if evicted is not None and evicted.file:
+            try:
+                os.remove(evicted.file)
+            except OSError:
+                pass
+
+    def _write(self, profile: _Profile) -> None:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(profile.started_at))
+            path = os.path.join(self.output_dir, f"{stamp}-{profile.id}-{profile.duration * 1000:.0f}ms.folded")
+            with open(path, 'w') as f:
+                f.write(profile.folded())
+            profile.file = path
+        except OSError as e:
+            print(f"⚠️  Could not write profile: {e}")
+
+    def get(self, profile_id: int):
+        with self._cond:
+            return next((p for p in self._slowest if p.id == profile_id), None)
+
+    def aggregate_folded(self) -> str:
+        with self._cond:
+            return ''.join(f"{stack} {count}\n" for stack, count in self._aggregate.most_common())
+
+    def configure(self, enabled: bool = None, sample_rate: float = None) -> None:
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def metrics(self) -> dict:
+        """Counters only, for the public /metrics route"""
+        with self._cond:
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                sample_rate=self.sample_rate,
+                interval_ms=self.interval * 1000,
+                active=len(self._active),
+            )
+
+    def status(self) -> dict:
+        """metrics() plus the slowest profiles (callback outputs, file paths), for /admin/profiler only"""
+        status = self.metrics()
+        with self._cond:
+            status['slowest'] = [p.summary() for p in sorted(self._slowest, reverse=True)]
+        return status
+
+    # Flask hooks
+
+    def _before_request(self):
+        if not self.enabled or flask.request.path != '/_dash-update-component':
+            return
+        body = flask.request.get_json(silent=True) or {}
+        outputs = str(body.get('output', ''))
+        if self.outputs_filter and self.outputs_filter not in outputs:
+            return
+        profile = self.start(flask.request.path, outputs)
+        if profile is not None:
+            flask.g.profile = profile
+
+    def _teardown_request(self, _exc=None):
+        profile = flask.g.pop('profile', None)
+        if profile is not None:
+            self.stop(profile)
+
+    def register(self, app) -> None:
+        """Hook request profiling and the /admin/profiler routes into a Dash app's Flask server."""
+        server = app.server
+        server.before_request(self._before_request)
+        server.teardown_request(self._teardown_request)
+
+        @metrics.require_admin
+        def status():
+            if flask.request.method == 'POST':
+                body = flask.request.get_json(silent=True) or {}
+                self.configure(body.get('enabled'), body.get('sample_rate'))
+                print(f"🔬 Profiler {'enabled' if self.enabled else 'disabled'} "
+                      f"(sample rate {self.sample_rate:.0%})")
+            return flask.jsonify(self.status())
+
+        @metrics.require_admin
+        def folded(name):
+            if name == 'aggregate':
+                text = self.aggregate_folded()
+            else:
+                profile = self.get(int(name)) if name.isdigit() else None
+                if profile is None:
+                    flask.abort(404)
+                text = profile.folded()
+            return flask.Response(text, mimetype='text/plain')
+
+        server.add_url_rule('/admin/profiler', 'profiler_status', status, methods=['GET', 'POST'])
+        server.add_url_rule('/admin/profiler/<name>.folded', 'profiler_folded', folded)
+
+
+profiler = SamplingProfiler()
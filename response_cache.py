@@ -0,0 +1,157 @@
+"""
+In-process cache of agent answers
+
+Answers are keyed on a fingerprint of the normalised conversation that was
+sent to the endpoint, so the same question asked at the same point of a
+conversation (most commonly a suggested prompt as the first message) is
+answered without calling the serving endpoint again.
+
+With a shared cache (shared_cache.SharedCache) the in-process LRU is the
+first level: misses fall through to the host-wide cache, whose hits are
+copied into the LRU for their remaining lifetime, and new answers are
+written to both.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from memory_budget import approx_size, sampled_size
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case and collapse whitespace so trivially different questions share a key."""
+    return _WHITESPACE_RE.sub(' ', str(text)).strip().lower()
+
+
+def message_digest(role: str, normalized_content: str) -> str:
+    """Fingerprint one message from its role and normalised content."""
+    return hashlib.sha256(json.dumps([role, normalized_content]).encode('utf-8')).hexdigest()
+
+
+def conversation_key(messages: list) -> str:
+    """
+    Fingerprint a conversation for cache lookups.
+
+    The key is built from per-message digests, so ChatMessages (which cache
+    their digest) and plain dicts give the same key for the same conversation.
+
+    Args:
+        messages: List of message dicts (or ChatMessages) with 'role' and 'content'
+
+    Returns:
+        Hex digest identifying the normalised conversation
+    """
+    digests = [
+        getattr(msg, 'digest', None) or message_digest(msg['role'], normalize_text(msg['content']))
+        for msg in messages
+    ]
+    return hashlib.sha256(''.join(digests).encode('ascii')).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, shared=None):
+        """
+        Args:
+            max_entries: Maximum number of cached answers (default: RESPONSE_CACHE_MAX_ENTRIES or 1000)
+            ttl_seconds: Lifetime of a cached answer (default: RESPONSE_CACHE_TTL_SECONDS or 3600)
+            shared: Optional second-level SharedCache consulted on misses
+        """
+        self.max_entries = max_entries or int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+        self.shared = shared
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, local_only: bool = False) -> Optional[str]:
+        """Return the cached answer for a key, or None if missing or expired (local_only skips the shared cache)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        shared_entry = self.shared.get_with_expiry(key) if self.shared is not None and not local_only else None
+        with self._lock:
+            if shared_entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            answer, expires_at = shared_entry
+            self._store(key, answer, expires_at)
+            return answer
+
+    def _store(self, key: str, answer, expires_at: float) -> None:
+        """Insert into the LRU. Caller holds the lock."""
+        self._entries[key] = (expires_at, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, answer: str, ttl_seconds: float = None, local_only: bool = False) -> None:
+        """
+        Store an answer, evicting the least recently used entries when full.
+
+        local_only keeps it out of the shared cache, for per-customer results.
+        """
+        expires_at = time.time() + (ttl_seconds or self.ttl_seconds)
+        with self._lock:
+            self._store(key, answer, expires_at)
+        if self.shared is not None and not local_only:
+            self.shared.put(key, answer, expires_at)
+
+    def get_for(self, messages: list) -> Optional[str]:
+        """Look up the answer for a conversation."""
+        return self.get(conversation_key(messages))
+
+    def put_for(self, messages: list, answer: str) -> None:
+        """Cache the answer for a conversation."""
+        self.put(conversation_key(messages), answer)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the in-process entries (see memory_budget)."""
+        with self._lock:
+            return sampled_size(iter(self._entries.items()), count=len(self._entries))
+
+    def evict(self, target_bytes: int, idle_seconds: float = 0) -> int:
+        """Drop expired, then least recently used entries until about target_bytes are freed."""
+        now = time.time()
+        freed = 0
+        with self._lock:
+            for key in [key for key, (expires_at, _) in self._entries.items() if expires_at < now]:
+                freed += approx_size((key, self._entries.pop(key)))
+            while self._entries and freed < target_bytes:
+                freed += approx_size(self._entries.popitem(last=False))
+        return freed
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+            }
+        if self.shared is not None:
+            stats['shared'] = self.shared.metrics()
+        return stats
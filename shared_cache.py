@@ -0,0 +1,164 @@
+"""
+Host-wide second-level cache shared by all worker processes
+
+Each worker's ResponseCache is private, so with several workers a question
+answered by one is a miss on the others. SharedCache keeps answers in a
+local SQLite database in WAL mode that every worker on the host opens:
+
+- reads never take a write lock (WAL readers see a consistent snapshot
+  while a writer appends), and go through SQLite's memory-mapped I/O, so a
+  hit is a single indexed lookup with no cross-process coordination
+- reads are strictly read-only: expired rows are treated as misses and
+  removed later by the writer
+- writes upsert the row and, every EVICT_EVERY writes, delete expired rows
+  and trim the table back to max_entries (soonest-expiring first)
+- every SQLite error is logged once and treated as a miss, so a broken or
+  locked cache file never fails a request
+
+Values are stored as JSON, so strings, lists and dicts round-trip.
+
+Cached answers can contain customer details, so the cache is opt-in: it is
+only used when SHARED_CACHE_PATH is set, and the database file (and its
+directory, when created here) is only readable by the app's own user.
+Callers keep per-customer results such as transcript summaries out of it
+(see ResponseCache.put(local_only=True)).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+EVICT_EVERY = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class SharedCache:
+    """SQLite-backed cache shared by the worker processes on one host"""
+
+    def __init__(self, path: str, max_entries: int = 20000, mmap_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            max_entries: Rows kept before the soonest-expiring are evicted
+            mmap_bytes: SQLite memory-mapped I/O size for reads
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._warned = False
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evicted': 0, 'errors': 0}
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Create the file owner-only before SQLite opens it; the WAL and shared-memory
+            # files SQLite creates next to it take the same permissions
+            os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+            os.chmod(path, 0o600)
+        except OSError as e:
+            self._failed('setup', e)
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedCache"]:
+        """The shared cache at SHARED_CACHE_PATH, or None when it is not set."""
+        path = os.getenv('SHARED_CACHE_PATH')
+        if not path:
+            return None
+        return cls(path, max_entries=int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '20000')))
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection, reopened after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_bytes)}')
+            conn.execute(_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += n
+
+    def _failed(self, action: str, error: Exception) -> None:
+        with self._lock:
+            self.stats['errors'] += 1
+            warn, self._warned = not self._warned, True
+        if warn:
+            print(f"⚠️  Shared cache {action} failed ({error}); continuing without it")
+
+    def get_with_expiry(self, key: str) -> Optional[tuple]:
+        """Return (value, expires_at) for a live entry, or None."""
+        try:
+            row = self._connection().execute(
+                'SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?',
+                (key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed('read', e)
+            return None
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(row[0]), row[1]
+
+    def get(self, key: str):
+        """Return the cached value for a key, or None."""
+        entry = self.get_with_expiry(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, value, expires_at: float) -> None:
+        """Store a value until expires_at (epoch seconds)."""
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT INTO entries (key, value, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                (key, json.dumps(value), expires_at),
+            )
+            with self._lock:
+                self.stats['writes'] += 1
+                self._writes += 1
+                evict = self._writes % EVICT_EVERY == 0
+            if evict:
+                self._evict(conn)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._failed('write', e)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        removed = conn.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),)).rowcount
+        excess = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires_at LIMIT ?)',
+                (excess,),
+            ).rowcount
+        self._count('evicted', max(0, removed))
+
+    def metrics(self) -> dict:
+        """Counters and current size for /metrics"""
+        try:
+            entries = self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats, entries=entries, path=self.path, max_entries=self.max_entries)
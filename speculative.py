@@ -0,0 +1,213 @@
+"""
+Speculative prefetch of agent answers
+
+When a suggested prompt is selected the answer is started straight away,
+before the user presses Send. The in-flight result is attached to the
+session and handed back on Send if the conversation that is sent matches
+the one that was speculated on; if the user edited the text, or picked a
+different prompt, the speculation is cancelled (if not yet started) or its
+result discarded.
+
+Speculative work is capped at max_concurrency in-flight calls in total, so
+prompt clicks can never amplify load on the serving endpoint beyond that.
+Speculations nobody claims within ttl_seconds are dropped by a background
+sweep, so sessions that click a prompt and leave do not keep their answers;
+the memory governor can also drop them early (memory_size / evict_idle).
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from memory_budget import approx_size
+from response_cache import conversation_key
+
+
+@dataclass
+class Speculation:
+    """A speculative call attached to a session"""
+    key: str
+    future: Future
+    started_at: float
+
+
+class SpeculativeExecutor:
+    """Runs at most max_concurrency speculative agent calls and hands results to matching sends"""
+
+    def __init__(self, query_fn, max_concurrency: int = None, ttl_seconds: float = 120.0):
+        """
+        Args:
+            query_fn: Callable (messages, session_id=...) returning the answer text
+                (expected to consult and fill the response cache itself, and to
+                account the call's tokens to the session)
+            max_concurrency: Maximum in-flight speculative calls (default: SPECULATIVE_MAX_CONCURRENCY or 4)
+            ttl_seconds: Speculations not claimed within this time are dropped
+        """
+        self.query_fn = query_fn
+        self.max_concurrency = max_concurrency or int(os.getenv('SPECULATIVE_MAX_CONCURRENCY', '4'))
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='speculative')
+        self._sessions: dict[str, Speculation] = {}
+        self._in_flight = 0
+        # Re-entrant: cancelling a future under the lock runs _on_done synchronously
+        self._lock = threading.RLock()
+        self._sweeper = None
+        self.stats = {'started': 0, 'rejected': 0, 'used': 0, 'discarded': 0, 'expired': 0}
+
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(max(1.0, self.ttl_seconds / 2))
+            with self._lock:
+                self._expire()
+
+    def _start_sweeper(self) -> None:
+        """Start the background expiry sweep (once). Caller holds the lock."""
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='speculation-expiry', daemon=True)
+            self._sweeper.start()
+
+    def _on_done(self, _future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def start(self, session_id: str, messages: list) -> bool:
+        """
+        Start answering messages speculatively for a session.
+
+        Any previous speculation for the session is cancelled or discarded.
+
+        Args:
+            session_id: Browser session the result is attached to
+            messages: Conversation as it will be sent if the user presses Send
+
+        Returns:
+            True if a speculative call was started (or is already running for the same conversation)
+        """
+        key = conversation_key(messages)
+        with self._lock:
+            self._start_sweeper()
+            self._expire()
+            current = self._sessions.get(session_id)
+            if current is not None and current.key == key:
+                return True
+            if current is not None:
+                self._drop(session_id)
+            if self._in_flight >= self.max_concurrency:
+                self.stats['rejected'] += 1
+                print(f"⏭️ Speculation skipped for session {session_id[:8]}: {self._in_flight} already in flight")
+                return False
+            self._in_flight += 1
+            self.stats['started'] += 1
+            # Submitted under the lock so an overlapping click for the same session sees
+            # this speculation instead of starting (and being charged for) a second one;
+            # the tokens are charged to the session whether or not the answer is used
+            future = self._executor.submit(self.query_fn, list(messages), session_id=session_id)
+            future.add_done_callback(self._on_done)
+            self._sessions[session_id] = Speculation(key=key, future=future, started_at=time.time())
+        print(f"🔮 Speculating answer for session {session_id[:8]}")
+        return True
+
+    def take(self, session_id: str, messages: list, timeout: float = None,
+             on_timeout: Callable[[], Optional[str]] = None) -> Optional[str]:
+        """
+        Claim the speculative answer for the conversation being sent.
+
+        Args:
+            session_id: Browser session
+            messages: Conversation actually being sent
+            timeout: Seconds to wait for an in-flight speculation
+            on_timeout: Called when the speculation is not done within timeout; an
+                answer it returns is served while the call finishes in the background
+                (still warming the response cache), and if it returns None the same
+                call is waited for rather than starting another one
+
+        Returns:
+            The answer, or None if there is no matching speculation (or it failed,
+            or timed out without on_timeout)
+        """
+        with self._lock:
+            speculation = self._sessions.get(session_id)
+            if speculation is None:
+                return None
+            if speculation.key != conversation_key(messages):
+                # The user edited the prompt before sending
+                self._drop(session_id)
+                return None
+            del self._sessions[session_id]
+
+        try:
+            try:
+                answer = speculation.future.result(timeout=timeout)
+            except FuturesTimeoutError:
+                if on_timeout is None:
+                    raise
+                answer = on_timeout()
+                if answer is not None:
+                    return answer
+                answer = speculation.future.result()
+        except Exception as e:
+            print(f"⚠️ Speculative call failed, falling back to a direct call: {e}")
+            return None
+        with self._lock:
+            self.stats['used'] += 1
+        print(f"⚡ Using speculative answer for session {session_id[:8]} "
+              f"(started {time.time() - speculation.started_at:.1f}s ago)")
+        return answer
+
+    def discard(self, session_id: str) -> None:
+        """Cancel or discard any speculation attached to a session."""
+        with self._lock:
+            self._drop(session_id)
+
+    def _drop(self, session_id: str, stat: str = 'discarded') -> None:
+        """Remove a session's speculation, counting it under stat. Caller holds the lock."""
+        speculation = self._sessions.pop(session_id, None)
+        if speculation is not None:
+            # Only cancels if the call has not started; a running call still
+            # completes and warms the response cache
+            speculation.future.cancel()
+            self.stats[stat] += 1
+
+    def _expire(self) -> None:
+        """Drop speculations nobody claimed in time. Caller holds the lock."""
+        cutoff = time.time() - self.ttl_seconds
+        for session_id in [s for s, spec in self._sessions.items() if spec.started_at < cutoff]:
+            self._drop(session_id, 'expired')
+
+    @staticmethod
+    def _answer(speculation: Speculation) -> Optional[str]:
+        future = speculation.future
+        if future.done() and not future.cancelled() and future.exception() is None:
+            return future.result()
+        return None
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by unclaimed speculations, including finished answers."""
+        with self._lock:
+            speculations = list(self._sessions.values())
+        return sum(approx_size(speculation.key) + approx_size(self._answer(speculation))
+                   for speculation in speculations)
+
+    def evict_idle(self, target_bytes: int, idle_seconds: float) -> int:
+        """
+        Drop unclaimed speculations, oldest first, until about target_bytes are freed.
+
+        They are all unclaimed prefetches, at most ttl_seconds old, so none is
+        protected by idle_seconds.
+        """
+        freed = 0
+        with self._lock:
+            for session_id, speculation in sorted(self._sessions.items(), key=lambda item: item[1].started_at):
+                if freed >= target_bytes:
+                    break
+                freed += approx_size(speculation.key) + approx_size(self._answer(speculation))
+                self._drop(session_id)
+        return freed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, pending=len(self._sessions), in_flight=self._in_flight)
@@ -0,0 +1,218 @@
+"""
+Cache-friendly static asset pipeline
+
+Files under static/ (the chatbot stylesheet, self-hosted fonts and an
+optional vendored copy of the Bootstrap theme) are served from
+/_static/<name>.<hash>.<ext> with long-lived immutable cache headers, so
+repeat visits download nothing and a new deploy changes the URL instead of
+relying on revalidation. Text assets are pre-compressed with gzip (and
+brotli when the brotli package is installed) once at startup.
+
+Dash's own JavaScript bundles (/_dash-component-suites/...) are already
+fingerprinted and cached by Dash; they are compressed once on first
+request and the compressed bytes are reused for every later request.
+
+Fonts and the vendored theme are fetched by fetch_static_assets.sh. When a
+font file is missing the stylesheet falls back to the system font stack,
+and when the theme is missing the CDN URL is used, so the app still works
+from a plain checkout.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+mimetypes.add_type('font/woff2', '.woff2')
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+URL_PREFIX = '/_static'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = ('text/css', 'text/javascript', 'application/javascript',
+                      'application/json', 'image/svg+xml', 'text/html', 'text/plain')
+
+# Self-hosted fonts: family -> (file under static/, weight range)
+FONTS = {
+    'Inter': ('fonts/InterVariable.woff2', '100 900'),
+}
+
+
+def _compress(data: bytes) -> dict:
+    """Return every supported encoding of data, keyed by Content-Encoding value."""
+    encodings = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(data, quality=11)
+    return encodings
+
+
+def _negotiate(available) -> str:
+    """Pick the best encoding the client accepts ('identity' if none)."""
+    best = flask.request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in available])
+    return best or 'identity'
+
+
+class StaticAsset:
+    """A fingerprinted file with its pre-compressed variants"""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted_name = f"{stem}.{self.digest}{ext}"
+        self.etag = f'"{self.digest}"'
+        self.encodings = _compress(data) if self.mimetype in COMPRESSIBLE_TYPES else {}
+
+
+class StaticAssets:
+    """Serves files from static/ under fingerprinted URLs and compresses Dash bundles"""
+
+    def __init__(self, static_dir: str = STATIC_DIR, url_prefix: str = URL_PREFIX):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix
+        self._assets: dict[str, StaticAsset] = {}
+        self._by_fingerprint: dict[str, StaticAsset] = {}
+        self._bundle_cache: dict[tuple, bytes] = {}
+        self._bundle_lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Read, fingerprint and pre-compress every file under static_dir."""
+        if not os.path.isdir(self.static_dir):
+            return
+
+        css_files = []
+        for root, _, files in os.walk(self.static_dir):
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                if name.endswith('.css'):
+                    css_files.append((name, path))
+                    continue
+                with open(path, 'rb') as f:
+                    self._add(StaticAsset(name, f.read()))
+
+        # Stylesheets last, so url(...) references to other assets can be
+        # rewritten to their fingerprinted URLs before the CSS is hashed
+        for name, path in css_files:
+            with open(path, 'rb') as f:
+                css = f.read().decode('utf-8')
+            self._add(StaticAsset(name, self._rewrite_css_urls(name, css).encode('utf-8')))
+
+        print(f"📦 Static assets: {len(self._assets)} file(s), "
+              f"compression: {'gzip+brotli' if brotli is not None else 'gzip'}")
+
+    def _add(self, asset: StaticAsset) -> None:
+        self._assets[asset.name] = asset
+        self._by_fingerprint[asset.fingerprinted_name] = asset
+
+    def _rewrite_css_urls(self, css_name: str, css: str) -> str:
+        base = os.path.dirname(css_name)
+
+        def replace(match):
+            target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, '/')
+            url = self.url(target)
+            return f"url('{url}')" if url else match.group(0)
+
+        return re.sub(r"""url\((['"]?)(?!data:|https?:|/)([^'")]+)\1\)""", replace, css)
+
+    def url(self, name: str):
+        """Fingerprinted URL of a static file, or None if it does not exist."""
+        asset = self._assets.get(name)
+        return f"{self.url_prefix}/{asset.fingerprinted_name}" if asset else None
+
+    def stylesheet_url(self, name: str, fallback: str) -> str:
+        """Fingerprinted URL of a vendored stylesheet, falling back to its CDN URL."""
+        return self.url(name) or fallback
+
+    def head_tags(self, stylesheets: list[str]) -> str:
+        """
+        HTML for the page <head>: font preloads, @font-face rules and stylesheet links.
+
+        Args:
+            stylesheets: Names of stylesheets under static/ to link
+
+        Returns:
+            HTML string to insert into the Dash index template
+        """
+        tags = []
+        font_faces = []
+        for family, (name, weights) in FONTS.items():
+            url = self.url(name)
+            if not url:
+                continue
+            tags.append(f'<link rel="preload" href="{url}" as="font" type="font/woff2" crossorigin>')
+            font_faces.append(
+                f"@font-face{{font-family:'{family}';font-style:normal;font-weight:{weights};"
+                f"font-display:swap;src:url('{url}') format('woff2');}}"
+            )
+        if font_faces:
+            tags.append(f"<style>{''.join(font_faces)}</style>")
+        for name in stylesheets:
+            url = self.url(name)
+            if url:
+                tags.append(f'<link rel="stylesheet" href="{url}">')
+        return '\n'.join(tags)
+
+    def register(self, app) -> None:
+        """Add the /_static route and Dash bundle compression to a Dash app's Flask server."""
+        server = app.server
+        server.add_url_rule(f"{self.url_prefix}/<path:filename>", 'static_assets', self._serve)
+        server.after_request(self._compress_dash_bundle)
+
+    def _serve(self, filename):
+        asset = self._by_fingerprint.get(filename)
+        if asset is None:
+            flask.abort(404)
+
+        if asset.etag in flask.request.headers.get('If-None-Match', ''):
+            response = flask.Response(status=304)
+        else:
+            encoding = _negotiate(asset.encodings)
+            body = asset.encodings[encoding] if encoding != 'identity' else asset.data
+            response = flask.Response(body, mimetype=asset.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['ETag'] = asset.etag
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def _compress_dash_bundle(self, response):
+        """Serve Dash component bundles compressed, compressing each one only once."""
+        if (not flask.request.path.startswith('/_dash-component-suites/')
+                or response.status_code != 200
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        encoding = _negotiate(('br', 'gzip') if brotli is not None else ('gzip',))
+        if encoding == 'identity':
+            return response
+
+        key = (flask.request.path, encoding)
+        body = self._bundle_cache.get(key)
+        if body is None:
+            data = response.get_data()
+            body = brotli.compress(data, quality=11) if encoding == 'br' else gzip.compress(data, mtime=0)
+            with self._bundle_lock:
+                self._bundle_cache[key] = body
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
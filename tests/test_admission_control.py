@@ -0,0 +1,55 @@
+import pytest
+
+from admission_control import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs):
+    # Buckets that effectively never refill, so every token taken is visible
+    options = dict(max_concurrent=1, max_queue=0, slo_seconds=10.0, session_rate_per_minute=1e-6,
+                   session_burst=2, global_rate_per_second=1e-6, global_burst=2)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_busy_rejection_refunds_session_and_global_tokens():
+    admission = _controller()
+    running = admission.acquire('s1')
+    with pytest.raises(AdmissionRejected) as e:
+        admission.acquire('s1')
+    assert e.value.reason == 'busy'
+    admission.release(running)
+
+    # Without the refund both buckets would be empty by now
+    admission.release(admission.acquire('s1'))
+    assert admission._session_buckets['s1'].tokens == pytest.approx(0, abs=1e-3)
+    assert admission.global_bucket.tokens == pytest.approx(0, abs=1e-3)
+
+
+def test_queue_timeout_refunds_tokens():
+    admission = _controller(max_queue=4, slo_seconds=0.05, initial_service_time=0.01)
+    running = admission.acquire('s1')
+    with pytest.raises(AdmissionRejected) as e:
+        admission.acquire('s1')
+    assert e.value.reason == 'busy'
+    assert admission.metrics()['waiting'] == 0
+    admission.release(running)
+    admission.release(admission.acquire('s1'))
+
+
+def test_rate_limited_once_tokens_are_spent():
+    admission = _controller(max_concurrent=4)
+    admission.acquire('s1')
+    admission.acquire('s1')
+    with pytest.raises(AdmissionRejected) as e:
+        admission.acquire('s1')
+    assert e.value.reason == 'rate_limited'
+
+
+def test_duplicate_key_rejected_only_while_in_flight():
+    admission = _controller(max_concurrent=4, session_burst=3, global_burst=3)
+    ticket = admission.acquire('s1', dedup_key=('s1', 'same question'))
+    with pytest.raises(AdmissionRejected) as e:
+        admission.acquire('s1', dedup_key=('s1', 'same question'))
+    assert e.value.reason == 'duplicate'
+    admission.release(ticket)
+    admission.release(admission.acquire('s1', dedup_key=('s1', 'same question')))
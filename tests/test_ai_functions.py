@@ -0,0 +1,33 @@
+import gc
+
+import local_ai_sql
+from ai_functions_example import DatabricksAIFunctions
+from memory_budget import governor
+from response_cache import ResponseCache
+
+
+def _client():
+    connect = local_ai_sql.connector(latency_ms=0, connect_ms=0, query_ms=0)
+    return DatabricksAIFunctions(connect=connect, cache=ResponseCache(shared=None))
+
+
+def _cache_components():
+    return {name for name in governor.metrics()['components'] if name.startswith('ai_functions_cache#')}
+
+
+def test_cache_components_are_unregistered_with_the_client():
+    before = _cache_components()
+    ai = _client()
+    assert ai.classify_sentiment('Thanks, that was really helpful!') == 'positive'
+    assert len(_cache_components() - before) == 1
+    del ai
+    gc.collect()
+    assert _cache_components() == before
+
+
+def test_close_unregisters_the_cache():
+    before = _cache_components()
+    ai = _client()
+    ai.close()
+    ai.close()
+    assert _cache_components() == before
@@ -0,0 +1,46 @@
+import json
+import time
+
+from bulk_runner import BulkRunner, load_checkpoint
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+
+
+def _answer(messages, max_tokens):
+    return {'content': f"Answer to {messages[-1]['content']}", 'endpoint': 'ep'}
+
+
+def _questions(n):
+    for i in range(n):
+        yield str(i), [{'role': 'user', 'content': f'question {i}'}]
+
+
+def test_bulk_run_warms_the_shared_cache(tmp_path):
+    shared = SharedCache(str(tmp_path / 'shared.sqlite3'))
+    runner = BulkRunner(_answer, concurrency=2, rate=1000, cache=ResponseCache(shared=shared))
+    report = runner.run(_questions(5), str(tmp_path / 'out.jsonl'))
+    assert report['succeeded'] == 5
+
+    # A fresh process-local cache (like the app's) finds the answers in the shared tier
+    app_cache = ResponseCache(shared=shared)
+    assert app_cache.get_for([{'role': 'user', 'content': 'question 3'}]) == 'Answer to question 3'
+
+    calls = []
+    rerun = BulkRunner(lambda m, t: calls.append(m) or _answer(m, t), rate=1000,
+                       cache=ResponseCache(shared=shared))
+    assert rerun.run(_questions(5), str(tmp_path / 'again.jsonl'))['from_cache'] == 5
+    assert calls == []
+
+
+def test_interrupt_keeps_completed_results(tmp_path):
+    output = tmp_path / 'out.jsonl'
+
+    def interrupted():
+        yield from _questions(3)
+        time.sleep(0.2)  # let them finish
+        raise KeyboardInterrupt
+
+    report = BulkRunner(_answer, concurrency=2, rate=1000).run(interrupted(), str(output))
+    assert report['completed'] == 3
+    assert load_checkpoint(str(output), retry_errors=False) == {'0', '1', '2'}
+    assert all(json.loads(line)['answer'] for line in output.read_text().splitlines())
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import chat_message
+from chat_message import ChatMessage, clear_intern_table, intern_table_size
+from response_cache import conversation_key
+
+STORED = [
+    {'role': 'user', 'content': 'How do I check my credit score?'},
+    {'role': 'assistant', 'content': 'Open the app.\n\nYour score is on the dashboard.\nIt updates weekly.'},
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_intern_table():
+    clear_intern_table()
+    yield
+    clear_intern_table()
+
+
+def test_from_dict_interns_equal_messages():
+    first = ChatMessage.from_dict(dict(STORED[0]))
+    second = ChatMessage.from_dict(dict(STORED[0]))
+    assert first is second
+    assert ChatMessage.from_dict(first) is first
+    assert ChatMessage.intern('user', STORED[0]['content']) is first
+
+
+def test_store_round_trip():
+    messages = ChatMessage.from_store(STORED + [{'role': 'user'}, 'not a message'])
+    assert [m.role for m in messages] == ['user', 'assistant']
+    stored = ChatMessage.to_store(messages)
+    assert json.loads(json.dumps(stored)) == STORED
+    assert ChatMessage.from_store(stored) == messages
+
+
+def test_reads_like_a_dict():
+    message = ChatMessage.from_dict(STORED[1])
+    assert message['role'] == 'assistant'
+    assert message.get('content') == STORED[1]['content']
+    assert message.get('missing', 'default') == 'default'
+    assert 'content' in message and 'missing' not in message
+    with pytest.raises(KeyError):
+        message['missing']
+
+
+def test_derived_fields():
+    messages = ChatMessage.from_store(STORED)
+    assert messages[1].paragraphs == (('Open the app.',), ('Your score is on the dashboard.', 'It updates weekly.'))
+    assert messages[0].tokens > chat_message.MESSAGE_OVERHEAD_TOKENS
+    # Cache keys are the same whether computed from dicts or ChatMessages
+    assert conversation_key(messages) == conversation_key(STORED)
+
+
+def test_clear_intern_table_partially_and_fully():
+    interned = [ChatMessage.intern('user', f'question {n}') for n in range(20)]
+    full = intern_table_size()
+    assert full > 0
+
+    freed = clear_intern_table(full // 4)
+    assert 0 < freed < full
+    assert 0 < len(chat_message._intern) < 20
+    # The most recently interned messages are kept
+    assert ChatMessage.intern('user', 'question 19') is interned[19]
+    assert ChatMessage.intern('user', 'question 0') is not interned[0]
+
+    clear_intern_table()
+    assert intern_table_size() == 0
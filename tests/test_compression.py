@@ -0,0 +1,78 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from compression import CompressedServingClient, ServingError, compress, decompress
+
+
+@pytest.fixture
+def endpoint():
+    """Local endpoint answering with the queued status codes, then 200 with the decoded request."""
+    statuses = []
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            encoding = self.headers.get('Content-Encoding', 'identity')
+            seen.append(encoding)
+            status = statuses.pop(0) if statuses else 200
+            data = (json.dumps(json.loads(decompress(body, encoding))) if status == 200 else 'busy').encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", statuses, seen
+    server.shutdown()
+
+
+def _client(url, **kwargs):
+    return CompressedServingClient(url, auth=dict, encoding='gzip', min_bytes=10,
+                                   backoff_factor=0, backoff_jitter=0, **kwargs)
+
+
+def test_retries_throttled_request(endpoint):
+    url, statuses, seen = endpoint
+    statuses.extend([429, 503])
+    inputs = {'input': [{'role': 'user', 'content': 'How do I check my credit score?'}]}
+    assert _client(url).predict('agent', inputs) == inputs
+    assert len(seen) == 3
+
+
+def test_gives_up_after_max_retries(endpoint):
+    url, statuses, _ = endpoint
+    statuses.extend([503] * 3)
+    with pytest.raises(ServingError):
+        _client(url, max_retries=2).predict('agent', {'input': 'x' * 20})
+
+
+def test_falls_back_to_identity_on_415(endpoint):
+    url, statuses, seen = endpoint
+    statuses.append(415)
+    client = _client(url)
+    inputs = {'input': 'x' * 100}
+    assert client.predict('agent', inputs) == inputs
+    assert client.predict('agent', inputs) == inputs
+    assert seen == ['gzip', 'identity', 'identity']
+
+
+def test_roundtrip():
+    data = b'{"a": 1}' * 100
+    assert decompress(compress(data, 'gzip'), 'gzip') == data
+
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.delenv('SERVING_COMPRESSION', raising=False)
+    assert CompressedServingClient.from_env() is None
@@ -0,0 +1,54 @@
+from degraded_mode import DegradedMode
+
+QUESTION = "How long does it take for my credit score to update?"
+ANSWER = "Scores update weekly."
+
+
+def _mode(**kwargs):
+    return DegradedMode(mode='on', min_question_words=4, **kwargs)
+
+
+def test_serves_saved_answer_for_first_question():
+    mode = _mode()
+    mode.remember([{'role': 'user', 'content': QUESTION}], ANSWER)
+    fallback = mode.fallback([{'role': 'system', 'content': 'Be helpful'}, {'role': 'user', 'content': QUESTION}])
+    assert fallback is not None and fallback.endswith(ANSWER)
+
+
+def test_no_fallback_for_follow_ups():
+    mode = _mode()
+    mode.remember([{'role': 'user', 'content': QUESTION}], ANSWER)
+    conversation = [
+        {'role': 'user', 'content': 'Why was I declined for a loan last week?'},
+        {'role': 'assistant', 'content': 'Lenders look at several factors...'},
+        {'role': 'user', 'content': QUESTION},
+    ]
+    assert mode.fallback(conversation) is None
+    assert mode.stats['not_standalone'] == 1
+
+
+def test_follow_up_answers_are_not_saved():
+    mode = _mode()
+    mode.remember([
+        {'role': 'user', 'content': 'Can you explain my report in detail please?'},
+        {'role': 'assistant', 'content': 'Your report shows...'},
+        {'role': 'user', 'content': 'what about my other report'},
+    ], 'Private answer about another conversation')
+    assert len(mode.answers) == 0
+
+
+def test_short_questions_are_not_matched():
+    mode = _mode()
+    mode.remember([{'role': 'user', 'content': 'yes'}], ANSWER)
+    assert len(mode.answers) == 0
+    assert mode.fallback([{'role': 'user', 'content': 'why?'}]) is None
+
+
+def test_hysteresis_switches_on_and_off():
+    mode = DegradedMode(mode='auto', slo_seconds=1, min_samples=3, min_degraded_seconds=1e-9)
+    for _ in range(3):
+        mode.observe(0.1, ok=False)
+    assert mode.active
+    for _ in range(20):
+        mode.observe(0.1, ok=True)
+    assert not mode.active
@@ -0,0 +1,44 @@
+import pytest
+
+from model_serving_utils import EndpointRouter, parse_endpoint_spec
+
+
+def test_parse_endpoint_spec():
+    assert parse_endpoint_spec('ka-one') == [('ka-one', 1.0)]
+    assert parse_endpoint_spec('ka-primary:3, ka-secondary:1') == [('ka-primary', 3.0), ('ka-secondary', 1.0)]
+
+
+def test_fails_over_and_ejects_a_failing_endpoint():
+    calls = []
+
+    def query_fn(endpoint, messages, max_tokens):
+        calls.append(endpoint)
+        if endpoint == 'bad':
+            raise RuntimeError('unavailable')
+        return {'role': 'assistant', 'content': 'ok'}
+
+    router = EndpointRouter([('bad', 100.0), ('good', 1.0)], query_fn=query_fn, eject_after=2)
+    for _ in range(4):
+        assert router.query([{'role': 'user', 'content': 'hi'}])['endpoint'] == 'good'
+
+    # Two failures eject 'bad', after which it is no longer tried
+    assert calls.count('bad') == 2
+    metrics = router.metrics()
+    assert metrics['failovers'] == 2
+    assert metrics['endpoints']['bad']['ejections'] == 1
+
+
+def test_raises_when_every_endpoint_fails():
+    def query_fn(endpoint, messages, max_tokens):
+        raise RuntimeError(f'{endpoint} down')
+
+    router = EndpointRouter([('a', 1.0), ('b', 1.0)], query_fn=query_fn)
+    with pytest.raises(RuntimeError):
+        router.query([{'role': 'user', 'content': 'hi'}])
+    assert router.metrics()['exhausted'] == 1
+
+
+def test_prefer_uses_the_named_endpoint_while_healthy():
+    router = EndpointRouter([('small', 10.0), ('large', 1.0)],
+                            query_fn=lambda endpoint, messages, max_tokens: {'content': endpoint})
+    assert router.query([], prefer='large')['endpoint'] == 'large'
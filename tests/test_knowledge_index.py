@@ -0,0 +1,47 @@
+import pytest
+
+from knowledge_index import HashingEmbedder, KnowledgeIndex, ServingEndpointEmbedder
+
+ARTICLES = {
+    'account/closing.md': "Closing your account\n\nTo close your account, open Settings and choose Close account.",
+    'score/updates.md': "Score updates\n\nYour credit score updates every week with new data.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = KnowledgeIndex(str(tmp_path), embedder=HashingEmbedder(dim=64), initial_capacity=1)
+    for doc_id, text in ARTICLES.items():
+        index.add_document(doc_id, text, title=text.split('\n', 1)[0])
+    return index
+
+
+def test_add_and_search(index):
+    assert len(index) == 2
+    assert index.search('How do I close my account?', k=1)[0]['source'] == 'account/closing.md'
+
+
+def test_delete_reuses_rows(index):
+    capacity = index.capacity
+    assert index.delete_document('account/closing.md') == 1
+    assert all(r['source'] != 'account/closing.md' for r in index.search('close my account'))
+    index.add([{'id': 'new#0', 'text': 'Disputing an error on your report'}])
+    assert index.capacity == capacity
+    assert len(index) == 2
+
+
+def test_reopen_keeps_passages_and_embedder(index):
+    reopened = KnowledgeIndex(index.index_dir)
+    assert reopened.dim == 64
+    assert len(reopened) == 2
+    assert reopened.search('credit score updates', k=1)[0]['source'] == 'score/updates.md'
+
+
+def test_reopen_with_a_different_dimension_fails(index):
+    with pytest.raises(ValueError, match='64-d'):
+        KnowledgeIndex(index.index_dir, embedder=HashingEmbedder(dim=256))
+
+
+def test_reopen_with_a_different_embedder_fails(index):
+    with pytest.raises(ValueError, match='hashing'):
+        KnowledgeIndex(index.index_dir, embedder=ServingEndpointEmbedder('embeddings', dim=64))
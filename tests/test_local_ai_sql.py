@@ -0,0 +1,55 @@
+import sqlite3
+import threading
+import time
+
+import local_ai_sql
+from local_ai_sql import translate
+
+
+def _evaluate(expression):
+    return sqlite3.connect(':memory:').execute(f"SELECT {translate(expression)}").fetchone()[0]
+
+
+def test_backslash_escaped_quotes_are_requoted():
+    statement = r"SELECT 'It\'s my \\ account'"
+    assert translate(statement) == "SELECT 'It''s my \\ account'"
+    assert _evaluate(r"'It\'s'") == "It's"
+
+
+def test_named_arguments_become_positional():
+    assert translate("ai_summarize('text', 'max_length' => 100)") == "ai_summarize('text', 100)"
+    assert translate("ai_summarize('text', max_length => 100)") == "ai_summarize('text', 100)"
+
+
+def test_array_becomes_json_array():
+    assert translate("ai_classify('x', ARRAY('a', 'b'))") == "ai_classify('x', json_array('a', 'b'))"
+    assert _evaluate("array('a', 'b')") == '["a","b"]'
+
+
+def test_keywords_inside_string_literals_are_left_alone():
+    statement = "SELECT ai_classify('ARRAY(1) x => y', ARRAY('a'))"
+    assert translate(statement) == "SELECT ai_classify('ARRAY(1) x => y', json_array('a'))"
+
+
+def test_fake_functions_run_through_a_connection():
+    connect = local_ai_sql.connector(latency_ms=0, connect_ms=0, query_ms=0)
+    with connect() as connection, connection.cursor() as cursor:
+        cursor.execute(r"SELECT ai_classify('I\'m so happy, thanks', ARRAY('positive', 'neutral', 'negative'))")
+        assert cursor.fetchone() == ('positive',)
+
+
+def test_statements_beyond_max_concurrency_queue():
+    connect = local_ai_sql.connector(latency_ms=0, connect_ms=0, query_ms=50, jitter=0, max_concurrency=2)
+    connections = [connect() for _ in range(4)]
+
+    def run(connection):
+        connection.cursor().execute("SELECT 1")
+
+    threads = [threading.Thread(target=run, args=(c,)) for c in connections]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Four 50 ms statements two at a time take two rounds
+    assert time.perf_counter() - start >= 0.095
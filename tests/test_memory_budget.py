@@ -0,0 +1,56 @@
+import memory_budget
+from memory_budget import TIER_COLD_CACHE, MemoryGovernor, evictable_lru_cache
+
+
+def test_evictable_lru_sheds_only_the_coldest_entries():
+    @evictable_lru_cache(maxsize=100)
+    def square(n):
+        return n * n
+
+    for n in range(10):
+        square(n)
+    square(0)  # now the most recently used
+    freed = square.evict_bytes(30, lambda: len(square) * 10)
+    assert freed == 30
+    assert len(square) == 7
+    assert (0,) in square._entries and (1,) not in square._entries and (9,) in square._entries
+
+
+def test_evictable_lru_respects_maxsize_and_clears_by_default():
+    @evictable_lru_cache(maxsize=3)
+    def ident(n):
+        return n
+
+    for n in range(5):
+        ident(n)
+    assert len(ident) == 3
+    assert ident.evict_bytes(0, lambda: 300) == 300
+    assert len(ident) == 0
+
+
+def test_rss_pressure_does_not_evict_again_until_rss_grows(monkeypatch):
+    rss = [500 * 2**20]
+    monkeypatch.setattr(memory_budget, 'process_rss', lambda: rss[0])
+    evictions = []
+
+    def evict(target_bytes, idle_seconds):
+        evictions.append(target_bytes)
+        return 1024
+
+    governor = MemoryGovernor(budget_mb=100, rss_limit_mb=400)
+    governor.register('cache', lambda: 1024 * 1024, evict, TIER_COLD_CACHE)
+
+    assert governor.check() > 0
+    assert governor.check() == 0  # RSS did not fall, but nothing has grown either
+    assert governor.stats['rss_checks_skipped'] == 1
+    rss[0] += 10 * 2**20
+    assert governor.check() > 0
+    assert len(evictions) == 2
+
+
+def test_accounted_budget_is_still_enforced(monkeypatch):
+    monkeypatch.setattr(memory_budget, 'process_rss', lambda: None)
+    governor = MemoryGovernor(budget_mb=1)
+    governor.register('cache', lambda: 2 * 2**20, lambda target, idle: target, TIER_COLD_CACHE)
+    assert governor.check() > 0
+    assert governor.check() > 0
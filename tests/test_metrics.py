@@ -0,0 +1,25 @@
+import flask
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.add_url_rule('/admin/thing', 'thing', metrics.require_admin(lambda: 'ok'), methods=['GET', 'POST'])
+    return app.test_client()
+
+
+def test_admin_routes_disabled_without_token(client, monkeypatch):
+    monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+    assert client.get('/admin/thing').status_code == 403
+    assert client.post('/admin/thing').status_code == 403
+
+
+def test_admin_routes_require_matching_token(client, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+    assert client.get('/admin/thing').status_code == 403
+    assert client.get('/admin/thing', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/admin/thing', headers={'X-Admin-Token': 'secret'}).status_code == 200
+    assert client.get('/admin/thing?token=secret').status_code == 200
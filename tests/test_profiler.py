@@ -0,0 +1,31 @@
+import types
+
+import flask
+import pytest
+
+from profiler import SamplingProfiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = SamplingProfiler(enabled=True, sample_rate=1.0, output_dir=str(tmp_path))
+    profile = profiler.start('/_dash-update-component', 'chat-history.children')
+    profiler.stop(profile)
+    return profiler
+
+
+def test_public_metrics_publish_counters_only(profiler):
+    published = profiler.metrics()
+    assert published['profiled'] == 1
+    assert 'slowest' not in published
+
+
+def test_slowest_profiles_require_admin(profiler, monkeypatch):
+    monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+    server = flask.Flask(__name__)
+    profiler.register(types.SimpleNamespace(server=server))
+    client = server.test_client()
+
+    assert client.get('/admin/profiler').status_code == 403
+    status = client.get('/admin/profiler', headers={'X-Admin-Token': 'secret'}).get_json()
+    assert status['slowest'][0]['outputs'] == 'chat-history.children'
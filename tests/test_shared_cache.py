@@ -0,0 +1,46 @@
+import os
+import stat
+import threading
+import time
+
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+
+
+def test_disabled_without_path(monkeypatch):
+    monkeypatch.delenv('SHARED_CACHE_PATH', raising=False)
+    assert SharedCache.from_env() is None
+
+
+def test_file_is_owner_only(tmp_path, monkeypatch):
+    path = tmp_path / 'cache' / 'shared.sqlite3'
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(path))
+    cache = SharedCache.from_env()
+    cache.put('k', 'v', time.time() + 60)
+    assert cache.get('k') == 'v'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_local_only_entries_stay_out_of_shared_cache(tmp_path):
+    shared = SharedCache(str(tmp_path / 'shared.sqlite3'))
+    cache = ResponseCache(shared=shared)
+    cache.put('summary', 'Customer Jo asked about ...', local_only=True)
+    cache.put('answer', 'Scores update weekly.')
+    assert shared.get('summary') is None
+    assert shared.get('answer') == 'Scores update weekly.'
+    assert cache.get('summary', local_only=True) == 'Customer Jo asked about ...'
+
+
+def test_stats_are_consistent_across_threads(tmp_path):
+    shared = SharedCache(str(tmp_path / 'shared.sqlite3'))
+
+    def worker(n):
+        for i in range(50):
+            shared.get(f'{n}-{i}')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert shared.metrics()['misses'] == 400
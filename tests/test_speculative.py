@@ -0,0 +1,113 @@
+import threading
+import time
+
+from speculative import SpeculativeExecutor
+
+MESSAGES = [{'role': 'user', 'content': 'How do I check my credit score?'}]
+
+
+def test_speculative_calls_carry_the_session():
+    seen = []
+
+    def query(messages, session_id=None):
+        seen.append(session_id)
+        return 'answer'
+
+    speculator = SpeculativeExecutor(query, max_concurrency=2)
+    assert speculator.start('session-1', MESSAGES)
+    assert speculator.take('session-1', MESSAGES, timeout=5) == 'answer'
+    assert seen == ['session-1']
+
+
+def test_edited_prompt_discards_speculation():
+    speculator = SpeculativeExecutor(lambda messages, session_id=None: 'answer', max_concurrency=2)
+    speculator.start('session-1', MESSAGES)
+    time.sleep(0.05)
+    assert speculator.take('session-1', [{'role': 'user', 'content': 'Something else'}]) is None
+    assert speculator.stats['discarded'] == 1
+
+
+def test_unclaimed_speculations_expire_without_new_starts():
+    speculator = SpeculativeExecutor(lambda messages, session_id=None: 'answer', max_concurrency=2,
+                                     ttl_seconds=0.05)
+    speculator.start('idle-session', MESSAGES)
+    time.sleep(1.2)  # the sweep runs at least once a second
+    assert speculator.metrics()['pending'] == 0
+    assert speculator.stats['expired'] == 1
+
+
+def test_governor_can_evict_speculations():
+    speculator = SpeculativeExecutor(lambda messages, session_id=None: 'x' * 10000, max_concurrency=2)
+    speculator.start('session-1', MESSAGES)
+    speculator.start('session-2', MESSAGES)
+    time.sleep(0.05)
+    assert speculator.memory_size() > 10000
+    assert speculator.evict_idle(1, 0) > 0
+    assert speculator.metrics()['pending'] == 1
+
+
+def _slow_query(release):
+    calls = []
+
+    def query(messages, session_id=None):
+        calls.append(session_id)
+        release.wait(5)
+        return 'fresh answer'
+
+    return query, calls
+
+
+def test_slow_speculation_serves_fallback_within_timeout():
+    release = threading.Event()
+    query, calls = _slow_query(release)
+    speculator = SpeculativeExecutor(query, max_concurrency=2)
+    speculator.start('session-1', MESSAGES)
+    start = time.monotonic()
+    answer = speculator.take('session-1', MESSAGES, timeout=0.05, on_timeout=lambda: 'saved answer')
+    assert answer == 'saved answer'
+    assert time.monotonic() - start < 1
+    release.set()
+    assert calls == ['session-1']
+
+
+def test_slow_speculation_without_fallback_waits_for_the_same_call():
+    release = threading.Event()
+    query, calls = _slow_query(release)
+    speculator = SpeculativeExecutor(query, max_concurrency=2)
+    speculator.start('session-1', MESSAGES)
+    threading.Timer(0.1, release.set).start()
+    assert speculator.take('session-1', MESSAGES, timeout=0.02, on_timeout=lambda: None) == 'fresh answer'
+    assert calls == ['session-1']
+    assert speculator.stats['used'] == 1
+
+
+def test_overlapping_starts_for_a_session_submit_once():
+    release = threading.Event()
+    query, calls = _slow_query(release)
+    speculator = SpeculativeExecutor(query, max_concurrency=8)
+    barrier = threading.Barrier(4)
+
+    def click():
+        barrier.wait()
+        speculator.start('session-1', MESSAGES)
+
+    threads = [threading.Thread(target=click) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    assert speculator.take('session-1', MESSAGES, timeout=5) == 'fresh answer'
+    assert calls == ['session-1']
+    assert speculator.stats['started'] == 1
+
+
+def test_expiry_is_counted_once():
+    speculator = SpeculativeExecutor(lambda messages, session_id=None: 'answer', max_concurrency=2,
+                                     ttl_seconds=0.01)
+    speculator.start('session-1', MESSAGES)
+    time.sleep(0.05)
+    with speculator._lock:
+        speculator._expire()
+    assert speculator.stats['expired'] == 1
+    assert speculator.stats['discarded'] == 0
@@ -0,0 +1,41 @@
+import pytest
+
+from token_policy import TokenDecision, TokenPolicy, classify
+
+
+def _ask(question):
+    return [{'role': 'user', 'content': question}]
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('How do I change my email address?', 'account_admin'),
+    ('Can I change my password?', 'account_admin'),
+    ('Why has my score changed?', 'explanation'),
+    ('My score changed overnight', 'explanation'),
+    ('Explain it step by step', 'long_form'),
+    ('What is a credit report?', 'factual'),
+])
+def test_classify(question, expected):
+    assert classify(_ask(question)) == expected
+
+
+@pytest.fixture
+def policy():
+    return TokenPolicy(max_tokens=2048, min_tokens=256, headroom=1.5, enabled=True, class_endpoints={})
+
+
+def test_finish_reason_length_is_truncated(policy):
+    decision = TokenDecision('factual', 512)
+    assert policy.observe(decision, 'short', completion_tokens=100, finish_reason='length')
+    assert policy.metrics()['classes']['factual']['truncated'] == 1
+
+
+def test_finish_reason_stop_is_not_truncated_even_near_budget(policy):
+    decision = TokenDecision('factual', 512)
+    assert not policy.observe(decision, 'x' * 4000, completion_tokens=510, finish_reason='stop')
+
+
+def test_length_fallback_without_finish_reason(policy):
+    decision = TokenDecision('factual', 512)
+    assert policy.observe(decision, 'x', completion_tokens=500)
+    assert not policy.observe(decision, 'x', completion_tokens=100)
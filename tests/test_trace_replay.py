@@ -0,0 +1,42 @@
+import pytest
+
+from trace_replay import ReplayClient, redact, request_fingerprint
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("My name is John Smith", "My name is [NAME]"),
+    ("Hi, I am Sarah", "Hi, I am [NAME]"),
+    ("Hello, this is Priya Patel calling about my report", "Hello, this is [NAME] calling about my report"),
+    ("I'm Tom and my score dropped", "I'm [NAME] and my score dropped"),
+    ("THIS IS Alex", "THIS IS [NAME]"),
+])
+def test_redacts_self_introduced_names(text, expected):
+    assert redact(text) == expected
+
+
+def test_keeps_phrases_without_a_name():
+    assert redact("I am worried my score is wrong") == "I am worried my score is wrong"
+
+
+def test_redacts_nested_values():
+    request = {'input': [{'role': 'user', 'content': "my name is Jo, email jo@example.com"}]}
+    assert redact(request)['input'][0]['content'] == "my name is [NAME], email [EMAIL]"
+
+
+def test_fingerprint_ignores_max_tokens():
+    messages = [{'role': 'user', 'content': 'How do I check my score?'}]
+    assert (request_fingerprint({'input': messages, 'max_tokens': 256})
+            == request_fingerprint({'input': messages, 'max_tokens': 2048})
+            == request_fingerprint({'messages': messages}))
+
+
+def test_replay_matches_on_messages():
+    messages = [{'role': 'user', 'content': 'Why did my score change?'}]
+    records = [
+        {'request': {'input': [{'role': 'user', 'content': 'other'}], 'max_tokens': 100},
+         'response': 'first', 'latency_ms': 0},
+        {'request': {'input': messages, 'max_tokens': 100}, 'response': 'second', 'latency_ms': 0},
+    ]
+    client = ReplayClient(records, speed=0)
+    assert client.predict('endpoint', {'input': messages, 'max_tokens': 900}) == 'second'
+    assert client.unmatched == 0
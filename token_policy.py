@@ -0,0 +1,217 @@
+"""
+Adaptive max_tokens selection for agent calls
+
+Short factual questions ("how do I update my personal details?") do not need
+the generation budget of a score-change explanation, and a smaller max_tokens
+lets the serving endpoint finish (and schedule) requests sooner. The policy:
+
+1. classifies the latest user message with a few cheap regular expressions
+2. looks up the answer lengths observed for that class (learned online from
+   the completion token counts endpoints report, or estimated from the text)
+   and picks a budget covering the 95th percentile with headroom; until
+   enough answers have been seen a fixed per-class default is used
+3. gives long-form requests ("explain in detail", "step by step", "go on")
+   the full budget
+
+An answer the endpoint reports as stopped by the budget (finish_reason
+"length") is counted as truncated; endpoints that do not report a finish
+reason fall back to comparing the answer's length with the budget. Truncated answers
+are fed back as longer-than-budget observations so the class budget grows,
+and the caller can retry them once with the full budget. Per-class request
+counts, budgets and truncation rates are exposed on /metrics.
+
+Classes can also be pinned to an endpoint with TOKEN_POLICY_CLASS_ENDPOINTS,
+e.g. "long_form:ka-large,account_admin:ka-small".
+"""
+
+import math
+import os
+import re
+import statistics
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+# Checked in order; the first match wins
+CLASS_PATTERNS = [
+    ('long_form', re.compile(
+        r"\b(in (more |full )?detail|step[- ]by[- ]step|full breakdown|explain everything|"
+        r"comprehensive|elaborate|tell me more|go on|continue|compare)\b")),
+    ('explanation', re.compile(
+        r"\b(why|explain|what (does|do|is) .* mean|reason|affect|impact|dropp?ed|went down|went up|changed)\b")),
+    ('account_admin', re.compile(
+        r"\b(update|change|reset|close|delete|cancel|log ?in|sign ?in|password|email address|"
+        r"personal details|address|account)\b")),
+    ('factual', re.compile(r"^(what|how|where|when|can|do|does|is|are|who)\b")),
+]
+
+DEFAULT_BUDGETS = {
+    'account_admin': 384,
+    'factual': 512,
+    'general': 768,
+    'explanation': 1024,
+    'long_form': 2048,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+def classify(messages: list[dict]) -> str:
+    """Question class of the latest user message."""
+    question = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    question = question.strip().lower()
+    for name, pattern in CLASS_PATTERNS:
+        if pattern.search(question):
+            return name
+    return 'general'
+
+
+def _parse_class_endpoints(spec: str) -> dict:
+    mapping = {}
+    for part in (spec or '').split(','):
+        if ':' in part:
+            question_class, endpoint = part.split(':', 1)
+            mapping[question_class.strip()] = endpoint.strip()
+    return mapping
+
+
+@dataclass
+class TokenDecision:
+    """The budget (and optional endpoint) chosen for one request"""
+    question_class: str
+    max_tokens: int
+    endpoint: Optional[str] = None
+
+
+class _ClassStats:
+    __slots__ = ('observed', 'requests', 'truncated', 'retried', 'budget_total')
+
+    def __init__(self, window: int):
+        self.observed = deque(maxlen=window)
+        self.requests = 0
+        self.truncated = 0
+        self.retried = 0
+        self.budget_total = 0
+
+
+class TokenPolicy:
+    """Picks max_tokens per question class from observed answer lengths"""
+
+    def __init__(self, max_tokens: int = None, min_tokens: int = None, headroom: float = None,
+                 min_samples: int = 20, window: int = 500, truncation_ratio: float = 0.9,
+                 class_endpoints: dict = None, enabled: bool = None):
+        """
+        Defaults come from the TOKEN_POLICY_* environment variables (see README).
+
+        Args:
+            max_tokens: Full budget, used for long-form requests and retries
+            min_tokens: Smallest budget ever chosen
+            headroom: Multiplier applied to the observed 95th percentile answer length
+            min_samples: Answers needed in a class before its learned budget is used
+            window: Recent answers remembered per class
+            truncation_ratio: Answers using this fraction of their budget count as truncated
+            class_endpoints: {question_class: endpoint_name} routing preferences
+            enabled: When False every request gets max_tokens (answers are still measured)
+        """
+        self.max_tokens = max_tokens or int(os.getenv('TOKEN_POLICY_MAX_TOKENS', '2048'))
+        self.min_tokens = min_tokens or int(os.getenv('TOKEN_POLICY_MIN_TOKENS', '256'))
+        self.headroom = headroom or float(os.getenv('TOKEN_POLICY_HEADROOM', '1.5'))
+        self.min_samples = min_samples
+        self.window = window
+        self.truncation_ratio = truncation_ratio
+        self.class_endpoints = (class_endpoints if class_endpoints is not None
+                                else _parse_class_endpoints(os.getenv('TOKEN_POLICY_CLASS_ENDPOINTS', '')))
+        self.enabled = (enabled if enabled is not None
+                        else os.getenv('TOKEN_POLICY_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, question_class: str) -> _ClassStats:
+        """Get or create a class's stats. Caller holds the lock."""
+        stats = self._classes.get(question_class)
+        if stats is None:
+            stats = self._classes[question_class] = _ClassStats(self.window)
+        return stats
+
+    def _budget(self, question_class: str, stats: _ClassStats) -> int:
+        """Current budget for a class. Caller holds the lock."""
+        if not self.enabled or question_class == 'long_form':
+            return self.max_tokens
+        if len(stats.observed) < self.min_samples:
+            budget = DEFAULT_BUDGETS.get(question_class, DEFAULT_BUDGETS['general'])
+        else:
+            p95 = statistics.quantiles(stats.observed, n=20)[18]
+            budget = p95 * self.headroom
+        # Round up to a multiple of 64 to keep budgets stable between requests
+        return int(min(self.max_tokens, max(self.min_tokens, math.ceil(budget / 64) * 64)))
+
+    def decide(self, messages: list[dict], long_form: bool = False) -> TokenDecision:
+        """
+        Choose max_tokens and an optional preferred endpoint for a conversation.
+
+        Args:
+            messages: Conversation sent to the agent
+            long_form: Force the full budget regardless of the question class
+        """
+        question_class = 'long_form' if long_form else classify(messages)
+        with self._lock:
+            stats = self._stats(question_class)
+            budget = self._budget(question_class, stats)
+            stats.requests += 1
+            stats.budget_total += budget
+        return TokenDecision(question_class, budget, self.class_endpoints.get(question_class))
+
+    def observe(self, decision: TokenDecision, answer: str, retry: bool = False,
+                completion_tokens: Optional[int] = None, finish_reason: Optional[str] = None) -> bool:
+        """
+        Learn from an answer's length.
+
+        Args:
+            decision: The decision the request was made with
+            answer: Answer text returned by the agent
+            retry: True when this answer came from a truncation retry
+            completion_tokens: Token count reported by the endpoint (estimated from answer if None)
+            finish_reason: Why generation stopped, as reported by the endpoint ("length"
+                means the budget ran out); if None, truncation is judged from the length
+
+        Returns:
+            True if the answer was truncated (it filled its budget)
+        """
+        tokens = completion_tokens if completion_tokens is not None else estimate_tokens(answer)
+        if finish_reason is not None:
+            truncated = finish_reason == 'length'
+        else:
+            truncated = tokens >= decision.max_tokens * self.truncation_ratio
+        with self._lock:
+            stats = self._stats(decision.question_class)
+            if retry:
+                stats.retried += 1
+            if truncated:
+                stats.truncated += 1
+                # The real length is unknown but longer than the budget - bias the class upwards
+                tokens = decision.max_tokens * 2
+            stats.observed.append(tokens)
+        return truncated
+
+    def metrics(self) -> dict:
+        """Per-class budgets, answer lengths and truncation rates for /metrics"""
+        with self._lock:
+            classes = {}
+            for question_class, stats in self._classes.items():
+                observed = sorted(stats.observed)
+                classes[question_class] = {
+                    'requests': stats.requests,
+                    'budget': self._budget(question_class, stats),
+                    'mean_budget': round(stats.budget_total / stats.requests) if stats.requests else None,
+                    'answers_observed': len(observed),
+                    'median_answer_tokens': observed[len(observed) // 2] if observed else None,
+                    'truncated': stats.truncated,
+                    'truncation_rate': round(stats.truncated / len(observed), 4) if observed else 0.0,
+                    'retried': stats.retried,
+                    'endpoint': self.class_endpoints.get(question_class),
+                }
+            return {'enabled': self.enabled, 'max_tokens': self.max_tokens, 'classes': classes}
@@ -0,0 +1,302 @@
+"""
+Record-and-replay traces for offline performance regression testing
+
+Recording: set TRACE_RECORD_PATH (e.g. traces/agent.jsonl.gz) and every
+successful _query_endpoint call appends one gzip-compressed JSON line with
+the request payload, the raw endpoint response and the upstream latency.
+Emails, phone numbers, long digit runs (card/account numbers), postcodes,
+dates and self-introduced names are redacted before anything is written.
+TRACE_SAMPLE_RATE records only a fraction of calls.
+
+Replay: feed a trace through the real response parsing, response cache,
+chat windowing and rendering code with the upstream stubbed out by the
+recorded responses. Recorded latencies are honoured, compressed or skipped
+(--speed), and the per-stage timings can be saved as a baseline and
+compared against later runs:
+
+    python trace_replay.py traces/agent.jsonl.gz --speed 0 --save-baseline baseline.json
+    python trace_replay.py traces/agent.jsonl.gz --speed 0 --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from typing import Optional
+
+_REDACTIONS = [
+    (re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), '[EMAIL]'),
+    (re.compile(r'(?:\+44\s?|\b0)(?:\d[\s-]?){9,10}\b'), '[PHONE]'),
+    (re.compile(r'\b(?:\d[ -]?){8,19}\b'), '[NUMBER]'),
+    (re.compile(r'\b[A-Z]{1,2}\d[A-Z\d]?\s*\d[A-Z]{2}\b', re.IGNORECASE), '[POSTCODE]'),
+    (re.compile(r'\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b'), '[DATE]'),
+    # The phrase matches in any case; the name itself must still be capitalised
+    (re.compile(r"\b((?i:my name is|i am|i'm|this is))\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)?"), r'\1 [NAME]'),
+]
+
+
+def redact(value):
+    """Recursively redact PII from strings inside a JSON-like value."""
+    if isinstance(value, str):
+        for pattern, replacement in _REDACTIONS:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+def _request_messages(request) -> list[dict]:
+    """Recover the chat messages from a recorded request payload."""
+    if isinstance(request, list):
+        return request
+    return request.get('input') or request.get('messages') or []
+
+
+def request_fingerprint(inputs) -> str:
+    """
+    Stable hash of the (redacted) messages of a request, used to match replayed requests.
+
+    Other request fields such as max_tokens are left out, since they are chosen
+    per request (see token_policy.py) and would rarely match between runs.
+    """
+    messages = _request_messages(inputs)
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class TraceRecorder:
+    """Appends redacted request/response/timing records to a gzip JSONL trace"""
+
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, endpoint_name: str, request_inputs, response, latency_seconds: float) -> None:
+        """Write one trace record; failures are logged and never reach the caller."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            request = redact(request_inputs)
+            record = {
+                'ts': round(time.time(), 3),
+                'endpoint': endpoint_name,
+                'request': request,
+                'request_fp': request_fingerprint(request),
+                'response': redact(response),
+                'latency_ms': round(latency_seconds * 1000, 1),
+            }
+            line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+            with self._lock:
+                # Each append is a separate gzip member; gzip readers concatenate them
+                with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                    f.write(line)
+        except Exception as e:
+            print(f"⚠️  Could not record trace: {e}")
+
+
+_recorder = None
+_recorder_checked = False
+
+
+def get_recorder() -> Optional[TraceRecorder]:
+    """The process-wide recorder if TRACE_RECORD_PATH is set, else None."""
+    global _recorder, _recorder_checked
+    if not _recorder_checked:
+        path = os.getenv('TRACE_RECORD_PATH')
+        if path:
+            _recorder = TraceRecorder(path, float(os.getenv('TRACE_SAMPLE_RATE', '1.0')))
+            print(f"🎙️ Recording endpoint traces to {path}")
+        _recorder_checked = True
+    return _recorder
+
+
+def load_trace(path: str) -> list[dict]:
+    """Read every record from a (gzip or plain) JSONL trace."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayClient:
+    """Stands in for the serving client, answering from recorded responses"""
+
+    def __init__(self, records: list[dict], speed: float = 1.0):
+        """
+        Args:
+            records: Trace records
+            speed: Fraction of the recorded latency to sleep (1 = real time, 0 = none)
+        """
+        self.speed = speed
+        self._by_fingerprint = {}
+        for record in records:
+            # Recomputed rather than read from request_fp, so older traces match too
+            self._by_fingerprint.setdefault(request_fingerprint(record['request']), []).append(record)
+        self._sequence = list(records)
+        self._position = 0
+        self.unmatched = 0
+
+    def predict(self, endpoint, inputs):
+        candidates = self._by_fingerprint.get(request_fingerprint(redact(inputs)))
+        if candidates:
+            record = candidates.pop(0) if len(candidates) > 1 else candidates[0]
+        else:
+            # Fall back to trace order (e.g. the request shape changed)
+            self.unmatched += 1
+            record = self._sequence[self._position % len(self._sequence)]
+            self._position += 1
+        if self.speed > 0:
+            time.sleep(record['latency_ms'] / 1000 * self.speed)
+        return record['response']
+
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3),
+    }
+
+
+def replay(records: list[dict], speed: float = 0.0, cold_render: bool = False) -> dict:
+    """
+    Run recorded traffic through parsing, caching, windowing and rendering.
+
+    Args:
+        records: Trace records (load_trace())
+        speed: Fraction of recorded upstream latency to honour
+        cold_render: Clear the rendered-fragment and message caches before every turn
+
+    Returns:
+        Per-stage latency summaries in milliseconds
+    """
+    import dash
+
+    import ClearScoreChatbot as chatbot_module
+    import chat_message
+    from model_serving_utils import EndpointRouter, _parse_endpoint_response, query_endpoint
+    from response_cache import ResponseCache
+
+    client = ReplayClient(records, speed=speed)
+    app = dash.Dash(__name__)
+    chatbot = chatbot_module.ClearScoreChatbot(app, endpoint_name='replay')
+    # A private cache, so answers left in the host-wide shared cache do not skew the run
+    chatbot.response_cache = ResponseCache()
+    endpoints = sorted({record['endpoint'] for record in records})
+    chatbot.router = EndpointRouter(
+        [(name, 1.0) for name in endpoints],
+        query_fn=lambda name, messages, max_tokens: query_endpoint(name, messages, max_tokens, client=client),
+    )
+
+    timings = {'parse': [], 'call': [], 'window_render': [], 'turn': []}
+    errors = 0
+    # The request path logs verbosely; keep it out of the measurements
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record in records:
+            messages = _request_messages(record['request'])
+            if not messages:
+                continue
+
+            start = time.perf_counter()
+            _parse_endpoint_response(record['response'])
+            timings['parse'].append((time.perf_counter() - start) * 1000)
+
+            turn_start = time.perf_counter()
+            try:
+                answer = chatbot._call_model_endpoint(messages)
+            except Exception:
+                errors += 1
+                continue
+            call_done = time.perf_counter()
+
+            if cold_render:
+                chatbot_module._message_fragment.cache_clear()
+                chat_message.clear_intern_table()
+            history = list(messages) + [{'role': 'assistant', 'content': str(answer)}]
+            render_start = time.perf_counter()
+            chatbot._render_window(history)
+            render_done = time.perf_counter()
+
+            timings['call'].append((call_done - turn_start) * 1000)
+            timings['window_render'].append((render_done - render_start) * 1000)
+            timings['turn'].append((render_done - turn_start) * 1000)
+
+    return {
+        'records': len(records),
+        'errors': errors,
+        'unmatched_requests': client.unmatched,
+        'speed': speed,
+        'cache': chatbot.response_cache.stats(),
+        'stages': {stage: _summary(samples) for stage, samples in timings.items()},
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, noise_floor_ms: float = 0.05) -> list[str]:
+    """Return a description of every stage percentile that regressed beyond tolerance."""
+    regressions = []
+    for stage, summary in result['stages'].items():
+        base = baseline.get('stages', {}).get(stage, {})
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if metric not in summary or metric not in base:
+                continue
+            new, old = summary[metric], base[metric]
+            if new > old * (1 + tolerance) and new - old > noise_floor_ms:
+                regressions.append(f"{stage}.{metric}: {old:.3f} -> {new:.3f} ms (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded endpoint traces through the chatbot pipeline')
+    parser.add_argument('trace', help='Trace file written with TRACE_RECORD_PATH')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='Fraction of recorded upstream latency to honour (1 = real time, 0 = none)')
+    parser.add_argument('--cold-render', action='store_true', help='Disable the rendered-fragment cache')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a baseline JSON file; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative slowdown (default 15%%)')
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    print(f"▶️ Replaying {len(records)} record(s) from {args.trace} at speed {args.speed}")
+    result = replay(records, speed=args.speed, cold_render=args.cold_render)
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Token, cost and latency accounting for agent calls
+
+Every answered agent call reports its usage (prompt and completion tokens,
+taken from the endpoint response or estimated when the response has none)
+and the time it took. UsageTracker accumulates these per browser session,
+per serving endpoint and per suggested prompt, and exposes the totals (and
+their cost, if per-token prices are configured) on /metrics.
+
+Each session also has soft and hard budgets, in tokens and in model time:
+
+- past the soft budget the chatbot sends a tighter context window
+  (see context_window.py), so each further turn costs less
+- past the hard budget the chatbot declines to continue the session
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from memory_budget import approx_size, sampled_size
+
+BUDGET_OK = 'ok'
+BUDGET_SOFT = 'soft'
+BUDGET_HARD = 'hard'
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class _Usage:
+    __slots__ = ('requests', 'prompt_tokens', 'completion_tokens', 'estimated', 'model_seconds', 'last_active')
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = 0
+        self.model_seconds = 0.0
+        self.last_active = time.time()
+
+    def add(self, usage: dict, latency: float) -> None:
+        self.requests += 1
+        self.prompt_tokens += usage.get('prompt_tokens', 0)
+        self.completion_tokens += usage.get('completion_tokens', 0)
+        self.estimated += 1 if usage.get('estimated') else 0
+        self.model_seconds += latency
+        self.last_active = time.time()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def snapshot(self, prompt_cost: float, completion_cost: float) -> dict:
+        result = {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'estimated_requests': self.estimated,
+            'model_seconds': round(self.model_seconds, 2),
+        }
+        if prompt_cost or completion_cost:
+            result['cost'] = round((self.prompt_tokens * prompt_cost + self.completion_tokens * completion_cost) / 1000, 6)
+        return result
+
+
+class UsageTracker:
+    """Accumulates usage per session, endpoint and suggested prompt, and enforces session budgets"""
+
+    def __init__(self, soft_tokens: float = None, hard_tokens: float = None,
+                 soft_seconds: float = None, hard_seconds: float = None,
+                 prompt_cost_per_1k: float = None, completion_cost_per_1k: float = None,
+                 max_sessions: int = 10000, top_sessions: int = 10):
+        """
+        Defaults come from the USAGE_* environment variables (see README); a budget of 0 is disabled.
+
+        Args:
+            soft_tokens: Session tokens after which the context window is tightened
+            hard_tokens: Session tokens after which the session is declined
+            soft_seconds: Session model time (seconds) after which the context window is tightened
+            hard_seconds: Session model time after which the session is declined
+            prompt_cost_per_1k: Price of 1,000 prompt tokens, for cost reporting
+            completion_cost_per_1k: Price of 1,000 completion tokens
+            max_sessions: Sessions tracked (least recently active are dropped)
+            top_sessions: Heaviest sessions listed on /metrics
+        """
+        self.soft_tokens = soft_tokens if soft_tokens is not None else _env_float('USAGE_SESSION_SOFT_TOKENS', 30000)
+        self.hard_tokens = hard_tokens if hard_tokens is not None else _env_float('USAGE_SESSION_HARD_TOKENS', 60000)
+        self.soft_seconds = soft_seconds if soft_seconds is not None else _env_float('USAGE_SESSION_SOFT_SECONDS', 0)
+        self.hard_seconds = hard_seconds if hard_seconds is not None else _env_float('USAGE_SESSION_HARD_SECONDS', 0)
+        self.prompt_cost = (prompt_cost_per_1k if prompt_cost_per_1k is not None
+                            else _env_float('USAGE_COST_PER_1K_PROMPT_TOKENS', 0))
+        self.completion_cost = (completion_cost_per_1k if completion_cost_per_1k is not None
+                                else _env_float('USAGE_COST_PER_1K_COMPLETION_TOKENS', 0))
+        self.max_sessions = max_sessions
+        self.top_sessions = top_sessions
+
+        self.total = _Usage()
+        self._sessions: "OrderedDict[str, _Usage]" = OrderedDict()
+        self._endpoints = {}
+        self._prompts = {}
+        self.declined = 0
+        self.compacted = 0
+        self._lock = threading.Lock()
+
+    def record(self, session_id: Optional[str], endpoint: Optional[str], usage: Optional[dict],
+               latency: float = 0.0, prompt: Optional[str] = None) -> None:
+        """
+        Account one agent call.
+
+        Args:
+            session_id: Browser session that asked (None for speculative or warm-up calls)
+            endpoint: Serving endpoint that answered
+            usage: {'prompt_tokens', 'completion_tokens', 'estimated'} from the response
+            latency: Time the call took (seconds)
+            prompt: Suggested prompt the conversation started from, if any
+        """
+        usage = usage or {}
+        with self._lock:
+            self.total.add(usage, latency)
+            if session_id:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    session = self._sessions[session_id] = _Usage()
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+                else:
+                    self._sessions.move_to_end(session_id)
+                session.add(usage, latency)
+            if endpoint:
+                self._endpoints.setdefault(endpoint, _Usage()).add(usage, latency)
+            if prompt:
+                self._prompts.setdefault(prompt, _Usage()).add(usage, latency)
+
+    @staticmethod
+    def _over(value: float, limit: float) -> bool:
+        return limit > 0 and value >= limit
+
+    def budget_state(self, session_id: Optional[str]) -> str:
+        """BUDGET_OK, BUDGET_SOFT or BUDGET_HARD for a session."""
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                return BUDGET_OK
+            if self._over(session.total_tokens, self.hard_tokens) or self._over(session.model_seconds, self.hard_seconds):
+                return BUDGET_HARD
+            if self._over(session.total_tokens, self.soft_tokens) or self._over(session.model_seconds, self.soft_seconds):
+                return BUDGET_SOFT
+            return BUDGET_OK
+
+    def memory_size(self) -> int:
+        """Approximate bytes of per-session state (see memory_budget)."""
+        with self._lock:
+            return sampled_size(iter(self._sessions.items()), count=len(self._sessions))
+
+    def evict_idle(self, target_bytes: int, idle_seconds: float) -> int:
+        """
+        Forget sessions idle for at least idle_seconds, least recently active first.
+
+        A forgotten session that comes back starts with a fresh budget.
+        """
+        cutoff = time.time() - idle_seconds
+        freed = 0
+        with self._lock:
+            while self._sessions and freed < target_bytes:
+                session_id, usage = next(iter(self._sessions.items()))
+                if usage.last_active > cutoff:
+                    break
+                del self._sessions[session_id]
+                freed += approx_size((session_id, usage))
+        return freed
+
+    def note_declined(self) -> None:
+        with self._lock:
+            self.declined += 1
+
+    def note_compacted(self) -> None:
+        with self._lock:
+            self.compacted += 1
+
+    def metrics(self) -> dict:
+        """Totals, per-endpoint and per-prompt usage and the heaviest sessions, for /metrics"""
+        costs = (self.prompt_cost, self.completion_cost)
+        with self._lock:
+            heaviest = sorted(self._sessions.items(), key=lambda item: item[1].total_tokens, reverse=True)
+            return {
+                'total': self.total.snapshot(*costs),
+                'endpoints': {name: usage.snapshot(*costs) for name, usage in self._endpoints.items()},
+                'suggested_prompts': {prompt: usage.snapshot(*costs) for prompt, usage in self._prompts.items()},
+                'sessions_tracked': len(self._sessions),
+                'sessions_over_soft_budget': sum(
+                    1 for usage in self._sessions.values()
+                    if self._over(usage.total_tokens, self.soft_tokens) or self._over(usage.model_seconds, self.soft_seconds)),
+                'top_sessions': {session_id[:8]: usage.snapshot(*costs)
+                                 for session_id, usage in heaviest[:self.top_sessions]},
+                'declined': self.declined,
+                'compacted': self.compacted,
+                'budgets': {
+                    'soft_tokens': self.soft_tokens, 'hard_tokens': self.hard_tokens,
+                    'soft_seconds': self.soft_seconds, 'hard_seconds': self.hard_seconds,
+                },
+            }
@@ -0,0 +1,142 @@
+"""
+Startup warm-up and readiness for the ClearScore chatbot
+
+After a deploy or scale-out the first users would otherwise pay for client
+creation, DNS/TLS, any serving-endpoint cold start and empty caches. When
+WARMUP_ENABLED is set, each worker runs a warm-up in the background at boot:
+
+1. create the shared serving client (connection pool, auth)
+2. send a tiny probe to every configured endpoint to wake it from scale-to-zero
+3. prefetch answers for the suggested prompts into the response cache
+
+Until the warm-up has finished (or WARMUP_TIMEOUT_SECONDS has passed) the
+worker reports not-ready on /ready, so the platform can hold traffic back.
+/healthz is a plain liveness check.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+
+from model_serving_utils import get_serving_client
+
+PROBE_MESSAGES = [{'role': 'user', 'content': 'Hi'}]
+
+
+class WarmupState:
+    """Progress of the warm-up, reported on /ready"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.stage = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.errors = []
+        self.prefetched = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'ready': self.ready.is_set(),
+            'stage': self.stage,
+            'started_at': self.started_at,
+            'duration_seconds': round((self.finished_at or time.time()) - self.started_at, 2)
+            if self.started_at else None,
+            'prefetched': self.prefetched,
+            'errors': self.errors[-10:],
+        }
+
+
+state = WarmupState()
+
+
+def _probe(chatbot, endpoint_name: str) -> None:
+    start = time.time()
+    try:
+        chatbot.router.query_fn(endpoint_name, PROBE_MESSAGES, 1)
+        print(f"   🔥 Endpoint {endpoint_name} awake ({time.time() - start:.1f}s)")
+    except Exception as e:
+        # A probe failing is not fatal - the endpoint may reject max_tokens=1
+        state.errors.append(f"probe {endpoint_name}: {str(e)[:200]}")
+        print(f"   ⚠️  Probe of {endpoint_name} failed after {time.time() - start:.1f}s: {str(e)[:100]}")
+
+
+def _prefetch(chatbot, prompt: str) -> None:
+    try:
+        chatbot._call_model_endpoint([{'role': 'user', 'content': prompt}])
+        state.prefetched += 1
+    except Exception as e:
+        state.errors.append(f"prefetch {prompt!r}: {str(e)[:200]}")
+
+
+def run_warmup(chatbot, prompts: list[str], concurrency: int = 3) -> None:
+    """
+    Warm up connections, endpoints and the response cache, then mark the worker ready.
+
+    Args:
+        chatbot: ClearScoreChatbot whose router and response cache are warmed
+        prompts: Questions whose answers are prefetched into the response cache
+        concurrency: Parallel calls used for probing and prefetching
+    """
+    state.started_at = time.time()
+    print("🔥 Warm-up started")
+    try:
+        state.stage = 'connecting'
+        get_serving_client()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='warmup') as pool:
+            state.stage = 'probing'
+            list(pool.map(lambda name: _probe(chatbot, name), chatbot.router.endpoint_names))
+
+            state.stage = 'prefetching'
+            list(pool.map(lambda prompt: _prefetch(chatbot, prompt), prompts))
+
+        state.stage = 'done'
+    except Exception as e:
+        state.stage = 'failed'
+        state.errors.append(str(e)[:200])
+        print(f"⚠️  Warm-up failed: {e}")
+    finally:
+        state.finished_at = time.time()
+        state.ready.set()
+        print(f"✅ Warm-up finished in {state.finished_at - state.started_at:.1f}s "
+              f"({state.prefetched}/{len(prompts)} answers prefetched)")
+
+
+def start(app, chatbot, prompts: list[str]) -> None:
+    """
+    Register /ready and /healthz and, if WARMUP_ENABLED, start warming up in the background.
+
+    Without WARMUP_ENABLED the worker is ready immediately.
+    """
+    register_routes(app)
+
+    if os.getenv('WARMUP_ENABLED', 'false').lower() not in ('1', 'true', 'yes'):
+        state.stage = 'disabled'
+        state.ready.set()
+        return
+
+    timeout = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '120'))
+    threading.Thread(target=run_warmup, args=(chatbot, prompts), name='warmup', daemon=True).start()
+
+    def _deadline():
+        # Never keep a worker out of rotation indefinitely
+        if not state.ready.wait(timeout):
+            print(f"⏰ Warm-up still running after {timeout:.0f}s, reporting ready anyway")
+            state.errors.append(f"timed out after {timeout:.0f}s")
+            state.ready.set()
+
+    threading.Thread(target=_deadline, name='warmup-deadline', daemon=True).start()
+
+
+def register_routes(app) -> None:
+    """Add GET /ready (503 until warm) and GET /healthz to a Dash app's Flask server."""
+    server = app.server
+
+    def ready():
+        return flask.jsonify(state.snapshot()), 200 if state.ready.is_set() else 503
+
+    server.add_url_rule('/ready', 'ready', ready)
+    server.add_url_rule('/healthz', 'healthz', lambda: flask.jsonify({'status': 'ok'}))